@@ -0,0 +1,363 @@
+import os
+import re
+import asyncio
+import logging
+import aiohttp
+import asyncpraw
+import asyncprawcore
+import settings
+import backoff
+import checkpoint
+import interface
+import lastfm
+import metrics
+import musicbrainz
+import post_record
+import rules
+import youtube
+
+
+log = logging.getLogger("bot")
+
+LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
+MUSICBRAINZ_API_URL = "https://musicbrainz.org/ws/2/"
+
+
+class RecordedActions:
+    # Stands in for both reddit and submission when calling interface rule_* functions
+    # Reports and messages are recorded so the engine can await them afterwards
+    # Every other attribute comes from the wrapped submission
+
+    def __init__(self, submission):
+        self.submission = submission
+        self.actions = []
+
+    def __getattr__(self, name):
+        return getattr(self.submission, name)
+
+    def __str__(self):
+        return str(self.submission)
+
+    def report(self, reason):
+        self.actions.append(("report", reason))
+
+    def redditor(self, name):
+        return RecordedRedditor(self.actions, name)
+
+
+class RecordedRedditor:
+
+    def __init__(self, actions, name):
+        self.actions = actions
+        self.name = name
+
+    def message(self, subject, message):
+        self.actions.append(("message", self.name, subject, message))
+
+
+class AsyncRateLimiter:
+    # Spaces requests at least 1/rate seconds apart
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_time = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            wait = self.next_time - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.next_time = loop.time() + self.interval
+
+
+def get_lucene_query(**fields):
+    # Same query musicbrainzngs builds for searches
+    parts = []
+    for key, value in fields.items():
+        value = re.sub(r'([+\-&|!(){}\[\]\^"~*?:\\/])', r'\\\1', value)
+        parts.append('%s:(%s)' % (key, value.lower()))
+    return ' '.join(parts)
+
+
+class AsyncEngine:
+    # asyncio runtime using asyncpraw and aiohttp
+    # Decisions come from the same rules as the sync engine,
+    # only reddit, last.fm and musicbrainz requests are awaited instead of blocking
+    # shards is a subreddit_shard.ShardSet, submissions are checked against the state of their subreddit
+    # Post store and checkpoint calls are sqlite reads and commits, they run in threads to keep the loop free
+
+    def __init__(self, reddit_kwargs, shards, concurrency=settings.ASYNC_CONCURRENCY, user_agent=None):
+        self.reddit_kwargs = reddit_kwargs
+        self.shards = shards
+        self.concurrency = concurrency
+        self.user_agent = user_agent if user_agent is not None else reddit_kwargs['user_agent']
+        self.musicbrainz_limiter = AsyncRateLimiter(settings.MUSICBRAINZ_RATE)
+        self.reddit = None
+        self.session = None
+        self.tasks = set()
+        # Ids of submissions being processed, catch-up and the stream can both yield the same submission
+        self.in_flight = set()
+
+    async def start(self):
+        self.reddit = asyncpraw.Reddit(**self.reddit_kwargs)
+        self.session = aiohttp.ClientSession(headers={'User-Agent': self.user_agent})
+
+    async def close(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.session.close()
+        await self.reddit.close()
+
+    def spawn(self, coroutine):
+        # Keep reference to background task until it finishes
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def perform(self, recorded):
+        # Run reports and messages recorded by interface rule_* functions
+        for action in recorded.actions:
+            if action[0] == "report":
+                await recorded.submission.report(action[1])
+            elif action[0] == "message":
+                redditor = await self.reddit.redditor(action[1])
+                await redditor.message(subject=action[2], message=action[3])
+        recorded.actions = []
+
+    async def search_lastfm(self, artist, song):
+        # Async version of lastfm.search_tracks sharing its cache
+        key = lastfm.get_cache_key(artist, song)
+        results = lastfm.track_search_cache.get(key)
+        if results is None:
+            params = {'method': 'track.search', 'artist': artist, 'track': song,
+                      'api_key': os.environ['LASTFM_KEY'], 'format': 'json'}
+            with metrics.bot_metrics.api_call("lastfm"):
+                async with self.session.get(LASTFM_API_URL, params=params) as r:
+                    r.raise_for_status()
+                    rJson = await r.json()
+            tracks = rJson['results']['trackmatches']['track']
+            results = ["{} - {}".format(track['artist'], track['name']) for track in tracks]
+            lastfm.track_search_cache.put(key, results)
+        return results
+
+    async def search_musicbrainz(self, artist, song):
+        # Async version of MusicBrainzService.search_recordings sharing its cache
+        service = musicbrainz.get_musicbrainz_service()
+        key = ("recording", musicbrainz.normalize(artist), musicbrainz.normalize(song))
+        result = service.results.get(key)
+        if result is None:
+            await self.musicbrainz_limiter.acquire()
+            params = {'query': get_lucene_query(artist=artist, recording=song), 'fmt': 'json'}
+            with metrics.bot_metrics.api_call("musicbrainz"):
+                async with self.session.get(MUSICBRAINZ_API_URL + "recording/", params=params) as r:
+                    r.raise_for_status()
+                    rJson = await r.json()
+            recordings = [{"title": recording.get("title"),
+                           "artist": "".join(credit["name"] + credit.get("joinphrase", "") for credit in recording.get("artist-credit", []))}
+                          for recording in rJson.get("recordings", [])]
+            result = {"recording-count": rJson.get("count", len(recordings)), "recording-list": recordings}
+            service.results.put(key, result)
+        return result
+
+    async def check_musicbrainz(self, submission, artist, song):
+        # Follow-up report like interface.check_musicbrainz_async, runs after the rule report
+        try:
+            mb_result = await self.search_musicbrainz(artist, song)
+            if mb_result['recording-count'] < 1:
+                recorded = RecordedActions(submission)
+                interface.report_musicbrainz(recorded, recorded)
+                await self.perform(recorded)
+        except Exception as e:
+            log.error("Exception in musicbrainz verification of \"{} - {}\": {}".format(artist, song, e), exc_info=True)
+
+    async def search(self, context, query_text, subreddit_name=settings.REDDIT_SUBREDDIT):
+        # Async version of interface.get_reddit_search_results
+        subreddit = await self.reddit.subreddit(subreddit_name)
+        try:
+            with metrics.bot_metrics.time("reddit_search:" + context), metrics.bot_metrics.api_call("reddit_search"):
+                return [interface.get_search_result(result) async for result in
+                        subreddit.search(context + ":" + query_text, sort='new', time_filter='year', limit=10)]
+        except asyncprawcore.exceptions.ServerError as e:
+            log.error("Exception in reddit search: %s", e, exc_info=True)
+            return None
+
+    async def searches(self, searches, subreddit_name=settings.REDDIT_SUBREDDIT):
+        # Async version of interface.get_reddit_searches
+        results = await asyncio.gather(*[self.search(context, query_text, subreddit_name)
+                                         for context, query_text in searches])
+        records = {}
+        return [None if search_results is None else [records.setdefault(record.id, record) for record in search_results]
+                for search_results in results]
+
+    async def get_removed_names(self, fullnames):
+        # Async version of interface.get_removed_names
+        with metrics.bot_metrics.api_call("reddit_info"):
+            return [submission.name async for submission in self.reddit.info(fullnames=list(fullnames))
+                    if interface.check_removed_fields(vars(submission))]
+
+    async def resolve(self, request):
+        # Awaited response to a rule request, see rules.resolve
+        if request[0] == "lastfm":
+            return await self.search_lastfm(request[1], request[2])
+        elif request[0] == "youtube":
+            # Resolver coalesces lookups made within its batch wait into one request
+            return await asyncio.get_running_loop().run_in_executor(None, youtube.get_video, request[1])
+        elif request[0] == "removed":
+            return await self.get_removed_names(request[1])
+        elif request[0] == "searches":
+            return await self.searches(request[1], request[2])
+        raise ValueError("Unknown rule request {}".format(request[0]))
+
+    async def run_rules(self, submission, posts_index=None):
+        # Same rules as rules.run_rules with awaited requests
+        evaluation = rules.evaluate(submission, posts_index, metrics.bot_metrics)
+        response = None
+        while True:
+            try:
+                request = evaluation.send(response)
+            except StopIteration as stop:
+                return stop.value
+            response = await self.resolve(request)
+
+    async def merge_crosspost_parent(self, submission):
+        # Async version of interface.merge_crosspost_parent sharing its cache
+        parentName = submission.crosspost_parent
+        embedded, media = interface.get_embedded_parent_media(submission)
+        if not embedded:
+            media = interface.crosspost_parent_cache.get(parentName, interface.CACHE_MISS)
+        if media is interface.CACHE_MISS:
+            with metrics.bot_metrics.api_call("reddit_info"):
+                parent = await self.reddit.submission(parentName[3:])
+            media = parent.media
+        interface.crosspost_parent_cache.put(parentName, media)
+        submission.media = media
+
+    async def process_submission(self, submission, shard):
+        # Same flow as interface.process_submission
+        record = post_record.get_post_record(submission)
+        if interface.check_archived(record) or not interface.check_age_days(record) or interface.check_reported(record):
+            return
+        recorded = RecordedActions(submission)
+        if interface.check_self(record):
+            log.info("Found new self Submission: {} in Subreddit: {}".format(record, record.subreddit))
+            context = await self.run_rules(record)
+            interface.perform_mod_actions(recorded, recorded, context.rules_violated)
+            await self.perform(recorded)
+            metrics.bot_metrics.observe_decision(record)
+            return
+        log.info("Found new link Submission: {} in Subreddit: {}".format(record, record.subreddit))
+        if interface.check_crosspost(submission):
+            log.info("Submission is crosspost; merging media information")
+            with metrics.bot_metrics.time("merge_crosspost_parent"):
+                await self.merge_crosspost_parent(submission)
+            record.media = submission.media
+        if not interface.check_embed(record):
+            log.info("Link Submission: {} has no embedded media, will skip".format(record))
+            return
+        shard.posts_index.purge()
+        context = await self.run_rules(record, shard.posts_index)
+        interface.perform_mod_actions(recorded, recorded, context.rules_violated)
+        await self.perform(recorded)
+        metrics.bot_metrics.observe_decision(record)
+        if settings.MUSICBRAINZ_CHECK and context.verify_song():
+            self.spawn(self.check_musicbrainz(submission, record.artist, record.song))
+        # Already indexed by the repost_index rule, so a task checking the same song meanwhile sees it
+        shard.posts_index.add(record)
+        await asyncio.to_thread(shard.store.add, record)
+        for submission_id in context.removed_ids:
+            await asyncio.to_thread(shard.store.set_removed, submission_id)
+        log.info("Checks complete for submission: {}".format(record))
+
+    async def process_bounded(self, semaphore, submission):
+        claimed = False
+        try:
+            shard = self.shards.get(submission)
+            if shard is None:
+                log.info("Submission {} is not from a moderated subreddit, will skip".format(submission))
+                return
+            # Claimed before the first await, a second task for the same id skips it instead of racing
+            if submission.id in self.in_flight:
+                return
+            self.in_flight.add(submission.id)
+            claimed = True
+            if await asyncio.to_thread(shard.stream_checkpoint.is_processed, submission):
+                return
+            await self.process_submission(submission, shard)
+            await asyncio.to_thread(shard.stream_checkpoint.mark_processed, submission)
+        except Exception as e:
+            log.error("Exception in processing submission {}: {}".format(submission, e), exc_info=True)
+        finally:
+            if claimed:
+                self.in_flight.discard(submission.id)
+            semaphore.release()
+
+    async def get_missed_submissions(self, shard):
+        # Async version of checkpoint.get_missed_submissions
+        cursor = await asyncio.to_thread(shard.stream_checkpoint.get_cursor)
+        if cursor is None:
+            return []
+        fullname, created_utc = cursor
+        subreddit = await self.reddit.subreddit(shard.name)
+        missed = []
+        while True:
+            page = [submission async for submission in subreddit.new(limit=checkpoint.PAGE_SIZE, params={"before": fullname})]
+            if not page:
+                break
+            missed.extend(reversed(page))
+            fullname = page[0].name
+            if len(page) < checkpoint.PAGE_SIZE:
+                break
+        if not missed:
+            async for submission in subreddit.new(limit=None):
+                if submission.created_utc <= created_utc:
+                    break
+                missed.append(submission)
+            missed.reverse()
+        log.info("Resuming {} from checkpoint {} with {} missed submissions".format(shard.name, cursor[0], len(missed)))
+        return missed
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        stream_backoff = backoff.Backoff()
+        while True:
+            try:
+                missed = []
+                for shard in self.shards:
+                    missed.extend(await self.get_missed_submissions(shard))
+                missed.sort(key=lambda submission: submission.created_utc)
+                for submission in missed:
+                    await semaphore.acquire()
+                    self.spawn(self.process_bounded(semaphore, submission))
+                log.info("Reading stream of submissions for subreddits %s", self.shards.get_stream_name())
+                subreddit = await self.reddit.subreddit(self.shards.get_stream_name())
+                async for submission in subreddit.stream.submissions():
+                    stream_backoff.reset()
+                    # Waits here when concurrency limit is reached
+                    await semaphore.acquire()
+                    self.spawn(self.process_bounded(semaphore, submission))
+            except Exception as e:
+                log.error("Exception in submission stream: %s", e, exc_info=True)
+                metrics.bot_metrics.increment("api_errors_total", [("api", "reddit_stream")])
+                # Only the first exception of a failure streak alerts the admin
+                if stream_backoff.attempt == 0:
+                    try:
+                        log.info("Alerting admin")
+                        redditor = await self.reddit.redditor(settings.USER_TO_MESSAGE)
+                        await redditor.message(subject="ProgMetalBot", message="Bot had an exception {}, help!".format(e))
+                    except Exception as e:
+                        log.error("Exception in messaging admin: %s", e, exc_info=True)
+            delay = stream_backoff.next_delay()
+            log.info("sleep for %.1f s", delay)
+            await asyncio.sleep(delay)
+
+
+async def run_bot(reddit_kwargs, shards, user_agent=None):
+    engine = AsyncEngine(reddit_kwargs, shards, user_agent=user_agent)
+    await engine.start()
+    try:
+        await engine.run()
+    finally:
+        await engine.close()
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import argparse
+import collections
+import concurrent.futures
+import settings
+import interface
+import minhash
+import post_record
+import post_store
+import replay
+import repost_index
+import rules
+import timing
+
+
+log = logging.getLogger("bot")
+
+# Historical audit of the repost window, nothing is sent to reddit and no network requests are made
+# "python audit.py submissions.jsonl" audits recorded submissions (replay.py record format)
+# "python audit.py posts.db" audits the post store, which only has the fields for title format and repost rules
+# Worker processes build post records, run the rules checked one post at a time and hash titles for the
+# similar title index, then repost_index runs over all posts in order with the precomputed hashes
+
+# Local rules, network rules (title_match, repost_search) are never run
+# repost_index asks whether matching posts were removed since, the audit answers with the stored removed state
+JSONL_RULES = ("music_domain", "album_stream", "title_format", "self_promotion", "repost_index")
+STORE_RULES = ("title_format", "repost_index")
+
+# Posts of the audit, set in each worker process by init_worker
+audit_posts = []
+audit_rules = ()
+audit_embeds = True
+
+
+class RuleRecorder(timing.NullTimer):
+    # Timer that keeps the names of rules that added a violation
+
+    def __init__(self):
+        self.rule_names = []
+
+    def count(self, name, label):
+        if name == "rule_violations_total":
+            self.rule_names.append(label)
+
+
+def load_posts(location):
+    # Returns posts ordered oldest -> newest, names of the rules their fields support
+    # and whether posts have embedded media to check like process_submission
+    if location.endswith(".db"):
+        store = post_store.PostStore(location)
+        try:
+            return store.get_posts(), STORE_RULES, False
+        finally:
+            store.close()
+    posts = [replay.ReplaySubmission(record) for record in replay.load_records(location)]
+    names = {submission.name: submission for submission in posts}
+    for submission in posts:
+        if interface.check_crosspost(submission):
+            # Parent embedded in the recorded line or recorded itself, the audit does not fetch from reddit
+            embedded, media = interface.get_embedded_parent_media(submission)
+            if embedded:
+                submission.media = media
+            elif submission.crosspost_parent in names:
+                submission.media = names[submission.crosspost_parent].media
+    posts.sort(key=lambda submission: submission.created_utc)
+    return posts, JSONL_RULES, True
+
+
+def get_window(posts, days):
+    # Returns posts of the last days before the newest post
+    if not posts or days is None:
+        return posts
+    earliest_time = posts[-1].created_utc - 86400 * days
+    times = [submission.created_utc for submission in posts]
+    return posts[bisect.bisect_left(times, earliest_time):]
+
+
+def get_spans(count, span_size):
+    return [(start, min(start + span_size, count)) for start in range(0, count, span_size)]
+
+
+def init_worker(posts, rule_names, embeds):
+    global audit_posts, audit_rules, audit_embeds
+    audit_posts = posts
+    audit_rules = rule_names
+    audit_embeds = embeds
+
+
+def check_skipped(record):
+    # process_submission skips link posts without embedded media
+    return audit_embeds and not interface.check_self(record) and not interface.check_embed(record)
+
+
+def get_violations(record, recorder, context):
+    return [{"id": record.id, "shortlink": record.shortlink, "created_utc": record.created_utc, "title": record.title,
+             "rule": rule_name, "reason": violation.reason}
+            for rule_name, violation in zip(recorder.rule_names, context.rules_violated)]
+
+
+def evaluate_local(record, posts_index, rule_names):
+    # Returns [RuleContext, violation dicts], audited rules make no network requests
+    recorder = RuleRecorder()
+    evaluation = rules.evaluate(record, posts_index, recorder, rule_names)
+    response = None
+    while True:
+        try:
+            request = evaluation.send(response)
+        except StopIteration as stop:
+            return [stop.value, get_violations(record, recorder, stop.value)]
+        if request[0] != "removed":
+            raise RuntimeError("Audit rule made a network request {}".format(request[0]))
+        # Index already skips posts stored as removed
+        response = []
+
+
+def prepare_span(span):
+    # Check posts[start:end] with every rule except repost_index
+    # Returns list of [stored record, stopped, violation dicts] of checked posts
+    # and dict of title key -> MinHash entry for the similar title index
+    lsh = minhash.MinHashLSH(cache_size=0)
+    rule_names = [rule_name for rule_name in audit_rules if rule_name != "repost_index"]
+    results = []
+    entries = {}
+    for submission in audit_posts[span[0]:span[1]]:
+        record = post_record.get_post_record(submission)
+        if check_skipped(record):
+            continue
+        context, violations = evaluate_local(record, None, rule_names)
+        results.append([record.get_stored(), context.stopped, violations])
+        if record.title_key is not None and record.title_key not in entries:
+            entries[record.title_key] = lsh.get_entry(record.title_key)
+    return [results, entries]
+
+
+def check_reposts(results, entries, max_days):
+    # Run repost_index over prepared posts ordered oldest -> newest, adds repost violations to results
+    posts_index = repost_index.RepostIndex(max_days=max_days)
+    posts_index.similar_titles.preload(entries)
+    for result in results:
+        record, stopped = result[0], result[1]
+        posts_index.purge(record.created_utc)
+        if not stopped:
+            result[2].extend(evaluate_local(record, posts_index, ["repost_index"])[1])
+        if not interface.check_self(record):
+            posts_index.add(record)
+
+
+def run_audit(posts, rule_names, embeds=True, workers=settings.AUDIT_WORKERS, span_size=None,
+              max_days=settings.MAX_REMEMBER_LIMIT):
+    # Returns [checked count, violations ordered oldest -> newest]
+    # workers=0 checks in this process
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if span_size is None:
+        # A few spans per worker so a slow span does not hold up the pool
+        span_size = max(1, -(-len(posts) // max(1, 4 * workers)))
+    spans = get_spans(len(posts), span_size)
+    if workers == 0:
+        init_worker(posts, rule_names, embeds)
+        prepared = [prepare_span(span) for span in spans]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                    initargs=(posts, rule_names, embeds)) as executor:
+            prepared = list(executor.map(prepare_span, spans))
+    results = [result for span_results, span_entries in prepared for result in span_results]
+    if "repost_index" in rule_names:
+        entries = {}
+        for span_results, span_entries in prepared:
+            entries.update(span_entries)
+        check_reposts(results, entries, max_days)
+    violations = [violation for result in results for violation in result[2]]
+    return [len(results), violations]
+
+
+def write_report(location, violations):
+    with open(location, "w", encoding="utf-8") as f:
+        for violation in violations:
+            f.write(json.dumps(violation) + "\n")
+
+
+def print_summary(checked, violations, seconds, workers):
+    print("Audited {} posts in {:.3f}s with {} workers: {:,.1f} posts/sec".format(
+        checked, seconds, workers, checked / seconds if seconds else float("inf")))
+    counts = collections.Counter(violation["rule"] for violation in violations)
+    print("{} would-be violations in {} posts".format(len(violations), len(set(violation["id"] for violation in violations))))
+    for rule_name, rule_count in counts.most_common():
+        print("  {:>6}  {}".format(rule_count, rule_name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit historical posts for would-be rule violations")
+    parser.add_argument("posts", help="recorded submissions JSONL file or post store .db file")
+    parser.add_argument("--report", default=settings.AUDIT_REPORT_LOCATION, help="write violations to this JSONL file")
+    parser.add_argument("--days", type=int, default=settings.MAX_REMEMBER_LIMIT,
+                        help="only audit posts of the last days before the newest post")
+    parser.add_argument("--workers", type=int, default=settings.AUDIT_WORKERS,
+                        help="worker processes, 0 checks in this process (default: one per core)")
+    parser.add_argument("--span-size", type=int, default=None, help="posts checked per task (default: split evenly)")
+    parser.add_argument("--verbose", action="store_true", help="show bot log output")
+    args = parser.parse_args()
+
+    if args.verbose:
+        log.addHandler(logging.StreamHandler())
+        log.setLevel(logging.DEBUG)
+    posts, rule_names, embeds = load_posts(args.posts)
+    posts = get_window(posts, args.days)
+    workers = args.workers if args.workers is not None else (os.cpu_count() or 1)
+    start = time.perf_counter()
+    checked, violations = run_audit(posts, rule_names, embeds, workers, args.span_size)
+    seconds = time.perf_counter() - start
+    write_report(args.report, violations)
+    print_summary(checked, violations, seconds, workers)
+    print("Report written to {}".format(args.report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
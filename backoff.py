@@ -0,0 +1,20 @@
+import random
+import settings
+
+
+class Backoff:
+    # Exponential backoff with full jitter
+    # Each failure in a row doubles the longest wait, reset() after a success
+
+    def __init__(self, base=settings.BACKOFF_BASE, maximum=settings.BACKOFF_MAX):
+        self.base = base
+        self.maximum = maximum
+        self.attempt = 0
+
+    def next_delay(self):
+        delay = random.uniform(0, min(self.maximum, self.base * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+import sys
+import time
+import argparse
+import title_parser
+import media_url
+import collections
+
+
+# Benchmarks for hot paths of the bot
+# Run "python benchmark.py titles" and compare titles/sec before and after changing a regex
+# Run "python benchmark.py urls" for media url canonicalization
+# Run "python benchmark.py adversarial" for worst-case title parsing time as titles grow
+# --min-rate makes the run fail if throughput regresses below a rate
+
+TITLE_CORPUS_LOCATION = "benchmark_titles.txt"
+URL_CORPUS_LOCATION = "benchmark_urls.txt"
+
+# title_parser patterns and what they run on
+TITLE_PATTERNS = {
+    "post_title": title_parser.POST_TITLE_PATTERN,
+    "link_title": title_parser.LINK_TITLE_PATTERN,
+    "topic": title_parser.TOPIC_PATTERN,
+    "spotify_description": title_parser.SPOTIFY_DESCRIPTION_PATTERN,
+    "bandcamp_title": title_parser.BANDCAMP_TITLE_PATTERN,
+    "lastfm_result": title_parser.LASTFM_RESULT_PATTERN,
+}
+
+
+def load_corpus(location):
+    # Returns list of non-empty lines in corpus file
+    with open(location, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def time_calls(function, items, repeat):
+    # Returns seconds taken to call function on every item repeat times
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    return time.perf_counter() - start
+
+
+def report_rate(name, count, seconds, unit="title"):
+    rate = count / seconds if seconds else float("inf")
+    print("{:28} {:>12,.0f} {}s/sec {:>10.2f} us/{}".format(name, rate, unit, 1000000 * seconds / count, unit))
+    return rate
+
+
+def benchmark_titles(corpus, repeat):
+    # Reports titles/sec of uncached and cached parsing and per-pattern cost
+    # Returns uncached titles/sec of parse_post_title
+    count = len(corpus) * repeat
+    matched = sum(1 for title in corpus
+                  if title_parser.parse_title(title_parser.POST_TITLE_PATTERN, title, True).song is not None)
+    # Titles over budget are parsed by split_title instead of the regex
+    over_budget = sum(1 for title in corpus if title_parser.get_regex_cost(title, True) > title_parser.REGEX_BUDGET)
+    print("Corpus: {} titles, {} parsed into artist and song, {} over regex budget, {} repeats".format(
+        len(corpus), matched, over_budget, repeat))
+    rate = report_rate("parse_post_title (uncached)", count,
+                       time_calls(lambda title: title_parser.parse_title(title_parser.POST_TITLE_PATTERN, title, True),
+                                  corpus, repeat))
+    report_rate("parse_link_title (uncached)", count,
+                time_calls(lambda title: title_parser.parse_title(title_parser.LINK_TITLE_PATTERN, title), corpus, repeat))
+    title_parser.parse_post_title.cache_clear()
+    report_rate("parse_post_title (cached)", count, time_calls(title_parser.parse_post_title, corpus, repeat))
+    print("Per-pattern cost:")
+    for name, pattern in TITLE_PATTERNS.items():
+        report_rate("  " + name, count, time_calls(pattern.search, corpus, repeat))
+    report_rate("  get_unicode_normalized", count, time_calls(title_parser.get_unicode_normalized, corpus, repeat))
+    return rate
+
+
+# Titles crafted to make the title patterns backtrack, each makes a title of given length
+ADVERSARIAL_TITLES = {
+    "spaced_dashes": lambda length: ("a -" * length)[:length],
+    "em_dashes": lambda length: ("a \u2014" * length)[:length],
+    "quotes": lambda length: ('a "' * length)[:length],
+    "dash_then_brackets": lambda length: ("a - b" + " (x" * length)[:length],
+    "hyphenated_words": lambda length: ("a-b " * length)[:length],
+    "leading_brackets": lambda length: ("[a] " * length)[:length],
+    "words": lambda length: ("a " * length)[:length],
+    "pipes": lambda length: ("|" * length)[:length],
+    "spaced_pipes": lambda length: ("| " * length)[:length],
+    "pipes_and_commas": lambda length: ("| , " * length)[:length],
+    "braces": lambda length: ("{}" * length)[:length],
+    "brackets": lambda length: ("[(" * length)[:length],
+    "leading_bracket_then_dashes": lambda length: ("[" + " -" * length)[:length],
+    "mixed": lambda length: ('|-["( a' * length)[:length],
+    "mixed_separators": lambda length: ("a - b | c // d; e: \u2014 (" * length)[:length],
+    "tag_then_pipes": lambda length: ("[a]" + "| , " * length)[:length],
+    "tag_then_closing_brackets": lambda length: ("[abc def] " + ") , " * length)[:length],
+    "dashed_words": lambda length: (" - abcdefghijklmnop " * length)[:length],
+}
+ADVERSARIAL_LENGTHS = [50, 100, 200, 300, 1000, 3000, 10000]
+# Unbudgeted patterns take seconds on longer titles
+RAW_MAX_LENGTH = 300
+
+
+def time_worst(function, titles, repeat):
+    # Returns [seconds, title name] of the slowest title, each timed as the best of repeat calls
+    worst = [0.0, None]
+    for name, title in titles.items():
+        seconds = min(time_calls(function, [title], 1) for _ in range(repeat))
+        if seconds > worst[0]:
+            worst = [seconds, name]
+    return worst
+
+
+def benchmark_adversarial(lengths, repeat):
+    # Reports worst-case parse time of adversarial titles by title length
+    # Returns worst-case microseconds of budgeted parsing over all lengths
+    print("{:>8} {:>14} {:>14} {:>14}  {}".format("length", "post us", "link us", "raw regex us", "slowest"))
+    worst_overall = 0.0
+    for length in lengths:
+        titles = {name: make_title(length) for name, make_title in ADVERSARIAL_TITLES.items()}
+        post = time_worst(lambda title: title_parser.parse_title(title_parser.POST_TITLE_PATTERN, title, True), titles, repeat)
+        link = time_worst(lambda title: title_parser.parse_title(title_parser.LINK_TITLE_PATTERN, title), titles, repeat)
+        if length <= RAW_MAX_LENGTH:
+            raw = time_worst(title_parser.POST_TITLE_PATTERN.search, titles, repeat)
+            raw_text = "{:>14.1f}".format(1000000 * raw[0])
+        else:
+            raw_text = "{:>14}".format("-")
+        worst_overall = max(worst_overall, post[0], link[0])
+        print("{:>8} {:>14.1f} {:>14.1f} {}  {}".format(length, 1000000 * post[0], 1000000 * link[0], raw_text, post[1]))
+    return 1000000 * worst_overall
+
+
+def benchmark_urls(corpus, repeat):
+    # Reports urls/sec of media key extraction and how many distinct media the corpus has per platform
+    # Returns uncached urls/sec of get_media_key
+    count = len(corpus) * repeat
+    keys = [media_url.get_media_key(url) for url in corpus]
+    platforms = collections.Counter(key.platform for key in keys)
+    distinct = collections.Counter(key.platform for key in set(keys))
+    print("Corpus: {} urls, {} distinct media, {} repeats".format(len(corpus), len(set(keys)), repeat))
+    for platform, platform_count in platforms.most_common():
+        print("  {:12} {:>6} urls {:>6} distinct".format(platform, platform_count, distinct[platform]))
+    rate = report_rate("get_media_key (uncached)", count, time_calls(media_url.get_media_key.__wrapped__, corpus, repeat), "url")
+    media_url.get_media_key.cache_clear()
+    report_rate("get_media_key (cached)", count, time_calls(media_url.get_media_key, corpus, repeat), "url")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for ProgMetalBot")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    titles = subparsers.add_parser("titles", help="title parsing throughput")
+    titles.add_argument("--corpus", default=TITLE_CORPUS_LOCATION)
+    titles.add_argument("--repeat", type=int, default=100)
+    titles.add_argument("--min-rate", type=float, default=None, help="fail if uncached titles/sec is below this")
+    adversarial = subparsers.add_parser("adversarial", help="worst-case title parsing time by title length")
+    adversarial.add_argument("--lengths", type=int, nargs="+", default=ADVERSARIAL_LENGTHS)
+    adversarial.add_argument("--repeat", type=int, default=5)
+    adversarial.add_argument("--max-us", type=float, default=None, help="fail if worst-case parse time is above this")
+    urls = subparsers.add_parser("urls", help="media url canonicalization throughput")
+    urls.add_argument("--corpus", default=URL_CORPUS_LOCATION)
+    urls.add_argument("--repeat", type=int, default=100)
+    urls.add_argument("--min-rate", type=float, default=None, help="fail if uncached urls/sec is below this")
+    args = parser.parse_args()
+
+    if args.benchmark == "titles":
+        rate = benchmark_titles(load_corpus(args.corpus), args.repeat)
+    elif args.benchmark == "urls":
+        rate = benchmark_urls(load_corpus(args.corpus), args.repeat)
+    elif args.benchmark == "adversarial":
+        worst = benchmark_adversarial(args.lengths, args.repeat)
+        print("Worst case: {:,.1f} us".format(worst))
+        if args.max_us is not None and worst > args.max_us:
+            print("FAIL: worst case {:,.1f} us is above maximum {:,.1f} us".format(worst, args.max_us))
+            return 1
+        return 0
+    if args.min_rate is not None and rate < args.min_rate:
+        print("FAIL: {:,.0f}/sec is below minimum {:,.0f}/sec".format(rate, args.min_rate))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
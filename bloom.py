@@ -0,0 +1,38 @@
+import math
+import hashlib
+
+
+class BloomFilter:
+    # Fixed size set of strings with no false negatives and error_rate false positives at capacity
+    # Positions come from double hashing one blake2b digest, bits are kept in a bytearray
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        if len(self.bits) != (self.size + 7) // 8:
+            raise ValueError("Bloom filter has {} bytes, expected {}".format(len(self.bits), (self.size + 7) // 8))
+        # Number of added items, full when it reaches capacity
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def get_positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.get_positions(item))
+
+    def add(self, item):
+        for position in self.get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def is_full(self):
+        return self.count >= self.capacity
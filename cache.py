@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import logging
+import threading
+import collections
+
+
+log = logging.getLogger("bot")
+
+
+class TTLCache:
+    # Bounded least-recently-used cache where entries expire after ttl seconds
+    # Counts hits and misses, can be saved to and loaded from a json file
+    # Keys and values must be json serializable to use save/load, tuple keys are stored as lists
+
+    def __init__(self, maxsize=1024, ttl=86400, location=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.location = location
+        # key -> (expires_at, value), ordered least -> most recently used
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if location is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, default=None, count=True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                if count:
+                    self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        # Returns dict of size, hits, misses and hit rate
+        total = self.hits + self.misses
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def save(self):
+        # Write unexpired entries to location
+        if self.location is None:
+            return
+        now = time.time()
+        with self.lock:
+            items = [[key, expires_at, value] for key, (expires_at, value) in self.entries.items() if expires_at >= now]
+        temp_location = self.location + ".tmp"
+        with open(temp_location, "w") as f:
+            json.dump(items, f)
+        os.replace(temp_location, self.location)
+
+    def load(self):
+        # Read unexpired entries from location if it exists
+        try:
+            with open(self.location) as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            log.error("Exception in loading cache %s: %s", self.location, e)
+            return
+        now = time.time()
+        with self.lock:
+            for key, expires_at, value in items[-self.maxsize:]:
+                if expires_at >= now:
+                    if isinstance(key, list):
+                        key = tuple(key)
+                    self.entries[key] = (expires_at, value)
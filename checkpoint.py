@@ -0,0 +1,160 @@
+import logging
+import threading
+import collections
+import settings
+import bloom
+import metrics
+
+
+log = logging.getLogger("bot")
+
+# Reddit listings return at most 100 submissions per request
+PAGE_SIZE = 100
+
+
+class SeenFilter:
+    # Processed submission ids in bounded memory
+    # An exact ring of the most recent ids answers the submissions a stream replays after a restart
+    # Older ids are in two Bloom filter generations, a full generation replaces the previous one
+    # A Bloom filter hit is confirmed in the processed table, so a false positive never skips a new submission
+    # Filters are saved in the post store, ids processed after the last save are added again on load
+
+    def __init__(self, store, capacity=settings.SEEN_FILTER_CAPACITY, error_rate=settings.SEEN_FILTER_ERROR_RATE,
+                 ring_size=settings.SEEN_RING_SIZE, save_interval=settings.SEEN_SAVE_INTERVAL):
+        self.store = store
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.save_interval = save_interval
+        self.ring = collections.deque(maxlen=ring_size)
+        self.recent = set()
+        self.current = None
+        self.previous = None
+        self.unsaved = 0
+        self.load()
+
+    def __len__(self):
+        return len(self.current) + (len(self.previous) if self.previous is not None else 0)
+
+    def __contains__(self, submission_id):
+        if submission_id in self.recent:
+            result = "recent"
+        elif submission_id in self.current or (self.previous is not None and submission_id in self.previous):
+            result = "filter" if self.store.is_processed(submission_id) else "false_positive"
+        else:
+            result = "new"
+        metrics.bot_metrics.increment("seen_filter_lookups_total", [("result", result)])
+        return result in ("recent", "filter")
+
+    def get_saved_filter(self, key):
+        saved = self.store.get_filter(key)
+        if saved is None:
+            return None
+        try:
+            return bloom.BloomFilter(self.capacity, self.error_rate, bytearray(saved[0]), saved[1])
+        except ValueError as e:
+            # Capacity or error rate changed since the filter was saved
+            log.info("Discarding saved filter {}: {}".format(key, e))
+            return None
+
+    def load(self):
+        self.current = self.get_saved_filter("seen_current")
+        self.previous = self.get_saved_filter("seen_previous")
+        saved_rowid = self.store.get_meta("seen_rowid")
+        if self.current is None or saved_rowid is None:
+            self.current = bloom.BloomFilter(self.capacity, self.error_rate)
+            self.previous = None
+            saved_rowid = 0
+        missing = self.store.get_processed_since(saved_rowid)
+        for submission_id in missing:
+            self.add_filter(submission_id)
+        for submission_id in reversed(self.store.get_recent_processed(self.ring.maxlen)):
+            self.add_recent(submission_id)
+        log.info("Seen filter loaded with {} ids, {} added since last save".format(len(self), len(missing)))
+        if missing:
+            self.save()
+
+    def add_recent(self, submission_id):
+        if len(self.ring) == self.ring.maxlen:
+            self.recent.discard(self.ring[0])
+        self.ring.append(submission_id)
+        self.recent.add(submission_id)
+
+    def add_filter(self, submission_id):
+        if self.current.is_full():
+            self.previous = self.current
+            self.current = bloom.BloomFilter(self.capacity, self.error_rate)
+        self.current.add(submission_id)
+
+    def add(self, submission_id):
+        self.add_recent(submission_id)
+        self.add_filter(submission_id)
+        self.unsaved += 1
+        if self.unsaved >= self.save_interval:
+            self.save()
+
+    def save(self):
+        filters = {"seen_current": (self.current.bits, self.current.count)}
+        if self.previous is not None:
+            filters["seen_previous"] = (self.previous.bits, self.previous.count)
+        self.store.save_filters(filters, "seen_rowid")
+        self.unsaved = 0
+
+
+class StreamCheckpoint:
+    # Processed submissions and the newest processed fullname, persisted in the post store
+    # Restarts skip submissions the stream replays and catch up on ones missed while down
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.seen = SeenFilter(store)
+
+    def __len__(self):
+        return len(self.seen)
+
+    def is_processed(self, submission):
+        with self.lock:
+            return submission.id in self.seen
+
+    def mark_processed(self, submission):
+        # Row is written first so a filter save covers it
+        self.store.add_processed(submission)
+        with self.lock:
+            self.seen.add(submission.id)
+
+    def save(self):
+        with self.lock:
+            self.seen.save()
+
+    def get_cursor(self):
+        # Returns (fullname, created_utc) of newest processed submission or None
+        return self.store.get_checkpoint()
+
+
+def get_missed_submissions(reddit, checkpoint, subreddit=settings.REDDIT_SUBREDDIT):
+    # Returns submissions of subreddit newer than the checkpoint ordered oldest -> newest
+    # Pages forward with before=<newest fullname seen>, each page has up to 100 newer submissions
+    cursor = checkpoint.get_cursor()
+    if cursor is None:
+        return []
+    fullname, created_utc = cursor
+    subreddit = reddit.subreddit(subreddit)
+    missed = []
+    while True:
+        page = list(subreddit.new(limit=PAGE_SIZE, params={"before": fullname}))
+        if not page:
+            break
+        # Listing is ordered newest -> oldest
+        missed.extend(reversed(page))
+        fullname = page[0].name
+        if len(page) < PAGE_SIZE:
+            break
+    if not missed:
+        # before cursor returns nothing if the checkpoint submission was deleted, fall back to created_utc
+        for submission in subreddit.new(limit=None):
+            if submission.created_utc <= created_utc:
+                break
+            missed.append(submission)
+        missed.reverse()
+    log.info("Resuming {} from checkpoint {} with {} missed submissions".format(subreddit, cursor[0], len(missed)))
+    return missed
@@ -2,21 +2,52 @@ import prawcore
 import time
 import hashlib
 import datetime
+import collections
+import concurrent.futures
 import requests
-from requests.utils import quote
-import base64
 import settings
 import logging.handlers
 import logging
 import logger
 import os
 import re
-import musicbrainzngs
-import unicodedata
-import pylast
+import minhash
+import media_url
+import musicbrainz
+import lastfm
+import metrics
+import cache
+import outbox
+import post_record
+import rules
+import title_parser
+import thread_reddit
+import spotify
 
 
 log = logging.getLogger("bot")
+
+# Reddit accepts at most 50 fullnames per api/unhide request and returns at most 1000 posts per listing
+UNHIDE_BATCH_SIZE = 50
+MAX_LISTING_SIZE = 1000
+# Fields of a reddit search result used by repost checks
+SearchResult = collections.namedtuple("SearchResult", ["id", "name", "created_utc", "url", "title", "shortlink", "archived",
+                                                      "removed"])
+# Url and title searches of a submission run at the same time, each search thread has its own praw.Reddit
+search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=settings.SEARCH_WORKERS, thread_name_prefix="search")
+# parent fullname -> parent media, popular songs are crossposted many times
+crosspost_parent_cache = cache.TTLCache(maxsize=settings.CROSSPOST_CACHE_SIZE, ttl=settings.CROSSPOST_CACHE_TTL)
+metrics.bot_metrics.register_cache("crosspost_parent", crosspost_parent_cache)
+CACHE_MISS = object()
+# Text logged, report reason, and mod notification subject and text for a rule violation
+Violation = collections.namedtuple("Violation", ["log_text", "reason", "subject", "text"])
+# Words and numbers that tell apart songs of the same name: parts and live, demo or remixed versions
+# Numbers of 4 digits are years, extra info of the same song
+# A single "i" is left out of roman numerals, it is mostly the pronoun
+DISTINGUISHING_WORDS = {"pt", "part", "chapter", "act", "vol", "volume", "live", "demo", "acoustic", "remix",
+                        "remixed", "instrumental", "reprise", "unplugged", "orchestral"}
+TITLE_WORD_PATTERN = re.compile(r'(?u)[^\W\d_]+|\d+')
+ROMAN_NUMERAL_PATTERN = re.compile(r'i{2,3}|i?[vx]|[vx]i{1,3}')
 # log_mb = logger.make_logger("musicbrainzngs", LOG_FILENAME, logging_level=logging.DEBUG)
 
 
@@ -112,8 +143,9 @@ def check_lazy_text_post(submission):
 
 
 def check_album_stream(submission):
-    # Returns True if url contains "album"
+    # Returns True if link is an album or YouTube playlist, or YouTube title says it is a full album
     domain = get_domain(submission)
+    media_key = media_url.get_media_key(submission.url)
     if domain in ["youtube.com", "youtu.be", "m.youtube.com"]:
         try:
             title = submission.media['oembed']['title']
@@ -121,20 +153,11 @@ def check_album_stream(submission):
             title = submission.media.oembed.title
         result = re.search(r'(?i)(full.?album|album.?stream|full.?ep|ep.?stream)', title)
         if result is None:
-            result = re.search(r'(\.com\/playlist\?)', submission.url)
-            if result is None:
-                return False
-            else:
-                return True
+            return media_key.kind == "playlist"
         else:
             return True
     else:
-        url = get_url(submission)
-        result = re.search(r'(\.com\/album\/)', url)
-        if result is None:
-            return False
-        else:
-            return True
+        return media_key.kind == "album"
 
 
 def check_self_promotion(submission):
@@ -156,6 +179,20 @@ def check_removed(submission):
     return submission.removed
 
 
+def check_removed_fields(fields):
+    # Returns True if loaded fields of a submission show it was removed by mods or reddit or deleted by its author
+    # removed is only returned to moderators, removed_by_category is set for deleted posts too
+    return bool(fields.get('removed')) or fields.get('removed_by_category') is not None
+
+
+def get_removed_names(reddit, fullnames):
+    # Returns fullnames of submissions removed or deleted since they were indexed
+    # reddit.info fetches up to 100 fullnames per request
+    with metrics.bot_metrics.api_call("reddit_info"):
+        return [submission.name for submission in reddit.info(fullnames=list(fullnames))
+                if check_removed_fields(vars(submission))]
+
+
 def check_more_recent(submission_1, submission_2):
     # Returns True if submission_1 is more recent than submission_2
     age_1 = submission_1.created_utc
@@ -164,30 +201,36 @@ def check_more_recent(submission_1, submission_2):
 
 
 def get_url(submission):
-    # Get url
-    # Regex
-    url = re.search(r'(?:youtube\.com.*?=|youtu\.be\/)(.{11})', submission.url)
-    if url is None:
-        return submission.url
-    else:
-        return url.group(1)
+    # Returns id part of the canonical media key of the submission url, used in url searches
+    # e.g. YouTube video id, Spotify track id, or url without tracking parameters for other links
+    return media_url.get_media_key(submission.url).id
 
 
 def get_musicbrainz_result(artist, song):
     # Checks artist and song info against musicbrainz database
-    # Currently only returns True or False value
-    result = musicbrainzngs.search_recordings(artist=artist, recording=song)
-    # If the artist and song matches a recording in database then return True
-    # if not result['recording-list']:
+    # Rate limited and cached, blocks until result is available
+    result = musicbrainz.get_musicbrainz_service().search_recordings(artist, song)
     return result
 
 
+def check_musicbrainz_async(reddit, submission, artist, song):
+    # Verify artist and song in the background, report submission if no recording is found
+    # Musicbrainz allows one request per second, so rule reports are not held back for it and a missing
+    # recording is a second, follow-up report and outbox notification
+    def verify(mb_result):
+        count = mb_result['recording-count']
+        if count < 1:
+            # Runs on the musicbrainz service thread
+            verify_reddit = thread_reddit.get_reddit(reddit)
+            report_musicbrainz(verify_reddit, thread_reddit.get_submission(verify_reddit, submission))
+    return musicbrainz.get_musicbrainz_service().verify_recording_async(artist, song, verify)
+
+
+@metrics.timed("lastfm")
 def get_lastfm_result(artist, song):
-    lastfm = pylast.LastFMNetwork(api_key=os.environ['LASTFM_KEY'],
-                                  api_secret=os.environ['LASTFM_SECRET'])
-    results = pylast.TrackSearch(artist, song, lastfm)
-    results = results.get_next_page()
-    return results
+    # Returns list of "Artist - Song" track search results
+    # Shared last.fm client, repeat lookups of the same artist/song come from cache
+    return lastfm.search_tracks(artist, song)
 
 
 def get_domain(submission):
@@ -195,101 +238,47 @@ def get_domain(submission):
 
 
 def get_unicode_normalized(word):
-    try:
-        word.encode('utf-8', 'ignore').decode('ascii')
-    except UnicodeDecodeError:
-        normalized = unicodedata.normalize('NFD', word)
-        new_word = u"".join([c for c in normalized if not unicodedata.combining(c)])
-        return new_word
-    else:
-        return word
+    return title_parser.get_unicode_normalized(word)
 
 
 def get_spotify_authorization():
-    print("getting spotify authorization")
-    clientID = os.environ['SPOTIFY_ID']
-    clientSecret = os.environ['SPOTIFY_SECRET']
-    authorization = "Basic " + base64.b64encode(bytes(clientID+':'+clientSecret, 'utf-8')).decode()
-
-    payload = {'grant_type': 'client_credentials'}
-    headers = {'Authorization': authorization}
-
-    r = requests.post('https://accounts.spotify.com/api/token', data=payload, headers=headers)
-    rJson = r.json()
-    print(rJson)
-    accessToken = rJson["access_token"]
-    accessTokenAuthorization = "Bearer " + accessToken
-
-    return accessTokenAuthorization
+    # Cached token from shared spotify client, only requests a new one when expired
+    return spotify.get_spotify_client().get_authorization()
 
 
 def get_spotify_track_from_link(trackLink):
-    authorization = get_spotify_authorization()
-
     trackId = re.search(r'(?i)https?:\/\/open.spotify.com/track/([a-z0-9]{22})', trackLink).group(1)
-
-    url = 'https://api.spotify.com/v1/tracks/' + trackId
-    headers = {'Accept': 'application/json',
-               'Content-Type': 'application/json',
-               'Authorization': authorization}
-
-    r = requests.get(url, headers=headers)
-    rJson = r.json()
-    # print(rJson)
+    rJson = spotify.get_spotify_client().get_track(trackId)
+    return rJson
 
 
 def get_spotify_track_from_title(artist, track):
-    authorization = get_spotify_authorization
-
-    url = 'https://api.spotify.com/v1/search?q=track:"' + quote(track) + '"+artist:"' + quote(artist) + '"&type=track'
-    headers = {'Accept': 'application/json',
-               'Content-Type': 'application/json',
-               'Authorization': authorization}
-
-    r = requests.get(url, headers=headers)
-    rJson = r.json()
-    print(rJson)
+    query = 'track:"' + track + '" artist:"' + artist + '"'
+    rJson = spotify.get_spotify_client().search(query, 'track')
+    return rJson
 
 
 def get_spotify_album_from_link(albumLink):
-    authorization = get_spotify_authorization()
-
     albumID = re.search(r'(?i)https?:\/\/open.spotify.com/album/([a-z0-9]{22})', albumLink).group(1)
-
-    url = 'https://api.spotify.com/v1/albums/' + albumID
-    headers = {'Accept': 'application/json',
-               'Content-Type': 'application/json',
-               'Authorization': authorization}
-
-    r = requests.get(url, headers=headers)
-    rJson = r.json()
-    # print(rJson)
-
+    rJson = spotify.get_spotify_client().get_album(albumID)
     return rJson
 
 
 def get_spotify_album(artist, album):
-    authorization = get_spotify_authorization()
-
-    url = 'https://api.spotify.com/v1/search?q=album:"' + quote(album) + '"+artist:"' + quote(artist) + '"&type=album'
-    headers = {'Accept': 'application/json',
-               'Content-Type': 'application/json',
-               'Authorization': authorization}
-
-    r = requests.get(url, headers=headers)
-    rJson = r.json()
-    print(rJson)
-
+    query = 'album:"' + album + '" artist:"' + artist + '"'
+    rJson = spotify.get_spotify_client().search(query, 'album')
+    return rJson
     # albumNum = rJson["albums"]["total"]
     # albums = rJson["albums"]["items"]
     # artist = albums[0]
 
 
 def get_spotify_artist_from_id(artistId):
-    authorization = get_spotify_authorization()
-    url = 'https://api.spotify.com/v1/artists/' + artistId
+    rJson = spotify.get_spotify_client().get_artist(artistId)
+    return rJson
 
 
+@metrics.timed("get_link_title")
 def get_link_title(reddit, submission):
     # Get 'Artist' and 'Song' from the embedded link info
     # Returns [artist, song] or 'None' if soundcloud link (for now)
@@ -303,7 +292,7 @@ def get_link_title(reddit, submission):
         except KeyError:
             description = submission.media.oembed.description
         # Regex
-        title = re.search('(.*), a song by (.*) on Spotify', description)
+        title = title_parser.SPOTIFY_DESCRIPTION_PATTERN.search(description)
         song = title.group(1)
         artist = title.group(2)
         link_title = [artist, song]
@@ -313,13 +302,12 @@ def get_link_title(reddit, submission):
         except KeyError:
             description = submission.media.oembed.title
         # Regex
-        title = re.search('(.*), by (.*)', description)
+        title = title_parser.BANDCAMP_TITLE_PATTERN.search(description)
         song = title.group(1)
         artist = title.group(2)
         link_title = [artist, song]
     elif domain in ["youtube.com", "youtu.be", "m.youtube.com"]:
-        # Need to add YouTube API for better info
-        # Currently cannot access a video's description
+        # oembed has no video description, see get_youtube_link_title for the YouTube API fallback
         try:
             link_author = submission.media['oembed']['author_name']
             link_media_title = submission.media['oembed']['title']
@@ -333,24 +321,18 @@ def get_link_title(reddit, submission):
             if "Various Artists" in link_author:
                 # YouTube channel is "Various Artist - Topic"
                 # so artist name is unknown
-                # need to use YouTube api to access video description to get correct artist name
+                # rules.check_title_match recovers artist from the video description with youtube.get_video
                 artist = None
             else:
                 # Regex
-                topic = re.search('(.*) - Topic', link_author)
+                topic = title_parser.TOPIC_PATTERN.search(link_author)
                 artist = topic.group(1)
             link_title = [artist, song]
         # If video is normal upload by label or user
         else:
-            # Regex
-            # title = re.search(r'(?iu)^(.*?)\s?(?:-{1,2}|\u2014|\u2013)\s?(?:"|)(\(?[^"]*?)\s?(?:["].*|(?:\(|\[|{).*[^)]$|[-([].*?(?:full|video|instrumental|review|album|official|premiere?|lyric|playthrough|single|cover|[0-9]{4}).*|$|\n)', link_media_title)
-            title = re.search(r'(?iu)^(.*\S-\S.*|.+?)\s?(?:-{1,2}|\u2014|\u2013|\s(?=["“”]))\s?(?:["“”]|)(\(?[^“"”]*?)\s?(?:["“”].*|\s(?:\(|\[|{).*[^)]$|[-(["“”].*?(?:full|audio|video|instrumental|review|album|official|premiere?|lyric|playthrough|single|cover|version|live|music|[0-9]{4}).*|$|\n)', link_media_title)
-            if title is None:
-                link_title = [link_media_title, None]
-            else:
-                artist = title.group(1)
-                song = title.group(2)
-                link_title = [artist, song]
+            # Precompiled regex in title_parser, parse is cached by video title
+            parsed = title_parser.parse_link_title(link_media_title)
+            link_title = [parsed.artist, parsed.song]
     elif domain == "soundcloud.com":
         # Need to add SoundCloud API for info
         link_title = None
@@ -364,99 +346,201 @@ def get_link_title(reddit, submission):
     return link_title
 
 
+def get_youtube_video_id(submission):
+    # Returns YouTube video id of the link, None if link is not a YouTube video
+    key = media_url.get_media_key(submission.url)
+    if key.platform == "youtube" and key.kind == "video":
+        return key.id
+    return None
+
+
+def get_youtube_link_title(link_info, metadata):
+    # Fill in artist and song missing from oembed link info with YouTube video metadata
+    # Artist and song are only known for auto-generated "Artist - Topic" uploads
+    # Returns link_info unchanged if metadata has no artist and song
+    if not metadata or metadata.get("artist") is None or metadata.get("song") is None:
+        return link_info
+    return [get_unicode_normalized(metadata["artist"]), get_unicode_normalized(metadata["song"])]
+
+
+@metrics.timed("get_post_title")
 def get_post_title(submission):
-    # REGEX OVERLOAD INCOMING
-    # Use regex string in ' ' on regexr.com and check out all the titles it catches!
-    # re.search will store 'Artist' in title.group(1) and 'Song' in title.group(2)
-    # title = re.search(r'(?iu)(?:(?:^[()[\]{}|].*?[()[\]{}|][\s|\W]*)|(?:^))(.*?)\s?(?:-{1,2}|\u2014|\u2013)\s?(?:"|)(\(?[^"]*?)\s?(?:\/\/.*|\\\\.*|\|\|.*|\|.*\||["].*|(?:\(|\[|{).*[^)]$|[-([|:;].*?(?:favorite|video|full|tour|premiere?|released|cover|album|drum|guitar|bass|vox|vocal|voice|playthrough|ffo|official|new|metal|prog|test\spost).*|$|\n)', submission.title)
-    title = re.search(r'(?iu)(?:(?:^[()[\]{}|].*?[()[\]{}|][\s|\W]*)|(?:^))([^([]*\S-\S[^([]*|[^([]*?)\s?(?:-{1,2}|\u2014|\u2013|\s(?=[“"”]))\s?(?:[“"”]|)([^“"”]*?)\s?(?:\/\/.*|\\\\.*|\|\|.*|\|.*\||[“"”].*|\s(?:[([{]).*[^)\]}]$|(?:[-([|;“"”]|:\s).*?(?:favorite|audio|video|full|tour|live|premiere?|released|cover|version|music|album|drum|guitar|bass|vox|vocal|voice|playthrough|ffo|for fans of|official|new|metal|prog|recommend|[0-9]{4}).*|$|\n)', submission.title)
-    if title is None:
-        # ah fuck it didn't work
-        post_title = [get_unicode_normalized(submission.title), None]
-    else:
-        artist = get_unicode_normalized(title.group(1))
-        song = get_unicode_normalized(title.group(2))
-        post_title = [artist, song]
-    return post_title
+    # Returns [artist, song], song is None if title didn't match regex
+    # Precompiled regex in title_parser, parse is cached by title so repeated calls per submission are free
+    parsed = title_parser.parse_post_title(submission.title)
+    return [parsed.artist, parsed.song]
 
 
-def get_reddit_search_listing(reddit, context, query_text):
-    # Search for query in last year of submissions where context is url or title
+def get_reddit_search_listing(reddit, context, query_text, subreddit=settings.REDDIT_SUBREDDIT):
+    # Search for query in last year of submissions of subreddit where context is url or title
     # Returns listing object of submission ordered new -> old
     search_query = context + ":" + query_text
-    listing = reddit.subreddit(settings.REDDIT_SUBREDDIT).search(search_query, sort='new', time_filter='year', limit=10)
+    listing = thread_reddit.get_reddit(reddit).subreddit(subreddit).search(search_query, sort='new', time_filter='year', limit=10)
     return listing
 
 
+def get_search_result(submission, records=None):
+    # Build SearchResult from fields returned with the search listing
+    # Reads the object's loaded fields directly, attribute access on a missing field would fetch the whole post
+    # records maps id -> SearchResult so a post found by more than one search has one record
+    fields = vars(submission)
+    submission_id = fields.get('id')
+    if records is not None and submission_id in records:
+        return records[submission_id]
+    record = SearchResult(submission_id, fields.get('name'), fields.get('created_utc', 0), fields.get('url', ""),
+                          fields.get('title', ""), "https://redd.it/" + str(submission_id), fields.get('archived', False),
+                          check_removed_fields(fields))
+    if records is not None:
+        records[submission_id] = record
+    return record
+
+
+def get_reddit_search_results(reddit, context, query_text, subreddit=settings.REDDIT_SUBREDDIT):
+    # Returns list of SearchResult ordered new -> old
+    with metrics.bot_metrics.time("reddit_search:" + context), metrics.bot_metrics.api_call("reddit_search"):
+        return [get_search_result(submission) for submission in
+                get_reddit_search_listing(reddit, context, query_text, subreddit)]
+
+
+def get_reddit_searches(reddit, searches, subreddit=settings.REDDIT_SUBREDDIT):
+    # Run list of (context, query_text) searches of subreddit at the same time
+    # Returns list of SearchResult lists in the same order, None for a search that failed with a server error
+    futures = [search_executor.submit(get_reddit_search_results, reddit, context, query_text, subreddit)
+               for context, query_text in searches]
+    results = []
+    records = {}
+    for future in futures:
+        try:
+            results.append([records.setdefault(record.id, record) for record in future.result()])
+        except prawcore.exceptions.ServerError as e:
+            # HTTP Exception, will skip this search
+            # e._raw.status_code will show 503, etc.
+            log.error("Exception in reddit search: %s", e, exc_info=True)
+            results.append(None)
+    return results
+
+
+def violation_musicbrainz(submission):
+    # Musicbrainz query was unsuccessful
+    # Found after the rule pass, so it is a follow-up report of its own and not part of the combined report
+    return Violation("Song not found in Musicbrainz: Reporting {}".format(submission.shortlink),
+                     "Not Found in Musicbrainz (follow-up)",
+                     "ProgMetalMod: Not Found in Musicbrainz",
+                     "Follow-up check of [this post]({}), any other rule violations were reported already: "
+                     "no Musicbrainz recording matches its artist and song.".format(submission.shortlink))
+
+
 def report_musicbrainz(reddit, submission):
     # Musicbrainz query was unsuccessful
     # Submission will be reported and message sent to mods
-    log.info("Song not found in Musicbrainz: Reporting {}".format(submission.shortlink))
-    submission.report("Not Found in Musicbrainz")
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Not Found in Musicbrainz", "Please look at [this post]({}) for failed Musicbrainz result or check the modmail.".format(submission.shortlink))
+    perform_mod_actions(reddit, submission, [violation_musicbrainz(submission)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Not Found in Musicbrainz", "Please look at [this post]({}) for failed Musicbrainz result.\n\nIf you have a question please message u/{}".format(submission.shortlink, settings.USER_TO_MESSAGE))
 
 
+def violation_bad_title(submission):
+    # Submission was found to have an incorrect title
+    return Violation("Rule Violation (Bad Title): Reporting {}".format(submission.shortlink),
+                     "Bad Title Format",
+                     "ProgMetalMod: Bad Title Format",
+                     "Please look at [this post]({}) to check for proper title format.".format(submission.shortlink))
+
+
 def rule_bad_title(reddit, submission):
     # Submission was found to have an incorrect title
     # Submission will be reported and message sent to mods
-    log.info("Rule Violation (Bad Title): Reporting {}".format(submission.shortlink))
     # submission.mod.remove()
-    submission.report("Bad Title Format")
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Bad Title Format", "Please look at [this post]({}) to check for proper title format.".format(submission.shortlink))
+    perform_mod_actions(reddit, submission, [violation_bad_title(submission)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Bad Title Format", "Please look at [this post]({}) and check for a proper title format.\n\nIf you have a question please message u/{}".format(submission.shortlink, settings.USER_TO_MESSAGE))
 
 
+def violation_bad_title_report(submission):
+    # Submission was found to possibly have an incorrect title
+    return Violation("Possible Rule Violation (Bad Title): Reporting {}".format(submission.shortlink),
+                     "Possible Bad Title/Link Match",
+                     "ProgMetalMod: Bad Title/Link Match",
+                     "Please look at [this post]({}) to check for proper match of submission title and linked song.".format(submission.shortlink))
+
+
 def rule_bad_title_report(reddit, submission):
     # Submission was found to possibly have an incorrect title
     # Submission will be reported to mods for verification
-    log.info("Possible Rule Violation (Bad Title): Reporting {}".format(submission.shortlink))
-    submission.report("Possible Bad Title/Link Match")
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Bad Title/Link Match", "Please look at [this post]({}) to check for proper match of submission title and linked song.".format(submission.shortlink))
+    perform_mod_actions(reddit, submission, [violation_bad_title_report(submission)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Bad Title/Link Match", "Please look at [this post]({}) to check for a proper match of submission title and linked song.\n\nIf you have a question please message u/{}".format(submission.shortlink, settings.USER_TO_MESSAGE))
 
 
+def violation_six_month(submission, sub):
+    # Submission was found to violate the 'repost in six months' rule
+    return Violation("Rule Violation (6-month Repost): Reporting {}, repost of {}".format(submission.shortlink, sub.shortlink),
+                     "Repost of {}".format(sub.shortlink),
+                     "ProgMetalMod: Song Repost",
+                     "Please look at [this post]({}) for a possible repost of [this post]({}).".format(submission.shortlink, sub.shortlink))
+
+
 def rule_six_month(reddit, submission, sub):
     # Submission was found to violate the 'repost in six months' rule
     # Submission will be reported and message sent to mods
-    log.info("Rule Violation (6-month Repost): Reporting {}, repost of {}".format(submission.shortlink, sub.shortlink))
     # submission.mod.remove()
-    submission.report("Repost of {}".format(sub.shortlink))
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Song Repost", "Please look at [this post]({}) for a possible repost of [this post]({}).".format(submission.shortlink, sub.shortlink))
+    perform_mod_actions(reddit, submission, [violation_six_month(submission, sub)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Song Repost", "Please look at [this post]({}) for a possible repost of [this post]({}).\n\nIf you have a question please message u/{}".format(submission.shortlink, sub.shortlink, settings.USER_TO_MESSAGE))
 
 
+def violation_possible_repost(submission, sub):
+    # Submission was found to have a title similar to an older post of the same artist
+    return Violation("Possible Rule Violation (6-month Repost): Reporting {}, similar to {}".format(submission.shortlink, sub.shortlink),
+                     "Possible Repost of {}".format(sub.shortlink),
+                     "ProgMetalMod: Possible Song Repost",
+                     "Please look at [this post]({}) for a possible repost of [this post]({}) with a similar title.".format(submission.shortlink, sub.shortlink))
+
+
+def violation_album_stream(submission):
+    # Submission was found to link to a full album stream on bandcamp, spotify, or youtube
+    return Violation("Rule Violation (Album Stream): Reporting {}".format(submission.shortlink),
+                     "Full Album Stream",
+                     "ProgMetalMod: Full Album Stream",
+                     "Please look at [this post]({}) which may violate the full album stream rule.".format(submission.shortlink))
+
+
 def rule_album_stream(reddit, submission):
     # Submission was found to link to a full album stream on bandcamp, spotify, or youtube
     # Submission will be reported and message sent to mods
-    log.info("Rule Violation (Album Stream): Reporting {}".format(submission.shortlink))
     # submission.mod.remove()
-    submission.report("Full Album Stream")
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Full Album Stream", "Please look at [this post]({}) which may violate the full album stream rule.".format(submission.shortlink))
+    perform_mod_actions(reddit, submission, [violation_album_stream(submission)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Full Album Stream", "Please look at [this post]({}) which may violate the full album stream rule.\n\nIf you have a question please message u/{}".format(submission.shortlink, settings.USER_TO_MESSAGE))
 
 
+def violation_self_promotion(submission):
+    # Submission was found to possibly be self-promotion
+    return Violation("Rule Violation (Self-Promotion): Reporting {}".format(submission.shortlink),
+                     "Possible Self-Promotion",
+                     "ProgMetalMod: Possible Self-Promotion",
+                     "Please look at [this post]({}) for possible self-promotion because the user's name matches the artist's name.".format(submission.shortlink))
+
+
 def rule_self_promotion(reddit, submission):
     # Submission was found to possibly be self-promotion
     # Submission will be reported and message sent to mods
-    log.info("Rule Violation (Self-Promotion): Reporting {}".format(submission.shortlink))
-    submission.report("Possible Self-Promotion")
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Possible Self-Promotion", "Please look at [this post]({}) for possible self-promotion because the user's name matches the artist's name.".format(submission.shortlink))
+    perform_mod_actions(reddit, submission, [violation_self_promotion(submission)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Possible Self-Promotion", "Please look at [this post]({}) for possible self-promotion because the user's name matches the artist's name.\n\nIf you have a question please message u/{}".format(subission.shortlink, settings.USER_TO_MESSAGE))
 
 
+def violation_lazy_selfpost(submission):
+    # submission was found to be a self post with only a link
+    return Violation("Rule Violation (Low-effort Selfpost): Reporting {}".format(submission.shortlink),
+                     "Link as Selfpost",
+                     "ProgMetalMod: Link as Selfpost",
+                     "Please look at [this post]({}) for a lazy selfpost containing just a link.".format(submission.shortlink))
+
+
 def rule_lazy_selfpost(reddit, submission):
     # submission was found to be a self post with only a link
     # Submission will be reported and message sent to mods
-    log.info("Rule Violation (Low-effort Selfpost): Reporting {}".format(submission.shortlink))
-    submission.report("Link as Selfpost")
-    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalMod: Link as Selfpost", "Please look at [this post]({}) for a lazy selfpost containing just a link.".format(submission.shortlink))
+    perform_mod_actions(reddit, submission, [violation_lazy_selfpost(submission)])
     # ***UNCOMMENT LATER***
     # reddit.subreddit(settings.REDDIT_SUBREDDIT).message("ProgMetalMod: Link as Selfpost", "Please look at [this post]({}) for a lazy selfpost containing just a link.\n\nIf you have a question please message u/{}".format(subission.shortlink, settings.USER_TO_MESSAGE))
 
@@ -467,31 +551,56 @@ def rule_violation(rules_violated, rule):
     return rules_violated
 
 
-def perform_mod_actions(reddit, rules_violated):
-    # For each rule in rules_violated, perform mod actions
-    if len(rules_violated) > 1:
-        submission = rules_violated[0]
-        for rule in rules_violated[1:]:
-            if rule == 1:
-                # bad title
-                rule_bad_title(reddit, submission)
-            elif 2 in rule:
-                # possible bad title - report only
-                rule_bad_title_report(reddit, submission)
-            elif 3 in rule:
-                # six month repost
-                rule_six_month(reddit, submission, rule[1])
+def perform_mod_actions(reddit, submission, rules_violated):
+    # Report submission once and send one notification for all rules violated
+    # The background musicbrainz verification is the only check reported separately, see check_musicbrainz_async
+    # Reddit limits report reasons to 100 characters
+    if not rules_violated:
+        return
+    for violation in rules_violated:
+        log.info(violation.log_text)
+    reason = "; ".join(violation.reason for violation in rules_violated)
+    if len(reason) > 100:
+        reason = reason[:97] + "..."
+    with metrics.bot_metrics.time("action:report"):
+        submission.report(reason)
+    if len(rules_violated) == 1:
+        subject = rules_violated[0].subject
+        text = rules_violated[0].text
+    else:
+        subject = "ProgMetalMod: {} Rule Violations".format(len(rules_violated))
+        text = "\n\n".join(violation.text for violation in rules_violated)
+    with metrics.bot_metrics.time("action:notify"):
+        outbox.notify(reddit, subject, text)
+
+
+def unhide_batch(reddit, posts):
+    reddit = thread_reddit.get_reddit(reddit)
+    posts = [thread_reddit.get_submission(reddit, post) for post in posts]
+    posts[0].unhide(other_submissions=posts[1:])
 
 
-def unhide_posts(reddit):
+def unhide_posts(reddit, workers=settings.UNHIDE_WORKERS):
+    # Page through hidden listing once, then unhide in batches of the most fullnames reddit accepts
+    # Listings stop at 1000 posts, so list again only if the listing was cut off
+    start = time.time()
     unhidden_count = 0
     while True:
-        posts = [post for post in reddit.user.me().hidden(limit=40)]
+        posts = list(reddit.user.me().hidden(limit=None))
         if not posts:
-            log.info("{} posts have been unhidden.".format(unhidden_count))
             break
-        posts[0].unhide(other_submissions=posts[1:40])
-        unhidden_count += 1
+        batches = [posts[i:i + UNHIDE_BATCH_SIZE] for i in range(0, len(posts), UNHIDE_BATCH_SIZE)]
+        if workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda batch: unhide_batch(reddit, batch), batches))
+        else:
+            for batch in batches:
+                unhide_batch(reddit, batch)
+        unhidden_count += len(posts)
+        if len(posts) < MAX_LISTING_SIZE:
+            break
+    log.info("{} posts have been unhidden in {:.2f}s".format(unhidden_count, time.time() - start))
+    return unhidden_count
 
 
 def initialize_link_array(reddit):
@@ -555,228 +664,270 @@ def update_stored_posts(reddit, stored_posts):
             f.write(submission.id + "\n")
 
 
+def get_embedded_parent_media(submission):
+    # Returns [True, media] from the parent embedded in crosspost_parent_list
+    # Returns [False, None] if the parent is not embedded
+    parent_list = getattr(submission, 'crosspost_parent_list', None)
+    if parent_list and 'media' in parent_list[0]:
+        return [True, parent_list[0]['media']]
+    return [False, None]
+
+
+def merge_crosspost_parents(reddit, submissions):
+    # Merge media information from parents into crossposts
+    # Uses the embedded parent, then the parent cache, and fetches all remaining parents in one info request
+    missing = {}
+    for submission in submissions:
+        if not check_crosspost(submission):
+            continue
+        parentName = submission.crosspost_parent
+        embedded, media = get_embedded_parent_media(submission)
+        if not embedded:
+            media = crosspost_parent_cache.get(parentName, CACHE_MISS)
+        if media is CACHE_MISS:
+            missing.setdefault(parentName, []).append(submission)
+            continue
+        crosspost_parent_cache.put(parentName, media)
+        submission.media = media
+    if missing:
+        with metrics.bot_metrics.api_call("reddit_info"):
+            parents = list(reddit.info(fullnames=list(missing)))
+        for parent in parents:
+            crosspost_parent_cache.put(parent.name, parent.media)
+            for submission in missing.pop(parent.name, []):
+                submission.media = parent.media
+        for parentName in missing:
+            log.info("Crosspost parent {} not found".format(parentName))
+    return submissions
+
+
+@metrics.timed("merge_crosspost_parent")
 def merge_crosspost_parent(reddit, submission):
     # Merge media information from parent into crosspost
-    if hasattr(submission, 'crosspost_parent_list'):
-        parentName = submission.crosspost_parent
-        parentId = parentName[3:]
-        parent = reddit.submission(id=parentId)
-        submission.media = parent.media
-    return submission
-
-
-def check_selfpost(reddit, submission):
-    # Check a self.subreddit submission
-    if check_lazy_text_post(submission):
-        rule_lazy_selfpost(reddit, submission)
-
-
-def check_submission(reddit, submission):
-    # Check the submission and link information for album stream, self-promotion, and bad title formatting
-    # Artist and Song name verification happens here with checks against submission title
-    link_domain = get_domain(submission)
-    if not check_domain(link_domain):
-        # link domain is not youtube, spotify, bandcamp, or soundcloud
-        # could check domain against secondary list including facebook, twitter, metal magazines, etc. for different handling
-        log.info("Link submission to {}".format(link_domain))
-        # Submission will not be cross-checked with list
-        return False
-    if check_album_stream(submission):
-        # does not include spotify playlists as album streams
-        log.info("Submission {} is an album stream".format(submission.id))
-        rule_album_stream(reddit, submission)
-        # Submission will not be cross-checked with list
-        return False
-    # rules_violated = []
-    post_title = submission.title
-    post_info = get_post_title(submission)
-    if post_info[1] is None:
-        # Report submission for bad title rule violation
-        # Could do second regex check for "Song by Artist"
-        rule_bad_title(reddit, submission)
-        # Submission will not be cross-checked with list
-        return False
-    else:
-        post_artist = post_info[0]
-        post_song = post_info[1]
-    if check_self_promotion(submission):
-        rule_self_promotion(reddit, submission)
-        # Currently keeps checking the post for other violations.
-        #   No proper way to consolidate rule violations into one report method
-        #   It's possible that the self-promotion report will be overwritten with another report during check
-    link_info = get_link_title(reddit, submission)
-    if link_info is None:
-        # None means soundcloud link which is not handled yet
-        # currently: do nothing
-        pass
-    else:
-        reportBadTitle = False
-        noLinkArtist = False
-        noLinkSong = False
-        link_artist = link_info[0]
-        link_song = link_info[1]
-        if link_artist is not None:
-            link_artist_lower = link_artist.lower()
-        if link_song is not None:
-            link_song_lower = link_song.lower()
-        post_artist_lower = post_artist.lower()
-        post_song_lower = post_song.lower()
-        if link_artist is None:
-            # auto-generated YouTube channel "Various Artist - Topic"
-            # artist unknown until YouTube API enabled, song is known
-            noLinkArtist = True
-            if link_song_lower not in post_song_lower or post_song_lower not in link_song_lower:
-                # Report submission for link info not matching post info
-                text = "Song: \"{}\" does not match Linked Song: \"{}\""
-                vars = [post_song, link_song]
-                reportBadTitle = True
-        elif link_song is None:
-            # YouTube video title didn't match regex, so link_artist is full video title
-            # Can check post_info against this info
-            noLinkSong = True
-            video_title = link_artist
-            if post_artist_lower not in video_title.lower() or post_song_lower not in video_title.lower():
-                # Report submission for artist or song in post title not found in link title
-                text = "Artist: \"{}\" or Song: \"{}\" does not match Title: \"{}\""
-                vars = [post_artist, post_song, video_title]
-                reportBadTitle = True
-        elif post_artist_lower not in link_artist_lower and link_artist_lower not in post_artist_lower:
-            try:
-                link_title = submission.media['oembed']['title']
-            except KeyError:
-                link_title = submission.media.oembed.title
-            if post_artist_lower not in link_title.lower():
-                # Report submission for artist or song in post title not found in link title
-                text = "Artist: \"{}\" or Song: \"{}\" does not match Title: \"{} -- {}\""
-                vars = [post_artist, post_song, link_artist, link_song]
-                reportBadTitle = True
-        elif post_song_lower not in link_song_lower and link_song_lower not in post_song_lower:
-            try:
-                link_title = submission.media['oembed']['title']
-            except KeyError:
-                link_title = submission.media.oembed.title
-            if post_song_lower not in link_title.lower():
-                # Report submission for artist or song in post title not found in link title
-                text = "Artist: \"{}\" or Song: \"{}\" does not match Title: \"{} -- {}\""
-                vars = [post_artist, post_song, link_artist, link_song]
-                reportBadTitle = True
-        if reportBadTitle:
-            # Title is potentially bad, confirm with typo-correction
-            # Get results from last.fm to compare
-            lastfmResults = get_lastfm_result(post_artist, post_song)
-            for result in lastfmResults:
-                # Check against search results for possible typo in title
-                # Typos in title will not be reported
-                title = re.search(r'(?iu)^(.*?)\s-\s(.*$)', str(result))
-                artist = title.group(1)
-                song = title.group(2)
-                artist_lower = artist.lower()
-                song_lower = song.lower()
-                if noLinkArtist:
-                    if song_lower in link_song_lower or link_song_lower in song_lower:
-                        reportBadTitle = False
-                elif noLinkSong:
-                    video_title_lower = link_artist.lower()
-                    if artist_lower in video_title_lower and song_lower in video_title_lower:
-                        reportBadTitle = False
-                else:
-                    if artist_lower in link_artist_lower and song_lower in link_song_lower:
-                        reportBadTitle = False
-                    elif link_artist_lower in artist_lower and link_song_lower in song_lower:
-                        reportBadTitle = False
-                    if not reportBadTitle:
-                        break
-        if reportBadTitle:
-            log.info(text.format(*vars))
-            rule_bad_title_report(reddit, submission)
-    # mb_result = get_musicbrainz_result(post_artist, post_song)
-    # count = mb_result['recording-count']
-    # if count < 1:
-    #    report_musicbrainz(reddit, submission)
-    # can check for correct listing within musicbrainz result
-    # else:
-    #    print(mb_result)
-    log.info("Domain: {:14} Song submitted: {} - {}".format(link_domain, post_artist, post_song))
-    # Submission will be cross-checked with list
-    return True
-
-
-# def check_list(reddit, submission, stored_posts):
-def check_list(reddit, submission):
-    # Cross-check submission against list for matching url or title info
-    # If matched, report post
-    # If not, add it to the list
-    # Check if exact url already exists
-    post_url = get_url(submission)
-    post_title_split = get_post_title(submission)
+    return merge_crosspost_parents(reddit, [submission])[0]
+
+
+def process_submission(reddit, submission, posts_index=None, store=None):
+    # Run all checks on a submission from the stream
+    # Checks submission for accurate title/link info
+    #   If submission is not from music domain, does not get checked
+    # Checks submission against posts from last 6 months
+    # Adds submission to list after both checks
+    # Checks read a PostRecord built once from the submission, reports go to the submission
+    # Pipeline workers use their own praw.Reddit, stream submissions belong to the main thread's
+    reddit = thread_reddit.get_reddit(reddit)
+    record = post_record.get_post_record(submission)
+    if check_archived(record) or not check_age_days(record) or check_reported(record):
+        return
+    # log.info("Found new post {} in subreddit {}".format(submission, settings.REDDIT_SUBREDDIT))
+    if check_self(record):
+        log.info("Found new self Submission: {} in Subreddit: {}".format(record, record.subreddit))
+        context = rules.run_rules(reddit, record, timer=metrics.bot_metrics)
+        perform_mod_actions(reddit, thread_reddit.get_submission(reddit, submission), context.rules_violated)
+        metrics.bot_metrics.observe_decision(record)
+        return
+    log.info("Found new link Submission: {} in Subreddit: {}".format(record, record.subreddit))
+    if check_crosspost(submission):
+        # Link submission is a crosspost
+        # Merge embeded media information from parent into crosspost for checking
+        log.info("Submission is crosspost; merging media information")
+        submission = merge_crosspost_parent(reddit, submission)
+        record.media = submission.media
+    if not check_embed(record):
+        # Link submission does not have embeded media information to use for submission checking
+        log.info("Link Submission: {} has no embedded media, will skip".format(record))
+        return
+    if posts_index is not None:
+        posts_index.purge()
+    # All rules in one pass ordered by cost, one combined report
+    context = rules.run_rules(reddit, record, posts_index, metrics.bot_metrics)
+    perform_mod_actions(reddit, thread_reddit.get_submission(reddit, submission), context.rules_violated)
+    metrics.bot_metrics.observe_decision(record)
+    if settings.MUSICBRAINZ_CHECK and context.verify_song():
+        check_musicbrainz_async(reddit, submission, record.artist, record.song)
+    log_info(record)
+    if posts_index is not None:
+        # Already indexed by the repost_index rule unless an earlier rule stopped the checks
+        posts_index.add(record)
+    if store is not None:
+        store.add(record)
+        for submission_id in context.removed_ids:
+            store.set_removed(submission_id)
+    log.info("Checks complete for submission: {}".format(record))
+
+
+def get_title_mismatch(submission, post_info, link_info):
+    # Compare post title info against link info
+    # Returns None if they match
+    # Returns [text, vars, noLinkArtist, noLinkSong] if title is potentially bad
+    # Makes no network requests so it can be shared by sync and async engines
+    noLinkArtist = False
+    noLinkSong = False
+    post_artist = post_info[0]
+    post_song = post_info[1]
+    link_artist = link_info[0]
+    link_song = link_info[1]
+    if link_artist is not None:
+        link_artist_lower = link_artist.lower()
+    if link_song is not None:
+        link_song_lower = link_song.lower()
+    post_artist_lower = post_artist.lower()
+    post_song_lower = post_song.lower()
+    if link_artist is None:
+        # auto-generated YouTube channel "Various Artist - Topic"
+        # artist unknown until YouTube API enabled, song is known
+        noLinkArtist = True
+        if link_song_lower not in post_song_lower or post_song_lower not in link_song_lower:
+            # Report submission for link info not matching post info
+            text = "Song: \"{}\" does not match Linked Song: \"{}\""
+            vars = [post_song, link_song]
+            return [text, vars, noLinkArtist, noLinkSong]
+    elif link_song is None:
+        # YouTube video title didn't match regex, so link_artist is full video title
+        # Can check post_info against this info
+        noLinkSong = True
+        video_title = link_artist
+        if post_artist_lower not in video_title.lower() or post_song_lower not in video_title.lower():
+            # Report submission for artist or song in post title not found in link title
+            text = "Artist: \"{}\" or Song: \"{}\" does not match Title: \"{}\""
+            vars = [post_artist, post_song, video_title]
+            return [text, vars, noLinkArtist, noLinkSong]
+    elif post_artist_lower not in link_artist_lower and link_artist_lower not in post_artist_lower:
+        try:
+            link_title = submission.media['oembed']['title']
+        except KeyError:
+            link_title = submission.media.oembed.title
+        if post_artist_lower not in link_title.lower():
+            # Report submission for artist or song in post title not found in link title
+            text = "Artist: \"{}\" or Song: \"{}\" does not match Title: \"{} -- {}\""
+            vars = [post_artist, post_song, link_artist, link_song]
+            return [text, vars, noLinkArtist, noLinkSong]
+    elif post_song_lower not in link_song_lower and link_song_lower not in post_song_lower:
+        try:
+            link_title = submission.media['oembed']['title']
+        except KeyError:
+            link_title = submission.media.oembed.title
+        if post_song_lower not in link_title.lower():
+            # Report submission for artist or song in post title not found in link title
+            text = "Artist: \"{}\" or Song: \"{}\" does not match Title: \"{} -- {}\""
+            vars = [post_artist, post_song, link_artist, link_song]
+            return [text, vars, noLinkArtist, noLinkSong]
+    return None
+
+
+def check_lastfm_match(lastfm_results, link_info, noLinkArtist, noLinkSong):
+    # Return True if a last.fm result matches the link info
+    # A match means the post title has a typo and will not be reported
+    link_artist = link_info[0]
+    link_song = link_info[1]
+    for result in lastfm_results:
+        # Check against search results for possible typo in title
+        title = title_parser.LASTFM_RESULT_PATTERN.search(str(result))
+        artist_lower = title.group(1).lower()
+        song_lower = title.group(2).lower()
+        if noLinkArtist:
+            if song_lower in link_song.lower() or link_song.lower() in song_lower:
+                return True
+        elif noLinkSong:
+            video_title_lower = link_artist.lower()
+            if artist_lower in video_title_lower and song_lower in video_title_lower:
+                return True
+        else:
+            if artist_lower in link_artist.lower() and song_lower in link_song.lower():
+                return True
+            elif link_artist.lower() in artist_lower and link_song.lower() in song_lower:
+                return True
+    return False
+
+
+def get_title_query(post_title_split):
+    # Returns ["artist -- song", "'artist' 'song'"] used to compare and search titles
     if post_title_split[1] is None:
         post_title = post_title_split[0]
         title_query = "'" + post_title_split[0] + "'"
     else:
         post_title = post_title_split[0] + " -- " + post_title_split[1]
         title_query = "'" + post_title_split[0] + "' '" + post_title_split[1] + "'"
-    # log.info("Cross-checking Url: \"{}\" and Title: \"{}\" with older posts".format(post_url, post_title))
-    # POSSIBILITY OF REVERSE TITLE LIKE *SONG - ARTIST*
-    # Method is probably neutered because failed get_post_title() will not match "artist -- song"
-    # for old_submission in stored_posts:
-        # CHECK IF OLD SUBMISSION HAS BEEN REMOVED
-    #    old_post_url = get_url(old_submission)
-    #    if post_url in old_post_url:
-    #        log.info("Url match of \"{}\" and \"{}\"".format(post_url, old_post_url))
-    #        rule_six_month(reddit, submission, old_submission)
-    #        break
-    #    else:
-    #        old_post_title_split = get_post_title(old_submission)
-    #        if old_post_title_split[1] is None:
-    #            old_post_title = old_post_title_split[0]
-    #        else:
-    #            old_post_title = old_post_title_split[0] + " -- " + old_post_title_split[1]
-    #        check both ways incase one title has extra (descriptors) that weren't caught in get_post_title()
-    #        if post_title.lower() in old_post_title.lower() or old_post_title.lower() in post_title.lower():
-    #            log.info("Title match of \"{}\" and \"{}\"".format(post_title, old_post_title))
-    #            rule_six_month(reddit, submission, old_submission)
-    #            break
-    # Compare submission to search results
-    # Only happens if previous stored_posts check found no match
-    # May prioritize a reddit search before list check if it's efficient
-    log.info("Searching for Url: \"{}\" and Title: \"{}\" in subreddit".format(post_url, post_title))
-    post_title_lower = post_title.replace(" -- ", " ").lower()
-    try:
-        query = post_url
-        context = "url"
-        search_listing = get_reddit_search_listing(reddit, context, query)
-        for search_result in search_listing:
-            if not check_archived(search_result) and search_result.id is not submission.id and check_more_recent(submission, search_result):
-                result_url = get_url(search_result)
-                if result_url is post_url:
-                    log.info("Url match of \"{}\" and \"{}\"".format(post_url, result_url))
-                    rule_six_month(reddit, submission, search_result)
-                    break
-        search_listing = None
-        # try search by removing possible "(extra info)" info from the title with regex
-        context = "title"
-        search_listing = get_reddit_search_listing(reddit, context, title_query)
-        for search_result in search_listing:
-            # extraneous request to fix lazy object
-            result_url = get_url(search_result)
-            if submission.id not in search_result.id:
-                if not check_archived(search_result) and check_more_recent(submission, search_result):
-                    result_title_split = get_post_title(search_result)
-                    if result_title_split[1] is None:
-                        result_title = result_title_split[0]
-                    else:
-                        result_title = result_title_split[0] + " -- " + result_title_split[1]
-                    log.info("Comparing to Post: {} with Title: \"{}\"".format(search_result.id, result_title))
-                    result_title_lower = result_title.replace(" -- ", " ").lower()
-                    # check both ways incase one title has extra (descriptors) that weren't caught in get_post_title()
-                    if post_title_lower in result_title_lower or result_title_lower in post_title_lower:
-                        log.info("Title match of \"{}\" and \"{}\"".format(post_title, result_title))
-                        rule_six_month(reddit, submission, search_result)
-                        break
-    except prawcore.exceptions.ServerError as e:
-        # HTTP Exception, will skip current search
-        # e._raw.status_code will show 503, etc.
-        log.error("Exception in reddit search: %s", e, exc_info=True)
+    return [post_title, title_query]
+
+
+def check_url_result(submission, post_url, search_result):
+    # Return True if url search result is an older post of the same media
+    if not check_archived(search_result) and not search_result.removed and search_result.id != submission.id and check_more_recent(submission, search_result):
+        result_url = get_url(search_result)
+        if media_url.get_media_key(search_result.url) == media_url.get_media_key(submission.url):
+            log.info("Url match of \"{}\" and \"{}\"".format(post_url, result_url))
+            return True
+    return False
+
+
+def check_distinguishing_word(word):
+    return word in DISTINGUISHING_WORDS or (word.isdigit() and len(word) < 4) or ROMAN_NUMERAL_PATTERN.fullmatch(word) is not None
+
+
+def get_title_words(text):
+    return TITLE_WORD_PATTERN.findall(title_parser.get_unicode_normalized(text).lower())
+
+
+def get_distinguishing_words(title):
+    # Sorted part numbers and version markers of the song and its version tags
+    # "Dream Theater - Metropolis Pt. 2 (Live)" -> ["2", "live", "pt"]
+    # Bracketed text is a version tag if it starts or ends with a marker, "(Live at Budokan)" but not
+    # "(I think this is their best song)", other comments are left out
+    parsed = title_parser.parse_post_title(title)
+    song = title if parsed.song is None else parsed.song
+    words = [word for word in get_title_words(title_parser.BRACKETED_PATTERN.sub(" ", song))
+             if check_distinguishing_word(word)]
+    for tag in title_parser.BRACKETED_PATTERN.findall(song + " " + (parsed.extras or "")):
+        tag_words = get_title_words(tag)
+        if tag_words and (check_distinguishing_word(tag_words[0]) or check_distinguishing_word(tag_words[-1])):
+            words.extend(word for word in tag_words if check_distinguishing_word(word))
+    return sorted(words)
+
+
+def check_same_version(title_1, title_2):
+    # Return True if both titles have the same part numbers and version markers
+    return get_distinguishing_words(title_1) == get_distinguishing_words(title_2)
+
+
+def check_similar_title(post_keys, title, result_keys, result_title):
+    # Return True if titles are probably the same song with small spelling differences
+    # Keys are [artist key, song key] of post_record, artists have to match,
+    # "Parabol" and "Parabola" or "Anesthetize" and "Anesthetize Part 2" do not
+    if post_keys[1] is None or result_keys[1] is None or post_keys[0] != result_keys[0]:
+        return False
+    similarity = minhash.get_similarity(post_keys[1], result_keys[1], padded=True)
+    return similarity >= settings.SONG_SIMILARITY_THRESHOLD and check_same_version(title, result_title)
+
+
+def check_contains_words(text, words):
+    # Return True if words are in text and not part of longer words
+    return re.search(r'(?<!\w)' + re.escape(words) + r'(?!\w)', text) is not None
+
+
+def check_title_result(submission, post_title, search_result):
+    # Return "title" if title search result is an older post of the same artist and song
+    # Return "similar" if it is an older post of the same artist and a similar song title, None otherwise
+    if submission.id not in search_result.id:
+        if not check_archived(search_result) and not search_result.removed and check_more_recent(submission, search_result):
+            result_info = get_post_title(search_result)
+            result_title = get_title_query(result_info)[0]
+            log.info("Comparing to Post: {} with Title: \"{}\"".format(search_result.id, result_title))
+            post_title_lower = post_title.replace(" -- ", " ").lower()
+            result_title_lower = result_title.replace(" -- ", " ").lower()
+            # check both ways incase one title has extra (descriptors) that weren't caught in get_post_title()
+            if check_contains_words(result_title_lower, post_title_lower) or check_contains_words(post_title_lower, result_title_lower):
+                if check_same_version(submission.title, search_result.title):
+                    log.info("Title match of \"{}\" and \"{}\"".format(post_title, result_title))
+                    return "title"
+                return None
+            # near-duplicate titles with small spelling differences
+            record = post_record.get_post_record(submission)
+            if check_similar_title([record.artist_key, record.song_key], record.title, post_record.get_keys(*result_info),
+                                   search_result.title):
+                log.info("Similar title match of \"{}\" and \"{}\"".format(post_title, result_title))
+                return "similar"
+    return None
 
 
 def purge_old_links(reddit, stored_posts):
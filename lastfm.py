@@ -0,0 +1,54 @@
+import os
+import logging
+import threading
+import pylast
+import settings
+import cache
+import metrics
+import title_parser
+
+
+log = logging.getLogger("bot")
+
+lastfm_network = None
+lastfm_network_lock = threading.Lock()
+# (artist, song) -> list of "Artist - Song" track search results
+track_search_cache = cache.TTLCache(maxsize=settings.LASTFM_CACHE_SIZE, ttl=settings.LASTFM_CACHE_TTL,
+                                    location=settings.LASTFM_CACHE_LOCATION)
+metrics.bot_metrics.register_cache("lastfm", track_search_cache)
+
+
+def get_lastfm_network():
+    # Returns shared LastFMNetwork, created on first use
+    global lastfm_network
+    with lastfm_network_lock:
+        if lastfm_network is None:
+            lastfm_network = pylast.LastFMNetwork(api_key=os.environ['LASTFM_KEY'],
+                                                  api_secret=os.environ['LASTFM_SECRET'])
+    return lastfm_network
+
+
+def get_cache_key(artist, song):
+    # Normalized (artist, song) so differently typed titles share cache entries
+    return (" ".join(title_parser.get_unicode_normalized(artist).lower().split()),
+            " ".join(title_parser.get_unicode_normalized(song).lower().split()))
+
+
+def search_tracks(artist, song):
+    # Returns list of "Artist - Song" strings from first page of last.fm track search
+    key = get_cache_key(artist, song)
+    results = track_search_cache.get(key)
+    if results is None:
+        with metrics.bot_metrics.api_call("lastfm"):
+            search = pylast.TrackSearch(artist, song, get_lastfm_network())
+            results = [str(track) for track in search.get_next_page()]
+        track_search_cache.put(key, results)
+    return results
+
+
+def save_cache():
+    # Persist track search cache if LASTFM_CACHE_LOCATION is set
+    try:
+        track_search_cache.save()
+    except OSError as e:
+        log.error("Exception in saving last.fm cache: %s", e)
@@ -1,17 +1,71 @@
+import json
+import queue
 import logging
+import logging.handlers
 import time
 
 
-def make_logger(logger_name, logfile, logging_level=logging.DEBUG):
+# Listeners of queue-based loggers, stopped by stop_loggers() so queued records are written on exit
+listeners = []
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line
+
+    def format(self, record):
+        entry = {"time": self.formatTime(record, self.datefmt),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "thread": record.threadName,
+                 "message": record.getMessage()}
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    # Listener runs in the same process, so records are queued as is and formatted on the listener thread
+
+    def prepare(self, record):
+        return record
+
+
+def make_logger(logger_name, logfile, logging_level=logging.DEBUG, max_bytes=0, backup_count=0,
+                use_queue=False, json_format=False):
+    # File and console logger
+    # max_bytes > 0 rotates logfile keeping backup_count old files
+    # use_queue writes records on a background listener thread so logging calls never wait on I/O
+    # json_format writes the file as JSON lines, console output stays plain text
     logger = logging.getLogger(logger_name)
     logger.setLevel(logging_level)
     formatter = logging.Formatter('%(levelname)s - %(name)s - %(asctime)s - %(message)s', '%Y-%m-%d %H:%M:%S')
     formatter.converter = time.localtime
-    fh = logging.FileHandler(logfile)
+    if max_bytes > 0:
+        fh = logging.handlers.RotatingFileHandler(logfile, maxBytes=max_bytes, backupCount=backup_count)
+    else:
+        fh = logging.FileHandler(logfile)
     fh.setLevel(logging_level)
-    fh.setFormatter(formatter)
+    if json_format:
+        json_formatter = JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S')
+        json_formatter.converter = time.localtime
+        fh.setFormatter(json_formatter)
+    else:
+        fh.setFormatter(formatter)
     ch = logging.StreamHandler()
     ch.setFormatter(formatter)
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, fh, ch, respect_handler_level=True)
+        listener.start()
+        listeners.append(listener)
+        logger.addHandler(LocalQueueHandler(log_queue))
+    else:
+        logger.addHandler(fh)
+        logger.addHandler(ch)
     return logger
+
+
+def stop_loggers():
+    # Write out queued records and stop listener threads
+    while listeners:
+        listeners.pop().stop()
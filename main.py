@@ -2,8 +2,18 @@
 import praw
 import musicbrainzngs
 import time
+import asyncio
+import backoff
 import interface
+import lastfm
+import metrics
+import musicbrainz
+import outbox
 import settings
+import submission_pipeline
+import subreddit_shard
+import thread_reddit
+import youtube
 import logging
 import logger
 import os
@@ -18,16 +28,18 @@ from pathlib import Path
 env = os.environ
 load_dotenv()
 
-# The time in seconds the bot should sleep until it checks again.
-SLEEP = 600
-
 # LOGGING CONFIGURATION
 LOG_FILENAME = "bot.log"
 LOG_FILE_BACKUPCOUNT = 5
 LOG_FILE_MAXSIZE = 1024 * 256
+# Write log records on a background thread so logging never stalls submission processing
+LOG_QUEUE = True
+# Write bot.log as JSON lines
+LOG_JSON = env.get('LOG_JSON', '') == '1'
 
 # LOGGING SETUP
-log = logger.make_logger("bot", LOG_FILENAME, logging_level=logging.DEBUG)
+log = logger.make_logger("bot", LOG_FILENAME, logging_level=logging.DEBUG, max_bytes=LOG_FILE_MAXSIZE,
+                         backup_count=LOG_FILE_BACKUPCOUNT, use_queue=LOG_QUEUE, json_format=LOG_JSON)
 
 
 # MAIN PROCEDURE
@@ -35,12 +47,14 @@ def run_bot():
     # -- progmetalbot useragent and version --
     app_useragent_version = env['APP_USERAGENT'] + ' ' + env['APP_VERSION'] + " by u/" + settings.USER_TO_MESSAGE
     # -- praw --
-    reddit = praw.Reddit(user_agent=app_useragent_version,
-                         client_id=env['REDDIT_CLIENT_ID'],
-                         client_secret=env['REDDIT_CLIENT_SECRET'],
-                         password=env['REDDIT_PASSWORD'],
-                         username=env['REDDIT_USERNAME'])
-    subreddit = reddit.subreddit(settings.REDDIT_SUBREDDIT)
+    reddit_kwargs = {'user_agent': app_useragent_version,
+                     'client_id': env['REDDIT_CLIENT_ID'],
+                     'client_secret': env['REDDIT_CLIENT_SECRET'],
+                     'password': env['REDDIT_PASSWORD'],
+                     'username': env['REDDIT_USERNAME']}
+    reddit = praw.Reddit(**reddit_kwargs)
+    # Worker threads each get their own instance, praw is not thread safe
+    thread_reddit.set_factory(lambda: praw.Reddit(**reddit_kwargs))
     # -- musicbrainz --
     musicbrainzngs.auth(env['MUSICBRAINZ_USERNAME'],
                         env['MUSICBRAINZ_PASSWORD'])
@@ -56,64 +70,102 @@ def run_bot():
     # s3 = boto3.resource('s3')
 
     # log.info("Python platform: {}".format(platform.python_version()))
-    log.info("Starting bot \"{}\" for subreddit {}".format(app_useragent_version, settings.REDDIT_SUBREDDIT))
+    # One process moderates every subreddit, each with its own post store, repost index and checkpoint
+    shards = subreddit_shard.ShardSet(subreddit_shard.get_subreddit_names(env.get('BOT_SUBREDDITS')))
+    log.info("Starting bot \"{}\" for subreddits {}".format(app_useragent_version, shards.get_stream_name()))
+    metrics.start_metrics_server()
     interface.unhide_posts(reddit)
-    # log.info("Gathering posts from subreddit %s", settings.REDDIT_SUBREDDIT)
-    # stored_posts = interface.initialize_link_array(reddit)
-    while True:
+    outbox.start_outbox(reddit)
+    shards.load(reddit)
+    engine = env.get('BOT_ENGINE', settings.ENGINE)
+    log.info("Using %s engine", engine)
+    if engine == "async":
+        # asyncpraw and aiohttp are only needed for this engine
+        import async_engine
+        musicbrainz_user_agent = "{}/{} ( {} )".format(env['APP_USERAGENT'], env['APP_VERSION'], env['CONTACT_EMAIL'])
         try:
-            log.info("Reading stream of submissions for subreddit %s", settings.REDDIT_SUBREDDIT)
-            for submission in subreddit.stream.submissions():
-                # Checks submission for accurate title/link info
-                #   If submission is not from music domain, does not get checked
-                # Checks submission against posts from last 6 months
-                # Adds submission to list after both checks
-                if not interface.check_archived(submission) and interface.check_age_days(submission) and not interface.check_reported(submission):
-                    # log.info("Found new post {} in subreddit {}".format(submission, settings.REDDIT_SUBREDDIT))
-                    if interface.check_self(submission):
-                        log.info("Found new self Submission: {} in Subreddit: {}".format(submission, settings.REDDIT_SUBREDDIT))
-                        interface.check_selfpost(reddit, submission)
-                    else:
-                        log.info("Found new link Submission: {} in Subreddit: {}".format(submission, settings.REDDIT_SUBREDDIT))
-                        # print(vars(submission))
-                        if interface.check_crosspost(submission):
-                            # Link submission is a crosspost
-                            # Merge embeded media information from parent into crosspost for checking
-                            log.info("Submission is crosspost; merging media information")
-                            submission = interface.merge_crosspost_parent(reddit, submission)
-                        if not interface.check_embed(submission):
-                            # Link submission does not have embeded media information to use for submission checking
-                            log.info("Link Submission: {} has no embedded media, will skip".format(submission))
-                            continue
-                        bool_post = interface.check_submission(reddit, submission)
-                        if bool_post:
-                            # interface.check_list(reddit, submission, stored_posts)
-                            interface.check_list(reddit, submission)
-                        # stored_posts.append(submission)
-                        log.info("Checks complete for submission: {}".format(submission))
+            asyncio.run(async_engine.run_bot(reddit_kwargs, shards, musicbrainz_user_agent))
+        except KeyboardInterrupt:
+            pass
+        lastfm.save_cache()
+        youtube.save_cache()
+        musicbrainz.get_musicbrainz_service().shutdown()
+        outbox.stop_outbox()
+        shards.close()
+        return
 
-                # Only checks submission for accurate title/link info
-                # if interface.check_post(submission):
-                #    log.info("Found new post %s in subreddit %s", submission, settings.REDDIT_SUBREDDIT)
-                #    interface.check_submission(reddit, submission)
+    def handle(submission):
+        shard = shards.get(submission)
+        if shard is None:
+            log.info("Submission {} is not from a moderated subreddit, will skip".format(submission))
+            return
+        # Submissions replayed by the stream after a restart were already checked
+        if shard.stream_checkpoint.is_processed(submission):
+            return
+        interface.process_submission(reddit, submission, shard.posts_index, shard.store)
+        shard.stream_checkpoint.mark_processed(submission)
+
+    if engine == "pipeline":
+        pipeline = submission_pipeline.SubmissionPipeline(handle)
+        pipeline.start()
+        # Blocks when workers fall behind
+        dispatch = pipeline.submit
+    else:
+        pipeline = None
+        dispatch = handle
+    stream_backoff = backoff.Backoff()
+    while True:
+        try:
+            # Catch up on submissions made while the bot was down or backing off
+            missed = shards.get_missed_submissions(reddit)
+            # Crosspost parents of all missed submissions in one request
+            interface.merge_crosspost_parents(reddit, missed)
+            # YouTube metadata of all missed submissions in batches of 50
+            youtube.prefetch_videos([video_id for video_id in map(interface.get_youtube_video_id, missed)
+                                     if video_id is not None])
+            for submission in missed:
+                dispatch(submission)
+            log.info("Reading stream of submissions for subreddits %s", shards.get_stream_name())
+            subreddit = reddit.subreddit(shards.get_stream_name())
+            for submission in metrics.timed_iter(subreddit.stream.submissions(), "stream_fetch"):
+                stream_backoff.reset()
+                dispatch(submission)
 
             # Write stored posts to a file
             # interface.update_stored_posts(reddit, stored_posts)
 
         # Allows the bot to exit on ^C, all other exceptions are ignored
         except KeyboardInterrupt:
+            lastfm.save_cache()
+            youtube.save_cache()
+            if pipeline is not None:
+                pipeline.stop()
+            musicbrainz.get_musicbrainz_service().shutdown()
+            outbox.stop_outbox()
+            shards.close()
             break
         except Exception as e:
             log.error("Exception in submission stream: %s", e, exc_info=True)
-            try:
-                log.info("Alerting admin")
-                reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalBot", "Bot had an exception {}, help!".format(e))
-            except Exception as e:
-                log.error("Exception in messaging admin: %s", e, exc_info=True)
-        log.info("sleep for %s s", SLEEP)
-        time.sleep(SLEEP)
+            metrics.bot_metrics.increment("api_errors_total", [("api", "reddit_stream")])
+            lastfm.save_cache()
+            youtube.save_cache()
+            musicbrainz.get_musicbrainz_service().save_cache()
+            shards.save()
+            # Only the first exception of a failure streak alerts the admin
+            if stream_backoff.attempt == 0:
+                try:
+                    log.info("Alerting admin")
+                    reddit.redditor(settings.USER_TO_MESSAGE).message("ProgMetalBot", "Bot had an exception {}, help!".format(e))
+                except Exception as e:
+                    log.error("Exception in messaging admin: %s", e, exc_info=True)
+        delay = stream_backoff.next_delay()
+        log.info("sleep for %.1f s", delay)
+        time.sleep(delay)
 
 
 # START BOT
 if __name__ == "__main__":
-    run_bot()
+    try:
+        run_bot()
+    finally:
+        logger.stop_loggers()
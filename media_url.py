@@ -0,0 +1,98 @@
+import re
+import functools
+import collections
+import urllib.parse
+
+
+# Canonical key of the media a link points to, so reposts of the same media match exactly
+# whatever url form, host alias or tracking parameters the link was posted with
+MediaKey = collections.namedtuple("MediaKey", ["platform", "kind", "id"])
+
+MEDIA_KEY_CACHE_SIZE = 4096
+YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com", "gaming.youtube.com"}
+YOUTUBE_ID_PATTERN = re.compile(r'^[\w-]{11}$')
+# /shorts/<id>, /embed/<id>, /v/<id>, /live/<id>
+YOUTUBE_PATH_PATTERN = re.compile(r'^/(?:shorts|embed|v|live|e)/([\w-]{11})')
+SPOTIFY_HOSTS = {"open.spotify.com", "play.spotify.com"}
+# Optional /intl-xx/ locale prefix before the type
+SPOTIFY_PATH_PATTERN = re.compile(r'^/(?:intl-[\w-]+/)?(track|album|playlist|artist|episode|show)/([A-Za-z0-9]{22})')
+SPOTIFY_URI_PATTERN = re.compile(r'^spotify:(track|album|playlist|artist|episode|show):([A-Za-z0-9]{22})$')
+BANDCAMP_PATH_PATTERN = re.compile(r'^/(track|album)/([\w-]+)')
+SOUNDCLOUD_HOSTS = {"soundcloud.com", "m.soundcloud.com"}
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {"si", "feature", "fbclid", "gclid", "igshid", "ref", "ref_src", "context", "nd", "pp", "ab_channel",
+                   "app", "in_source", "from", "share"}
+
+
+def get_host(netloc):
+    host = netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def strip_tracking(query):
+    # Returns sorted query string without tracking parameters
+    params = [(key, value) for key, value in urllib.parse.parse_qsl(query, keep_blank_values=True)
+              if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")]
+    return urllib.parse.urlencode(sorted(params))
+
+
+def get_youtube_key(host, path, query):
+    if host == "youtu.be":
+        video_id = path.strip("/").split("/", 1)[0]
+        if YOUTUBE_ID_PATTERN.match(video_id):
+            return MediaKey("youtube", "video", video_id)
+        return None
+    params = urllib.parse.parse_qs(query)
+    if path in ("/watch", "/watch/") and YOUTUBE_ID_PATTERN.match(params.get("v", [""])[0]):
+        return MediaKey("youtube", "video", params["v"][0])
+    match = YOUTUBE_PATH_PATTERN.match(path)
+    if match is not None:
+        return MediaKey("youtube", "video", match.group(1))
+    if path in ("/playlist", "/playlist/") and params.get("list"):
+        return MediaKey("youtube", "playlist", params["list"][0])
+    return None
+
+
+@functools.lru_cache(maxsize=MEDIA_KEY_CACHE_SIZE)
+def get_media_key(url):
+    # Returns MediaKey(platform, kind, id) for url
+    # Links to unsupported pages get MediaKey("other", "url", url without scheme, www. and tracking parameters)
+    url = url.strip()
+    match = SPOTIFY_URI_PATTERN.match(url)
+    if match is not None:
+        return MediaKey("spotify", match.group(1), match.group(2))
+    if "://" not in url:
+        url = "https://" + url
+    parts = urllib.parse.urlsplit(url)
+    host = get_host(parts.netloc)
+    path = parts.path
+    key = None
+    if host in YOUTUBE_HOSTS or host == "youtu.be":
+        key = get_youtube_key(host, path, parts.query)
+    elif host in SPOTIFY_HOSTS:
+        match = SPOTIFY_PATH_PATTERN.match(path)
+        if match is not None:
+            key = MediaKey("spotify", match.group(1), match.group(2))
+    elif host.endswith(".bandcamp.com"):
+        match = BANDCAMP_PATH_PATTERN.match(path)
+        if match is not None:
+            key = MediaKey("bandcamp", match.group(1), host[:-len(".bandcamp.com")] + "/" + match.group(2).lower())
+    elif host in SOUNDCLOUD_HOSTS:
+        segments = [segment for segment in path.lower().split("/") if segment]
+        if len(segments) == 3 and segments[1] == "sets":
+            key = MediaKey("soundcloud", "set", segments[0] + "/" + segments[2])
+        elif len(segments) == 2 and segments[1] not in ("tracks", "sets", "albums", "likes", "reposts"):
+            key = MediaKey("soundcloud", "track", segments[0] + "/" + segments[1])
+    elif host == "on.soundcloud.com":
+        key = MediaKey("soundcloud", "short", path.strip("/"))
+    if key is None:
+        query = strip_tracking(parts.query)
+        key = MediaKey("other", "url", host + path.rstrip("/") + ("?" + query if query else ""))
+    return key
+
+
+def get_media_id(url):
+    # Returns "platform:kind:id" string of the media key, used as index and store key
+    return ":".join(get_media_key(url))
@@ -0,0 +1,199 @@
+import time
+import bisect
+import logging
+import functools
+import threading
+import contextlib
+import collections
+import http.server
+import settings
+
+
+log = logging.getLogger("bot")
+
+# Stage timings, API error rates, decision delay and cache hits and misses in Prometheus text format
+# Served on http://METRICS_HOST:METRICS_PORT/metrics
+PREFIX = "progmetalbot_"
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DELAY_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # counts[i] is samples <= buckets[i] and > buckets[i - 1], last is above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def get_labels(labels):
+    # Prometheus label set from list of (name, value)
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append("{}=\"{}\"".format(name, value))
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    # Thread-safe counters and histograms
+    # time(stage) works like timing.StageTimer.time so it can be passed as a rules timer
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.decision_delay = Histogram(DELAY_BUCKETS)
+        # name -> cache.TTLCache whose hits, misses and size are exported
+        self.caches = collections.OrderedDict()
+
+    def observe_stage(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(STAGE_BUCKETS)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+
+    def increment(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def count(self, name, label):
+        # Timer interface used by rules.evaluate for rule violations
+        self.increment(name, [("rule", label)])
+
+    @contextlib.contextmanager
+    def api_call(self, api):
+        # Counts a request to an external API and its exception if one is raised
+        self.increment("api_requests_total", [("api", api)])
+        try:
+            yield
+        except Exception:
+            self.increment("api_errors_total", [("api", api)])
+            raise
+
+    def register_cache(self, name, ttl_cache):
+        with self.lock:
+            self.caches[name] = ttl_cache
+
+    def observe_decision(self, submission):
+        # Delay from submission creation to the bot's decision
+        with self.lock:
+            self.decision_delay.observe(max(0.0, time.time() - submission.created_utc))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append("# TYPE {}stage_seconds histogram".format(PREFIX))
+            for stage, histogram in self.stages.items():
+                lines.extend(render_histogram(PREFIX + "stage_seconds", [("stage", stage)], histogram))
+            lines.append("# TYPE {}decision_delay_seconds histogram".format(PREFIX))
+            lines.extend(render_histogram(PREFIX + "decision_delay_seconds", [], self.decision_delay))
+            typed = set()
+            for (name, labels), value in self.counters.items():
+                if name not in typed:
+                    lines.append("# TYPE {}{} counter".format(PREFIX, name))
+                    typed.add(name)
+                lines.append("{}{}{} {}".format(PREFIX, name, get_labels(labels), value))
+            lines.extend(render_caches(self.caches))
+        return "\n".join(lines) + "\n"
+
+
+def render_caches(caches):
+    # Hits and misses of each registered cache as counters, entries as a gauge
+    if not caches:
+        return []
+    stats = [(get_labels([("cache", name)]), ttl_cache.stats()) for name, ttl_cache in caches.items()]
+    lines = []
+    for metric, metric_type, key in (("cache_hits_total", "counter", "hits"), ("cache_misses_total", "counter", "misses"),
+                                     ("cache_entries", "gauge", "size")):
+        lines.append("# TYPE {}{} {}".format(PREFIX, metric, metric_type))
+        lines.extend("{}{}{} {}".format(PREFIX, metric, labels, stat[key]) for labels, stat in stats)
+    return lines
+
+
+def render_histogram(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bucket, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append("{}_bucket{} {}".format(name, get_labels(labels + [("le", bucket)]), cumulative))
+    lines.append("{}_bucket{} {}".format(name, get_labels(labels + [("le", "+Inf")]), histogram.count))
+    lines.append("{}_sum{} {}".format(name, get_labels(labels), histogram.sum))
+    lines.append("{}_count{} {}".format(name, get_labels(labels), histogram.count))
+    return lines
+
+
+bot_metrics = Metrics()
+
+
+def timed(stage):
+    # Decorator recording wall time of every call as stage
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with bot_metrics.time(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(iterable, stage):
+    # Yields from iterable recording time waited for each item as stage
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        bot_metrics.observe_stage(stage, time.perf_counter() - start)
+        yield item
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = bot_metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not logged
+        pass
+
+
+def start_metrics_server(host=settings.METRICS_HOST, port=settings.METRICS_PORT):
+    # Serve metrics on a background thread, returns server or None if disabled
+    if port is None:
+        return None
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    log.info("Serving metrics on http://{}:{}/metrics".format(host, server.server_address[1]))
+    return server
@@ -0,0 +1,126 @@
+import re
+import zlib
+import random
+import collections
+import settings
+
+
+# MinHash signatures of character shingles, banded into an LSH table
+# Strings sharing any band are candidates, candidates are confirmed by exact Jaccard similarity of shingles
+# Probability a pair with similarity s becomes a candidate is 1 - (1 - s^rows)^bands
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+# Shingles and bands kept for recently hashed texts
+ENTRY_CACHE_SIZE = 256
+
+
+def get_shingles(text, size=settings.SHINGLE_SIZE, padded=False):
+    # Set of character shingles of text with punctuation and separators collapsed to one space
+    # padded adds a space at both ends so the first and last letters are in as many shingles as the others
+    text = NON_WORD_PATTERN.sub(" ", text.lower()).strip()
+    if padded:
+        text = " " + text + " "
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def get_jaccard(shingles_1, shingles_2):
+    if not shingles_1 or not shingles_2:
+        return 0.0
+    return len(shingles_1 & shingles_2) / len(shingles_1 | shingles_2)
+
+
+def get_similarity(text_1, text_2, padded=False):
+    # Jaccard similarity of shingles of two strings
+    return get_jaccard(get_shingles(text_1, padded=padded), get_shingles(text_2, padded=padded))
+
+
+class MinHashLSH:
+    # Near-duplicate index of strings by key
+    # query() only compares against keys sharing an LSH band, not every stored string
+
+    def __init__(self, threshold=settings.REPOST_SIMILARITY_THRESHOLD, permutations=settings.MINHASH_PERMUTATIONS,
+                 bands=settings.MINHASH_BANDS, shingle_size=settings.SHINGLE_SIZE, seed=1, cache_size=ENTRY_CACHE_SIZE):
+        if permutations % bands != 0:
+            raise ValueError("MinHash permutations {} not divisible by bands {}".format(permutations, bands))
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingle_size = shingle_size
+        # Fixed seed so signatures are the same between runs
+        generator = random.Random(seed)
+        self.permutations = [(generator.randint(1, MERSENNE_PRIME - 1), generator.randint(0, MERSENNE_PRIME - 1))
+                             for i in range(permutations)]
+        # One bucket table per band: band signature -> set of keys
+        self.tables = [{} for i in range(bands)]
+        # key -> (shingles, band signatures)
+        self.entries = {}
+        # text -> (shingles, band signatures) of recent texts, so query() then add() of a title hashes it once
+        self.entry_cache = collections.OrderedDict()
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_signature(self, shingles):
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        return [min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes) for a, b in self.permutations]
+
+    def get_bands(self, shingles):
+        signature = self.get_signature(shingles)
+        return [tuple(signature[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+    def get_entry(self, text):
+        # Returns (shingles, band signatures) of text
+        entry = self.entry_cache.get(text)
+        if entry is not None:
+            self.entry_cache.move_to_end(text)
+            return entry
+        shingles = get_shingles(text, self.shingle_size)
+        entry = (shingles, self.get_bands(shingles))
+        self.entry_cache[text] = entry
+        if len(self.entry_cache) > self.cache_size:
+            self.entry_cache.popitem(last=False)
+        return entry
+
+    def preload(self, entries):
+        # Add dict of text -> (shingles, band signatures) computed elsewhere, e.g. in worker processes
+        self.entry_cache.update(entries)
+        self.cache_size = max(self.cache_size, len(self.entry_cache))
+
+    def add(self, key, text):
+        if key in self.entries:
+            self.remove(key)
+        shingles, bands = self.get_entry(text)
+        self.entries[key] = (shingles, bands)
+        for table, band in zip(self.tables, bands):
+            table.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for table, band in zip(self.tables, entry[1]):
+            bucket = table.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[band]
+
+    def query(self, text, threshold=None):
+        # Returns list of [similarity, key] with similarity >= threshold, most similar first
+        if threshold is None:
+            threshold = self.threshold
+        shingles, bands = self.get_entry(text)
+        candidates = set()
+        for table, band in zip(self.tables, bands):
+            candidates.update(table.get(band, ()))
+        matches = []
+        for key in candidates:
+            similarity = get_jaccard(shingles, self.entries[key][0])
+            if similarity >= threshold:
+                matches.append([similarity, key])
+        matches.sort(key=lambda match: -match[0])
+        return matches
@@ -0,0 +1,143 @@
+import time
+import logging
+import threading
+import concurrent.futures
+import musicbrainzngs
+import settings
+import cache
+import metrics
+import title_parser
+
+
+log = logging.getLogger("bot")
+
+
+class TokenBucket:
+    # Token bucket rate limiter, acquire() blocks until a token is available
+    # MusicBrainz allows 1 request per second
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class MusicBrainzService:
+    # Rate limited and cached MusicBrainz lookups
+    # Identical queries already in flight share one request
+    # search_* methods block, submit_* methods return a concurrent.futures.Future
+
+    def __init__(self, rate=settings.MUSICBRAINZ_RATE, cache_location=settings.MUSICBRAINZ_CACHE_LOCATION,
+                 cache_size=settings.MUSICBRAINZ_CACHE_SIZE, cache_ttl=settings.MUSICBRAINZ_CACHE_TTL):
+        self.bucket = TokenBucket(rate)
+        self.results = cache.TTLCache(maxsize=cache_size, ttl=cache_ttl, location=cache_location)
+        # Requests are serialized by the rate limit anyway
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="musicbrainz")
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.save_cache()
+
+    def save_cache(self):
+        try:
+            self.results.save()
+        except OSError as e:
+            log.error("Exception in saving musicbrainz cache: %s", e)
+
+    def submit(self, key, function):
+        # Returns future for key, coalescing with a cached or in-flight query
+        result = self.results.get(key)
+        if result is not None:
+            future = concurrent.futures.Future()
+            future.set_result(result)
+            return future
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.executor.submit(self.run, key, function)
+                self.in_flight[key] = future
+        return future
+
+    def run(self, key, function):
+        try:
+            result = self.results.get(key, count=False)
+            if result is None:
+                self.bucket.acquire()
+                with metrics.bot_metrics.api_call("musicbrainz"):
+                    result = function()
+                self.results.put(key, result)
+            return result
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def submit_recording_search(self, artist, song):
+        key = ("recording", normalize(artist), normalize(song))
+        return self.submit(key, lambda: get_recording_summary(musicbrainzngs.search_recordings(artist=artist, recording=song)))
+
+    def submit_artist_search(self, artist):
+        key = ("artist", normalize(artist))
+        return self.submit(key, lambda: get_artist_summary(musicbrainzngs.search_artists(artist=artist)))
+
+    def search_recordings(self, artist, song):
+        return self.submit_recording_search(artist, song).result()
+
+    def search_artists(self, artist):
+        return self.submit_artist_search(artist).result()
+
+    def verify_recording_async(self, artist, song, callback):
+        # Runs callback(result) once recording search finishes without blocking the caller
+        def done(future):
+            try:
+                callback(future.result())
+            except Exception as e:
+                log.error("Exception in musicbrainz verification of \"{} - {}\": {}".format(artist, song, e), exc_info=True)
+        future = self.submit_recording_search(artist, song)
+        future.add_done_callback(done)
+        return future
+
+
+def normalize(text):
+    return " ".join(title_parser.get_unicode_normalized(text).lower().split())
+
+
+def get_recording_summary(result):
+    # Keep only what checks need so cache stays small and json serializable
+    recordings = [{"title": recording.get("title"), "artist": recording.get("artist-credit-phrase")}
+                  for recording in result.get("recording-list", [])]
+    return {"recording-count": result.get("recording-count", len(recordings)), "recording-list": recordings}
+
+
+def get_artist_summary(result):
+    artists = [{"name": artist.get("name"), "id": artist.get("id")} for artist in result.get("artist-list", [])]
+    return {"artist-count": result.get("artist-count", len(artists)), "artist-list": artists}
+
+
+musicbrainz_service = None
+musicbrainz_service_lock = threading.Lock()
+
+
+def get_musicbrainz_service():
+    # Returns shared MusicBrainzService, created on first use
+    global musicbrainz_service
+    with musicbrainz_service_lock:
+        if musicbrainz_service is None:
+            musicbrainz_service = MusicBrainzService()
+            metrics.bot_metrics.register_cache("musicbrainz", musicbrainz_service.results)
+    return musicbrainz_service
@@ -0,0 +1,133 @@
+import time
+import queue
+import logging
+import threading
+import settings
+import thread_reddit
+
+
+log = logging.getLogger("bot")
+
+# Reddit private messages are limited to 10000 characters
+MAX_MESSAGE_LENGTH = 9000
+
+
+class Outbox:
+    # Queues moderator notifications and sends them as one digest message
+    # Flushes every flush_interval seconds or when batch_size notifications are waiting
+    # Sending happens on a background thread with retries so rule checks never wait on a PM
+
+    def __init__(self, reddit, recipient=settings.USER_TO_MESSAGE, flush_interval=settings.OUTBOX_FLUSH_INTERVAL,
+                 batch_size=settings.OUTBOX_BATCH_SIZE, retries=settings.OUTBOX_RETRIES):
+        self.reddit = reddit
+        self.recipient = recipient
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retries = retries
+        self.queue = queue.Queue()
+        self.pending = []
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.work, name="outbox", daemon=True)
+        self.thread.start()
+        log.info("Started outbox flushing every {}s or {} notifications".format(self.flush_interval, self.batch_size))
+
+    def stop(self):
+        # Sends anything still waiting before returning
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def send(self, subject, body):
+        self.queue.put((subject, body))
+
+    def work(self):
+        last_flush = time.time()
+        while True:
+            timeout = max(0, last_flush + self.flush_interval - time.time())
+            try:
+                self.pending.append(self.queue.get(timeout=min(timeout, 1)))
+            except queue.Empty:
+                pass
+            stopping = self.stopping.is_set()
+            if stopping:
+                while not self.queue.empty():
+                    self.pending.append(self.queue.get_nowait())
+            if self.pending and (len(self.pending) >= self.batch_size or time.time() - last_flush >= self.flush_interval or stopping):
+                self.flush()
+                last_flush = time.time()
+            elif not self.pending:
+                last_flush = time.time()
+            if stopping:
+                return
+
+    def flush(self):
+        # Send pending notifications, keep them for next flush if sending fails
+        for count, subject, body in get_digests(self.pending):
+            if not self.deliver(subject, body):
+                return
+            self.pending = self.pending[count:]
+
+    def deliver(self, subject, body):
+        for attempt in range(self.retries):
+            try:
+                thread_reddit.get_reddit(self.reddit).redditor(self.recipient).message(subject, body)
+                return True
+            except Exception as e:
+                log.error("Exception in sending outbox digest (attempt {}): {}".format(attempt + 1, e))
+                time.sleep(2 ** attempt)
+        return False
+
+
+DIGEST_SEPARATOR = "\n\n---\n\n"
+
+
+def get_digests(notifications):
+    # Yields [count, subject, body] digests of notifications, split to fit in a message
+    # A single notification keeps its own subject
+    chunk = []
+    length = 0
+    for subject, body in notifications:
+        item = "**{}**\n\n{}".format(subject, body)
+        if chunk and length + len(item) + len(DIGEST_SEPARATOR) > MAX_MESSAGE_LENGTH:
+            yield get_digest(chunk)
+            chunk = []
+            length = 0
+        chunk.append((subject, body, item))
+        length += len(item) + len(DIGEST_SEPARATOR)
+    if chunk:
+        yield get_digest(chunk)
+
+
+def get_digest(chunk):
+    if len(chunk) == 1:
+        return [1, chunk[0][0], chunk[0][1]]
+    return [len(chunk), "ProgMetalMod: {} notifications".format(len(chunk)), DIGEST_SEPARATOR.join(item for subject, body, item in chunk)]
+
+
+mod_outbox = None
+
+
+def notify(reddit, subject, body):
+    # Queue notification for mods in the outbox, or message directly if outbox is not running
+    if mod_outbox is not None:
+        mod_outbox.send(subject, body)
+    else:
+        reddit.redditor(settings.USER_TO_MESSAGE).message(subject, body)
+
+
+def start_outbox(reddit):
+    global mod_outbox
+    mod_outbox = Outbox(reddit)
+    mod_outbox.start()
+    return mod_outbox
+
+
+def stop_outbox():
+    global mod_outbox
+    if mod_outbox is not None:
+        mod_outbox.stop()
+        mod_outbox = None
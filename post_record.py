@@ -0,0 +1,108 @@
+import settings
+import interface
+import media_url
+import title_parser
+
+
+def get_normalized(text):
+    # Lowercase with diacritics stripped and whitespace collapsed
+    return " ".join(title_parser.get_unicode_normalized(text).lower().split())
+
+
+def get_subreddit_name(submission):
+    # Display name of the subreddit a submission was posted to, REDDIT_SUBREDDIT if not loaded
+    subreddit = vars(submission).get('subreddit')
+    if subreddit is None:
+        return settings.REDDIT_SUBREDDIT
+    return str(subreddit)
+
+
+def get_song_key(song):
+    # Normalized song without bracketed text the title regex left in, "Schism (Live)" -> "schism"
+    # Version tags are compared separately by interface.check_same_version
+    return get_normalized(title_parser.BRACKETED_PATTERN.sub(" ", song)) or get_normalized(song)
+
+
+def get_keys(artist, song):
+    # [artist key, song key] of a parsed title compared by repost checks, None where title could not be split
+    return [None if artist is None else get_normalized(artist), None if song is None else get_song_key(song)]
+
+
+def get_title_key(artist_key, song_key):
+    # Normalized "artist song" string used to match reposts
+    # Returns None if title could not be split into artist and song
+    if artist_key is None or song_key is None:
+        return None
+    return artist_key + " " + song_key
+
+
+class PostRecord:
+    # Fields of a submission used by the checks, read once from the praw object
+    # Has the same attribute names as praw submissions so interface checks work on either
+    # __slots__ keeps memory per post small and fixed for the stored window
+
+    __slots__ = ("id", "name", "created_utc", "url", "domain", "title", "shortlink", "author", "is_self", "selftext",
+                 "media", "archived", "removed", "approved", "mod_reports", "mod_reports_dismissed",
+                 "media_id", "artist", "song", "artist_key", "song_key", "title_key", "subreddit")
+
+    def __init__(self, id, name, created_utc, url, domain="", title="", shortlink=None, author=None, is_self=False,
+                 selftext="", media=None, archived=False, removed=False, approved=False, mod_reports=(),
+                 mod_reports_dismissed=(), media_id=None, artist=None, song=None, subreddit=None):
+        self.id = id
+        self.name = name
+        self.created_utc = created_utc
+        self.url = url
+        self.domain = domain
+        self.title = title
+        self.shortlink = shortlink if shortlink is not None else "https://redd.it/" + id
+        self.author = author
+        self.is_self = is_self
+        self.selftext = selftext
+        self.media = media
+        self.archived = archived
+        self.removed = removed
+        self.approved = approved
+        self.mod_reports = mod_reports
+        self.mod_reports_dismissed = mod_reports_dismissed
+        self.media_id = media_id
+        self.artist = artist
+        self.song = song
+        self.artist_key, self.song_key = get_keys(artist, song)
+        self.title_key = get_title_key(self.artist_key, self.song_key)
+        self.subreddit = subreddit
+
+    def __str__(self):
+        return self.id
+
+    def __repr__(self):
+        return "PostRecord({})".format(self.id)
+
+    def get_stored(self):
+        # Copy without the fields only needed while checking, kept in the repost window
+        return PostRecord(self.id, self.name, self.created_utc, self.url, self.domain, self.title, self.shortlink,
+                          self.author, self.is_self, archived=self.archived, removed=self.removed,
+                          approved=self.approved, media_id=self.media_id, artist=self.artist, song=self.song,
+                          subreddit=self.subreddit)
+
+
+def get_post_record(submission):
+    # Build PostRecord from a praw submission, records are returned as is
+    if isinstance(submission, PostRecord):
+        return submission
+    fields = vars(submission)
+    author = fields.get('author')
+    post_title = interface.get_post_title(submission)
+    return PostRecord(submission.id, fields.get('name', "t3_" + submission.id), fields.get('created_utc', 0),
+                      fields.get('url', ""), fields.get('domain', ""), fields.get('title', ""),
+                      author=None if author is None else str(author),
+                      is_self=fields.get('is_self', False),
+                      selftext=fields.get('selftext', ""),
+                      media=fields.get('media'),
+                      archived=fields.get('archived', False),
+                      removed=interface.check_removed_fields(fields),
+                      approved=fields.get('approved') is True,
+                      mod_reports=tuple(tuple(item) for item in fields.get('mod_reports') or ()),
+                      mod_reports_dismissed=tuple(tuple(item) for item in fields.get('mod_reports_dismissed') or ()),
+                      media_id=media_url.get_media_id(fields.get('url', "")),
+                      artist=post_title[0], song=post_title[1],
+                      subreddit=get_subreddit_name(submission))
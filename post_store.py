@@ -0,0 +1,169 @@
+import time
+import logging
+import sqlite3
+import threading
+import settings
+import interface
+import post_record
+import media_url
+
+
+log = logging.getLogger("bot")
+
+
+class PostStore:
+    # SQLite store of compact post records with a created_utc high-water mark
+    # Lets a restart only pull posts newer than the newest stored post
+
+    def __init__(self, location=settings.POST_STORE_LOCATION):
+        self.conn = sqlite3.connect(location, check_same_thread=False)
+        # Connection is shared by pipeline workers, reentrant so locked methods can call each other
+        self.lock = threading.RLock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                created_utc REAL,
+                url TEXT,
+                title TEXT,
+                shortlink TEXT,
+                media_id TEXT,
+                artist TEXT,
+                song TEXT,
+                archived INTEGER,
+                removed INTEGER)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS posts_created ON posts (created_utc)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+        # Every submission the bot finished checking, newest is the stream checkpoint
+        self.conn.execute("CREATE TABLE IF NOT EXISTS processed (id TEXT PRIMARY KEY, name TEXT, created_utc REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS processed_created ON processed (created_utc)")
+        # Serialized Bloom filters of processed ids, see checkpoint.SeenFilter
+        self.conn.execute("CREATE TABLE IF NOT EXISTS filters (key TEXT PRIMARY KEY, bits BLOB, count INTEGER)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_watermark(self):
+        # Returns created_utc of newest stored post or None if store is empty
+        with self.lock:
+            return self.conn.execute("SELECT MAX(created_utc) FROM posts").fetchone()[0]
+
+    def get_covered_since(self):
+        # Returns oldest created_utc the store is known to be complete from
+        return self.get_meta("covered_since")
+
+    def add(self, submission, commit=True):
+        record = post_record.get_post_record(submission)
+        row = (record.id, record.name, record.created_utc, record.url, record.title, record.shortlink,
+               record.media_id, record.artist, record.song, int(bool(record.archived)), int(bool(record.removed)))
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            if commit:
+                self.conn.commit()
+
+    def set_removed(self, submission_id, removed=True):
+        with self.lock:
+            self.conn.execute("UPDATE posts SET removed = ? WHERE id = ?", (int(removed), submission_id))
+            self.conn.commit()
+
+    def add_processed(self, submission):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO processed VALUES (?, ?, ?)",
+                              (submission.id, submission.name, submission.created_utc))
+            self.conn.commit()
+
+    def is_processed(self, submission_id):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM processed WHERE id = ?", (submission_id,)).fetchone() is not None
+
+    def get_recent_processed(self, limit):
+        # Returns ids of the last limit processed submissions, newest first
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT id FROM processed ORDER BY rowid DESC LIMIT ?", (limit,))]
+
+    def get_processed_since(self, rowid):
+        # Returns ids processed after rowid, oldest first
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT id FROM processed WHERE rowid > ? ORDER BY rowid", (rowid,))]
+
+    def get_filter(self, key):
+        # Returns (bits, count) of a saved filter or None
+        with self.lock:
+            return self.conn.execute("SELECT bits, count FROM filters WHERE key = ?", (key,)).fetchone()
+
+    def save_filters(self, filters, meta_key):
+        # Save dict of key -> (bits, count) with newest processed rowid as meta_key, in one transaction
+        with self.lock:
+            for key, (bits, count) in filters.items():
+                self.conn.execute("INSERT OR REPLACE INTO filters VALUES (?, ?, ?)", (key, bytes(bits), count))
+            rowid = self.conn.execute("SELECT MAX(rowid) FROM processed").fetchone()[0]
+            self.set_meta(meta_key, rowid or 0)
+            self.conn.commit()
+
+    def get_checkpoint(self):
+        # Returns (fullname, created_utc) of newest processed submission or None
+        with self.lock:
+            return self.conn.execute("SELECT name, created_utc FROM processed ORDER BY created_utc DESC LIMIT 1").fetchone()
+
+    def get_posts(self):
+        # Returns list of PostRecord ordered oldest -> newest
+        # media_id is computed again from url so posts stored with an older media id format still match
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM posts ORDER BY created_utc").fetchall()
+        return [post_record.PostRecord(row[0], row[1], row[2], row[3], title=row[4], shortlink=row[5], archived=bool(row[9]),
+                                       removed=bool(row[10]), media_id=media_url.get_media_id(row[3]), artist=row[7],
+                                       song=row[8]) for row in rows]
+
+    def purge(self, max_days=settings.MAX_REMEMBER_LIMIT):
+        # Removes posts older than the window
+        earliest_time = int(time.time()) - 86400 * max_days
+        with self.lock:
+            self.conn.execute("DELETE FROM posts WHERE created_utc < ?", (earliest_time,))
+            self.conn.execute("DELETE FROM processed WHERE created_utc < ?", (earliest_time,))
+            self.conn.commit()
+
+
+def sync_post_store(reddit, store, max_days=settings.MAX_REMEMBER_LIMIT, subreddit=settings.REDDIT_SUBREDDIT):
+    # Pulls link posts of subreddit newer than the store watermark
+    # Empty store gathers the whole window like initialize_link_array
+    # Reddit API only allows up to 1000 posts in listings
+    watermark = store.get_watermark()
+    earliest_time = int(time.time()) - 86400 * max_days
+    if watermark is None:
+        stop_time = earliest_time
+    else:
+        stop_time = max(watermark, earliest_time)
+    start = time.time()
+    new_count = 0
+    oldest_time = None
+    reached = False
+    for submission in reddit.subreddit(subreddit).new(limit=None):
+        if submission.created_utc <= stop_time:
+            reached = True
+            break
+        oldest_time = submission.created_utc
+        if not interface.check_self(submission):
+            store.add(submission, commit=False)
+            new_count += 1
+    if watermark is None or not reached:
+        # Listing ran out before reaching the watermark, store has a gap before oldest_time
+        if reached:
+            store.set_meta("covered_since", stop_time)
+        elif oldest_time is not None:
+            store.set_meta("covered_since", oldest_time)
+    store.conn.commit()
+    store.purge(max_days)
+    log.info("Post store of {} synced {} new posts in {:.2f}s".format(subreddit, new_count, time.time() - start))
+    return new_count
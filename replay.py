@@ -0,0 +1,289 @@
+#!/usr/bin/python
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import settings
+import interface
+import rules
+import repost_index
+import post_record
+import timing
+
+
+log = logging.getLogger("bot")
+
+# Offline replay of recorded submissions through the same rules as the bot
+# "python replay.py run replay_sample.jsonl" reports submissions/sec, per-stage latency and decisions
+# "python replay.py record submissions.jsonl" records recent submissions from the subreddit
+# Each JSONL line has id, title, url, domain, media (or oembed), author, created_utc, is_self, selftext,
+# and optionally crosspost_parent, crosspost_parent_list, lastfm (recorded "Artist - Song" results)
+# and youtube (recorded video metadata)
+
+
+class ReplaySubmission:
+    # Submission read from a recorded line, reports are kept instead of sent
+
+    def __init__(self, record):
+        self.id = record["id"]
+        self.name = record.get("name", "t3_" + self.id)
+        self.title = record.get("title", "")
+        self.url = record.get("url", "")
+        self.domain = record.get("domain", "")
+        self.media = record.get("media")
+        if self.media is None and record.get("oembed") is not None:
+            self.media = {"oembed": record["oembed"]}
+        self.author = record.get("author")
+        self.created_utc = record.get("created_utc", 0)
+        self.is_self = record.get("is_self", False)
+        self.selftext = record.get("selftext", "")
+        self.archived = False
+        self.removed = record.get("removed", False)
+        self.mod_reports = []
+        self.shortlink = "https://redd.it/" + self.id
+        if record.get("crosspost_parent") is not None:
+            self.crosspost_parent = record["crosspost_parent"]
+            self.crosspost_parent_list = record.get("crosspost_parent_list", [])
+        self.lastfm = record.get("lastfm", [])
+        self.youtube = record.get("youtube")
+        self.reports = []
+
+    def __str__(self):
+        return self.id
+
+    def report(self, reason):
+        self.reports.append(reason)
+
+
+class StubRedditor:
+
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.name = name
+
+    def message(self, subject, message):
+        self.reddit.messages.append((self.name, subject, message))
+
+
+class StubReddit:
+    # Stands in for praw.Reddit, answers from already replayed submissions without network requests
+
+    def __init__(self):
+        self.posts = {}
+        self.order = []
+        self.messages = []
+
+    def add(self, submission):
+        self.posts[submission.id] = submission
+        self.order.append(submission)
+
+    def redditor(self, name):
+        return StubRedditor(self, name)
+
+    def submission(self, id):
+        submission = self.posts.get(id)
+        if submission is None:
+            submission = ReplaySubmission({"id": id})
+        return submission
+
+    def info(self, fullnames):
+        return [self.posts[fullname[3:]] for fullname in fullnames if fullname[3:] in self.posts]
+
+    def search(self, context, query, limit=10):
+        # Newest first like get_reddit_search_listing
+        results = []
+        if context == "url":
+            for submission in reversed(self.order):
+                if not submission.is_self and interface.get_url(submission) == query:
+                    results.append(submission)
+                    if len(results) == limit:
+                        break
+        else:
+            parts = [part.lower() for part in re.findall(r"'([^']*)'", query)]
+            for submission in reversed(self.order):
+                title = submission.title.lower()
+                if all(part in title for part in parts):
+                    results.append(submission)
+                    if len(results) == limit:
+                        break
+        return results
+
+
+class Replayer:
+    # Feeds recorded submissions through rules.evaluate and perform_mod_actions with stubbed providers
+    # latency adds a sleep to every stubbed network request to model real round-trips
+
+    def __init__(self, use_index=True, latency=0):
+        self.reddit = StubReddit()
+        self.latency = latency
+        self.timer = timing.StageTimer()
+        self.posts_index = None
+        if use_index:
+            self.posts_index = repost_index.RepostIndex()
+            # Every earlier replayed post is indexed, no reddit search needed
+            self.posts_index.covered_since = 0
+        self.decisions = []
+
+    def resolve(self, submission, request):
+        with self.timer.time("request:" + request[0]):
+            if self.latency:
+                time.sleep(self.latency)
+            if request[0] == "lastfm":
+                return submission.lastfm
+            elif request[0] == "youtube":
+                return submission.youtube
+            elif request[0] == "removed":
+                return [name for name in request[1] if getattr(self.reddit.posts.get(name[3:]), "removed", False)]
+            elif request[0] == "searches":
+                records = {}
+                return [[interface.get_search_result(result, records) for result in self.reddit.search(context, query)]
+                        for context, query in request[1]]
+        raise ValueError("Unknown rule request {}".format(request[0]))
+
+    def run_rules(self, submission, record):
+        evaluation = rules.evaluate(record, self.posts_index, self.timer)
+        response = None
+        while True:
+            try:
+                request = evaluation.send(response)
+            except StopIteration as stop:
+                return stop.value
+            response = self.resolve(submission, request)
+
+    def replay(self, submission):
+        # Same flow as interface.process_submission without age and reported filters
+        decision = {"id": submission.id, "checked": False, "reports": submission.reports}
+        with self.timer.time("total"):
+            with self.timer.time("record"):
+                record = post_record.get_post_record(submission)
+            if not interface.check_self(record):
+                if interface.check_crosspost(submission):
+                    with self.timer.time("crosspost"):
+                        submission = interface.merge_crosspost_parent(self.reddit, submission)
+                    record.media = submission.media
+                if not interface.check_embed(record):
+                    self.decisions.append(decision)
+                    self.reddit.add(submission)
+                    return decision
+            with self.timer.time("rules"):
+                context = self.run_rules(submission, record)
+            with self.timer.time("actions"):
+                interface.perform_mod_actions(self.reddit, submission, context.rules_violated)
+            if self.posts_index is not None and not interface.check_self(record):
+                with self.timer.time("index"):
+                    self.posts_index.add(record)
+        decision["checked"] = True
+        self.decisions.append(decision)
+        self.reddit.add(submission)
+        return decision
+
+    def run(self, records):
+        # Returns seconds taken to replay records oldest -> newest
+        submissions = sorted((ReplaySubmission(record) for record in records), key=lambda submission: submission.created_utc)
+        start = time.perf_counter()
+        for submission in submissions:
+            self.replay(submission)
+        return time.perf_counter() - start
+
+
+def load_records(location):
+    with open(location, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_decisions(location, decisions):
+    with open(location, "w", encoding="utf-8") as f:
+        for decision in decisions:
+            f.write(json.dumps(decision) + "\n")
+
+
+def compare_decisions(decisions, expected):
+    # Returns list of [id, expected reports, replayed reports] that differ
+    replayed = {decision["id"]: decision["reports"] for decision in decisions}
+    differences = []
+    for decision in expected:
+        reports = replayed.get(decision["id"])
+        if reports != decision["reports"]:
+            differences.append([decision["id"], decision["reports"], reports])
+    return differences
+
+
+def print_report(replayer, seconds):
+    count = len(replayer.decisions)
+    print("Replayed {} submissions in {:.3f}s: {:,.1f} submissions/sec".format(count, seconds, count / seconds if seconds else float("inf")))
+    print("{:24} {:>8} {:>10} {:>10} {:>10}".format("stage", "count", "p50 ms", "p95 ms", "p99 ms"))
+    for stage, stage_count, p50, p95, p99 in replayer.timer.summary():
+        print("{:24} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}".format(stage, stage_count, p50, p95, p99))
+    reasons = {}
+    for decision in replayer.decisions:
+        for reason in decision["reports"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    print("Decisions: {} checked, {} reported, {} messages".format(
+        sum(1 for decision in replayer.decisions if decision["checked"]),
+        sum(1 for decision in replayer.decisions if decision["reports"]), len(replayer.reddit.messages)))
+    for reason, reason_count in sorted(reasons.items(), key=lambda item: -item[1]):
+        print("  {:>6}  {}".format(reason_count, reason))
+
+
+def record_submissions(location, limit):
+    # Write newest submissions of the subreddit as replay records
+    import praw
+    reddit = praw.Reddit(user_agent=os.environ['APP_USERAGENT'] + ' ' + os.environ['APP_VERSION'] + " by u/" + settings.USER_TO_MESSAGE,
+                         client_id=os.environ['REDDIT_CLIENT_ID'],
+                         client_secret=os.environ['REDDIT_CLIENT_SECRET'],
+                         password=os.environ['REDDIT_PASSWORD'],
+                         username=os.environ['REDDIT_USERNAME'])
+    count = 0
+    with open(location, "w", encoding="utf-8") as f:
+        for submission in reddit.subreddit(settings.REDDIT_SUBREDDIT).new(limit=limit):
+            record = {"id": submission.id, "title": submission.title, "url": submission.url, "domain": submission.domain,
+                      "media": submission.media, "author": str(submission.author), "created_utc": submission.created_utc,
+                      "is_self": submission.is_self, "selftext": submission.selftext}
+            if interface.check_crosspost(submission):
+                record["crosspost_parent"] = submission.crosspost_parent
+                record["crosspost_parent_list"] = submission.crosspost_parent_list
+            f.write(json.dumps(record) + "\n")
+            count += 1
+    print("Recorded {} submissions to {}".format(count, location))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay of recorded submissions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="replay submissions and report throughput and decisions")
+    run.add_argument("submissions")
+    run.add_argument("--latency", type=float, default=0, help="seconds added to each stubbed network request")
+    run.add_argument("--search", action="store_true", help="use stubbed reddit search instead of the repost index")
+    run.add_argument("--decisions", help="write decisions to this JSONL file")
+    run.add_argument("--expect", help="fail if decisions differ from this JSONL file")
+    run.add_argument("--verbose", action="store_true", help="show bot log output")
+    record = subparsers.add_parser("record", help="record newest subreddit submissions")
+    record.add_argument("submissions")
+    record.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_submissions(args.submissions, args.limit)
+        return 0
+    if args.verbose:
+        log.addHandler(logging.StreamHandler())
+        log.setLevel(logging.DEBUG)
+    replayer = Replayer(use_index=not args.search, latency=args.latency)
+    seconds = replayer.run(load_records(args.submissions))
+    print_report(replayer, seconds)
+    if args.decisions:
+        write_decisions(args.decisions, replayer.decisions)
+    if args.expect:
+        differences = compare_decisions(replayer.decisions, load_records(args.expect))
+        for submission_id, expected, replayed in differences:
+            print("DIFF {}: expected {} replayed {}".format(submission_id, expected, replayed))
+        if differences:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
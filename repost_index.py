@@ -0,0 +1,155 @@
+import time
+import logging
+import threading
+import collections
+import settings
+import interface
+import minhash
+import post_record
+
+
+log = logging.getLogger("bot")
+
+
+class RepostIndex:
+    # In-process index of submissions within the MAX_REMEMBER_LIMIT window
+    # Keyed by media id and by normalized artist/song title key of each PostRecord
+    # Lookups are dict lookups, no reddit search needed unless index does not cover the whole window
+    # Each key keeps every post with it oldest -> newest, reposts match the oldest post that was not removed
+    # Title keys are also in a MinHash LSH index to find near-duplicate titles, candidates need the same artist
+    # and a similar song name, title matches of posts with different part numbers or live/demo markers are dropped
+
+    def __init__(self, max_days=settings.MAX_REMEMBER_LIMIT, similarity_threshold=settings.REPOST_SIMILARITY_THRESHOLD):
+        self.max_days = max_days
+        # id -> stored PostRecord, insertion ordered oldest -> newest
+        self.posts = collections.OrderedDict()
+        # key -> list of ids oldest -> newest
+        self.url_keys = {}
+        self.title_keys = {}
+        self.similar_titles = minhash.MinHashLSH(similarity_threshold)
+        # created_utc of the oldest time the index is known to be complete from
+        self.covered_since = None
+        # Index is shared by pipeline workers
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.posts)
+
+    def __contains__(self, submission_id):
+        return submission_id in self.posts
+
+    def earliest_time(self, now=None):
+        return int(time.time() if now is None else now) - 86400 * self.max_days
+
+    def covers_window(self):
+        # Return True if every post in the window has been indexed
+        return self.covered_since is not None and self.covered_since <= self.earliest_time()
+
+    def add(self, submission):
+        # Add submission to index, posts are added oldest -> newest
+        record = post_record.get_post_record(submission)
+        with self.lock:
+            if record.id in self.posts:
+                return
+            record = record.get_stored()
+            self.posts[record.id] = record
+            self.url_keys.setdefault(record.media_id, []).append(record.id)
+            if record.title_key is not None:
+                self.title_keys.setdefault(record.title_key, []).append(record.id)
+                self.similar_titles.add(record.id, record.title_key)
+
+    def load(self, stored_posts, covered_since=None):
+        # Add list of posts ordered oldest -> newest
+        for submission in stored_posts:
+            self.add(submission)
+        self.covered_since = covered_since
+        log.info("Repost index loaded with {} posts".format(len(self.posts)))
+
+    def remove_key(self, key_map, key, submission_id):
+        match_ids = key_map.get(key)
+        if match_ids is not None and submission_id in match_ids:
+            match_ids.remove(submission_id)
+            if not match_ids:
+                del key_map[key]
+
+    def remove(self, submission_id):
+        with self.lock:
+            record = self.posts.pop(submission_id, None)
+            if record is None:
+                return
+            self.remove_key(self.url_keys, record.media_id, submission_id)
+            if record.title_key is not None:
+                self.remove_key(self.title_keys, record.title_key, submission_id)
+            self.similar_titles.remove(submission_id)
+
+    def set_removed(self, submission_id):
+        # Removed posts stay indexed so they are not added again, but never match
+        with self.lock:
+            record = self.posts.get(submission_id)
+            if record is not None:
+                record.removed = True
+
+    def purge(self, now=None):
+        # Removes posts older than the window ending at now, oldest are first so stop at first post within window
+        earliest_time = self.earliest_time(now)
+        with self.lock:
+            while self.posts:
+                submission_id, record = next(iter(self.posts.items()))
+                if record.created_utc >= earliest_time:
+                    break
+                self.remove(submission_id)
+
+    def get_matches(self, key_map, key, submission):
+        # Returns older posts for key that were not removed, oldest first
+        # Submissions checked at the same time may be added a little out of order
+        with self.lock:
+            matches = [self.posts[match_id] for match_id in key_map.get(key, ()) if match_id != submission.id]
+        return sorted((match for match in matches if not match.removed and interface.check_more_recent(submission, match)),
+                      key=lambda match: match.created_utc)
+
+    def get_similar(self, submission):
+        # Returns older posts of the same artist with a similar title that were not removed, most similar first
+        with self.lock:
+            matches = [self.posts[match_id] for similarity, match_id in self.similar_titles.query(submission.title_key)
+                       if match_id != submission.id]
+        return [match for match in matches if not match.removed and interface.check_more_recent(submission, match)
+                and interface.check_similar_title([submission.artist_key, submission.song_key], submission.title,
+                                                  [match.artist_key, match.song_key], match.title)]
+
+    def get_title_matches(self, submission):
+        # Returns older posts with the same title key and the same part numbers and version markers
+        return [match for match in self.get_matches(self.title_keys, submission.title_key, submission)
+                if interface.check_same_version(submission.title, match.title)]
+
+    def get_candidates(self, submission):
+        # Returns every post find() could match, to check whether they were removed
+        record = post_record.get_post_record(submission)
+        candidates = self.get_matches(self.url_keys, record.media_id, record)
+        if record.title_key is not None:
+            candidates.extend(self.get_title_matches(record))
+            candidates.extend(self.get_similar(record))
+        return list({match.id: match for match in candidates}.values())
+
+    def find(self, submission):
+        # Returns ("url", post), ("title", post) or ("similar", post) for the oldest older post matching submission
+        # Returns None if no match found, "similar" matches are only possible reposts
+        record = post_record.get_post_record(submission)
+        matches = self.get_matches(self.url_keys, record.media_id, record)
+        if matches:
+            return "url", matches[0]
+        if record.title_key is not None:
+            matches = self.get_title_matches(record)
+            if matches:
+                return "title", matches[0]
+            matches = self.get_similar(record)
+            if matches:
+                return "similar", matches[0]
+        return None
+
+    def find_or_add(self, submission):
+        # find() then add() as one step, so of two submissions of the same song checked at the same time
+        # the one checked second always matches the first instead of neither seeing the other
+        with self.lock:
+            match = self.find(submission)
+            self.add(submission)
+        return match
@@ -0,0 +1,220 @@
+import logging
+import collections
+import settings
+import interface
+import timing
+import post_record
+import youtube
+
+
+log = logging.getLogger("bot")
+
+# Rules run in order of cost, cheap local checks first and network-backed checks last
+# repost_index is a network rule only to refresh the removed state of matching posts, which most posts have none of
+# Local rules are plain functions of a RuleContext
+# Network rules are generators that yield a request and get the response sent back:
+#   ("lastfm", artist, song) -> list of "Artist - Song" results
+#   ("youtube", video_id) -> video metadata dict, {} if not found, None if unavailable
+#   ("removed", [fullname, ...]) -> fullnames of those posts that were removed or deleted
+#   ("searches", [(context, query), ...], subreddit) -> list of SearchResult lists run at the same time,
+#     None for a failed search
+# so the same rules run with blocking requests (run_rules) or awaited requests (async engine)
+Rule = collections.namedtuple("Rule", ["name", "cost", "network", "check"])
+
+
+class RuleContext:
+    # Values shared by the rules of one submission, computed once
+    # submission is the PostRecord of the submission
+
+    def __init__(self, submission, posts_index=None):
+        self.submission = post_record.get_post_record(submission)
+        self.posts_index = posts_index
+        self.rules_violated = []
+        # Set when a decisive rule fires, remaining rules are skipped
+        self.stopped = False
+        # Set when repost index covers the whole window so reddit search is not needed
+        self.repost_checked = False
+        self.post_info = [self.submission.artist, self.submission.song]
+        # Ids of indexed posts found removed since they were stored, to update the post store
+        self.removed_ids = []
+
+    def add_violation(self, violation, decisive=False):
+        interface.rule_violation(self.rules_violated, violation)
+        if decisive:
+            self.stopped = True
+
+    def verify_song(self):
+        # Return True if submitted artist/song should be verified against musicbrainz
+        return not self.stopped and not interface.check_self(self.submission) and self.post_info[1] is not None
+
+
+def check_music_domain(context):
+    link_domain = interface.get_domain(context.submission)
+    if not interface.check_domain(link_domain):
+        # link domain is not youtube, spotify, bandcamp, or soundcloud
+        # could check domain against secondary list including facebook, twitter, metal magazines, etc. for different handling
+        log.info("Link submission to {}".format(link_domain))
+        context.stopped = True
+
+
+def check_album_stream(context):
+    # does not include spotify playlists as album streams
+    if interface.check_album_stream(context.submission):
+        log.info("Submission {} is an album stream".format(context.submission.id))
+        context.add_violation(interface.violation_album_stream(context.submission), decisive=True)
+
+
+def check_title_format(context):
+    # Could do second regex check for "Song by Artist"
+    if context.post_info[1] is None:
+        context.add_violation(interface.violation_bad_title(context.submission), decisive=True)
+
+
+def check_self_promotion(context):
+    if interface.check_self_promotion(context.submission):
+        context.add_violation(interface.violation_self_promotion(context.submission))
+
+
+def check_repost_index(context):
+    if context.posts_index is None:
+        return
+    candidates = context.posts_index.get_candidates(context.submission)
+    if candidates:
+        # Mods may have removed matching posts since they were indexed, reposts of removed posts are allowed
+        removed = yield ("removed", [post.name for post in candidates])
+        for post in candidates:
+            if post.name in removed:
+                log.info("Indexed post {} was removed".format(post.id))
+                context.posts_index.set_removed(post.id)
+                context.removed_ids.append(post.id)
+    # Submission is indexed as it is checked, a submission of the same song checked at the same time matches it
+    match = context.posts_index.find_or_add(context.submission)
+    if match is not None:
+        match_context, old_submission = match
+        log.info("Repost index {} match of {} and {}".format(match_context, context.submission.id, old_submission.id))
+        if match_context != "similar":
+            context.add_violation(interface.violation_six_month(context.submission, old_submission), decisive=True)
+            return
+        # Similar title may be a different song, mods decide
+        context.add_violation(interface.violation_possible_repost(context.submission, old_submission))
+    if context.posts_index.covers_window():
+        context.repost_checked = True
+
+
+def check_lazy_selfpost(context):
+    if interface.check_lazy_text_post(context.submission):
+        context.add_violation(interface.violation_lazy_selfpost(context.submission), decisive=True)
+
+
+def check_title_match(context):
+    # Compare post title with link info, confirm a mismatch with last.fm typo-correction
+    submission = context.submission
+    link_info = interface.get_link_title(None, submission)
+    if link_info is None:
+        # None means soundcloud link which is not handled yet
+        return
+    if link_info[0] is None or link_info[1] is None:
+        # "Various Artists - Topic" channel or video title didn't match regex, recover from video description
+        video_id = interface.get_youtube_video_id(submission)
+        if video_id is not None:
+            metadata = yield ("youtube", video_id)
+            link_info = interface.get_youtube_link_title(link_info, metadata)
+    mismatch = interface.get_title_mismatch(submission, context.post_info, link_info)
+    if mismatch is None:
+        return
+    text, vars, noLinkArtist, noLinkSong = mismatch
+    lastfm_results = yield ("lastfm", context.post_info[0], context.post_info[1])
+    if not interface.check_lastfm_match(lastfm_results, link_info, noLinkArtist, noLinkSong):
+        log.info(text.format(*vars))
+        context.add_violation(interface.violation_bad_title_report(submission))
+
+
+def check_repost_search(context):
+    # Search subreddit for url then title, only if repost index did not cover the whole window
+    if context.repost_checked:
+        return
+    submission = context.submission
+    post_url = interface.get_url(submission)
+    post_title, title_query = interface.get_title_query(context.post_info)
+    log.info("Searching for Url: \"{}\" and Title: \"{}\" in subreddit".format(post_url, post_title))
+    # title search uses title without possible "(extra info)" removed by regex
+    url_results, title_results = yield ("searches", [("url", post_url), ("title", title_query)],
+                                        submission.subreddit or settings.REDDIT_SUBREDDIT)
+    # Results are ordered new -> old, reposts are reported against the oldest post like the repost index
+    for search_result in reversed(url_results or []):
+        if interface.check_url_result(submission, post_url, search_result):
+            context.add_violation(interface.violation_six_month(submission, search_result), decisive=True)
+            return
+    similar_result = None
+    for search_result in reversed(title_results or []):
+        match_context = interface.check_title_result(submission, post_title, search_result)
+        if match_context == "title":
+            context.add_violation(interface.violation_six_month(submission, search_result), decisive=True)
+            return
+        if match_context == "similar" and similar_result is None:
+            similar_result = search_result
+    if similar_result is not None:
+        context.add_violation(interface.violation_possible_repost(submission, similar_result))
+
+
+LINK_RULES = sorted([
+    Rule("music_domain", 0, False, check_music_domain),
+    Rule("album_stream", 1, False, check_album_stream),
+    Rule("title_format", 2, False, check_title_format),
+    Rule("self_promotion", 3, False, check_self_promotion),
+    Rule("repost_index", 4, True, check_repost_index),
+    Rule("title_match", 10, True, check_title_match),
+    Rule("repost_search", 20, True, check_repost_search),
+], key=lambda rule: rule.cost)
+
+SELFPOST_RULES = [
+    Rule("lazy_selfpost", 0, False, check_lazy_selfpost),
+]
+
+
+def evaluate(submission, posts_index=None, timer=timing.null_timer, rule_names=None):
+    # Generator evaluating all rules for submission in one pass, or only the rules named in rule_names
+    # Yields requests of network rules, returns RuleContext with rules_violated
+    # Each rule is timed as stage "rule:<name>", network rules include their requests
+    # Violations are counted as "rule_violations_total" by rule name
+    context = RuleContext(submission, posts_index)
+    rules = SELFPOST_RULES if interface.check_self(context.submission) else LINK_RULES
+    for rule in rules:
+        if rule_names is not None and rule.name not in rule_names:
+            continue
+        violations = len(context.rules_violated)
+        with timer.time("rule:" + rule.name):
+            if rule.network:
+                yield from rule.check(context)
+            else:
+                rule.check(context)
+        if len(context.rules_violated) > violations:
+            timer.count("rule_violations_total", rule.name)
+        if context.stopped:
+            break
+    return context
+
+
+def resolve(reddit, request):
+    # Blocking response to a network rule request
+    if request[0] == "lastfm":
+        return interface.get_lastfm_result(request[1], request[2])
+    elif request[0] == "youtube":
+        return youtube.get_video(request[1])
+    elif request[0] == "removed":
+        return interface.get_removed_names(reddit, request[1])
+    elif request[0] == "searches":
+        return interface.get_reddit_searches(reddit, request[1], request[2])
+    raise ValueError("Unknown rule request {}".format(request[0]))
+
+
+def run_rules(reddit, submission, posts_index=None, timer=timing.null_timer):
+    # Evaluate rules with blocking requests, returns RuleContext
+    evaluation = evaluate(submission, posts_index, timer)
+    response = None
+    while True:
+        try:
+            request = evaluation.send(response)
+        except StopIteration as stop:
+            return stop.value
+        response = resolve(reddit, request)
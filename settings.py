@@ -1,4 +1,73 @@
 REDDIT_SUBREDDIT = "progmetal"
+# Subreddits moderated by one process, can be overridden with comma separated BOT_SUBREDDITS environment variable
+# Each subreddit has its own post store and repost index, caches and connections are shared
+REDDIT_SUBREDDITS = [REDDIT_SUBREDDIT]
 MAX_REMEMBER_LIMIT = 181
 MESSAGE_LOCATION = "message.txt"
 USER_TO_MESSAGE = "iAmTheEpicOne"
+POST_STORE_LOCATION = "posts.db"
+# Post store of subreddits other than REDDIT_SUBREDDIT, formatted with the lowercase subreddit name
+SHARD_STORE_LOCATION = "posts_{}.db"
+LASTFM_CACHE_SIZE = 4096
+LASTFM_CACHE_TTL = 86400 * 7
+# Set to None to keep last.fm cache in memory only
+LASTFM_CACHE_LOCATION = "lastfm_cache.json"
+# Verify submitted artist/song against MusicBrainz in the background
+# A missing recording is reported as a follow-up after the combined report of the other rules
+MUSICBRAINZ_CHECK = True
+MUSICBRAINZ_RATE = 1.0
+MUSICBRAINZ_CACHE_SIZE = 8192
+MUSICBRAINZ_CACHE_TTL = 86400 * 30
+# Set to None to keep musicbrainz cache in memory only
+MUSICBRAINZ_CACHE_LOCATION = "musicbrainz_cache.json"
+# "sync" checks submissions one at a time, "pipeline" uses a pool of worker threads,
+# "async" uses asyncpraw and aiohttp (install them to use it)
+# Can be overridden with BOT_ENGINE environment variable
+ENGINE = "sync"
+PIPELINE_WORKERS = 4
+PIPELINE_QUEUE_SIZE = 100
+# Most submissions checked at once by the "async" engine
+ASYNC_CONCURRENCY = 20
+# Moderator notifications are sent as one digest per interval or batch
+OUTBOX_FLUSH_INTERVAL = 600
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_RETRIES = 3
+# Near-duplicate repost titles: Jaccard similarity of character shingles of "artist song" finds candidates,
+# which need the same artist and SONG_SIMILARITY_THRESHOLD similarity of song names with word ends as shingles
+REPOST_SIMILARITY_THRESHOLD = 0.7
+SONG_SIMILARITY_THRESHOLD = 0.7
+SHINGLE_SIZE = 3
+# More bands catch lower similarities as candidates, permutations must be divisible by bands
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+# Prometheus metrics endpoint, set METRICS_PORT to None to disable
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+# Seconds to wait after a stream exception, doubles on each failure in a row up to BACKOFF_MAX with full jitter
+BACKOFF_BASE = 2
+BACKOFF_MAX = 600
+# Concurrent unhide requests at startup, praw waits on reddit rate limits for each
+UNHIDE_WORKERS = 1
+# Media of crosspost parents
+CROSSPOST_CACHE_SIZE = 1024
+CROSSPOST_CACHE_TTL = 86400
+# Threads running url and title searches of a submission at the same time
+SEARCH_WORKERS = 4
+# YouTube Data API video metadata, used when oembed does not give artist and song
+YOUTUBE_CACHE_SIZE = 8192
+YOUTUBE_CACHE_TTL = 86400 * 30
+# Set to None to keep YouTube cache in memory only
+YOUTUBE_CACHE_LOCATION = "youtube_cache.json"
+# Seconds to wait for more video ids before sending a batch request
+YOUTUBE_BATCH_WAIT = 0.05
+# Processed submission filter, see checkpoint.SeenFilter
+# Ids per Bloom filter generation and its false positive rate when full, two generations are kept
+SEEN_FILTER_CAPACITY = 100000
+SEEN_FILTER_ERROR_RATE = 0.001
+# Most recent processed ids kept exactly, covers the 100 submissions a stream replays on restart
+SEEN_RING_SIZE = 1000
+# Save filters after this many processed submissions
+SEEN_SAVE_INTERVAL = 100
+# Worker processes of audit.py, None uses one per core
+AUDIT_WORKERS = None
+AUDIT_REPORT_LOCATION = "audit.jsonl"
@@ -0,0 +1,120 @@
+import os
+import time
+import base64
+import logging
+import threading
+import requests
+import metrics
+
+
+log = logging.getLogger("bot")
+
+SPOTIFY_ACCOUNTS_URL = "https://accounts.spotify.com"
+SPOTIFY_API_URL = "https://api.spotify.com"
+# Refresh token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+
+
+class SpotifyClient:
+    # Spotify Web API client using client-credentials authorization
+    # Access token is cached until shortly before expires_in and refreshed in a background timer
+    # All requests share one keep-alive requests.Session
+    # accounts_url and api_url can point to a local stub server for testing
+
+    def __init__(self, client_id, client_secret, accounts_url=SPOTIFY_ACCOUNTS_URL, api_url=SPOTIFY_API_URL,
+                 refresh_margin=TOKEN_REFRESH_MARGIN, background_refresh=True, session=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.accounts_url = accounts_url.rstrip("/")
+        self.api_url = api_url.rstrip("/")
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self.session = session if session is not None else requests.Session()
+        self.session.headers.update({'Accept': 'application/json',
+                                     'Content-Type': 'application/json'})
+        self.access_token = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+        self.refresh_timer = None
+
+    def close(self):
+        if self.refresh_timer is not None:
+            self.refresh_timer.cancel()
+        self.session.close()
+
+    def request_token(self):
+        # Client-credentials POST for a new access token
+        authorization = "Basic " + base64.b64encode(bytes(self.client_id + ':' + self.client_secret, 'utf-8')).decode()
+        r = self.session.post(self.accounts_url + '/api/token', data={'grant_type': 'client_credentials'},
+                              headers={'Authorization': authorization, 'Content-Type': 'application/x-www-form-urlencoded'})
+        r.raise_for_status()
+        rJson = r.json()
+        self.access_token = rJson["access_token"]
+        self.expires_at = time.monotonic() + rJson.get("expires_in", 3600) - self.refresh_margin
+        if self.background_refresh:
+            self.schedule_refresh(max(self.expires_at - time.monotonic(), 1))
+
+    def schedule_refresh(self, delay):
+        if self.refresh_timer is not None:
+            self.refresh_timer.cancel()
+        self.refresh_timer = threading.Timer(delay, self.refresh)
+        self.refresh_timer.daemon = True
+        self.refresh_timer.start()
+
+    def refresh(self):
+        # Background refresh, next lookup will request token itself if this fails
+        try:
+            with self.lock:
+                self.request_token()
+        except Exception as e:
+            log.error("Exception in spotify token refresh: %s", e)
+
+    def get_authorization(self):
+        # Returns "Bearer <token>", requesting a new token only if cached one is expired
+        with self.lock:
+            if self.access_token is None or time.monotonic() >= self.expires_at:
+                self.request_token()
+            return "Bearer " + self.access_token
+
+    def get(self, path, params=None):
+        # GET api path and return json
+        with metrics.bot_metrics.api_call("spotify"):
+            headers = {'Authorization': self.get_authorization()}
+            r = self.session.get(self.api_url + path, params=params, headers=headers)
+            if r.status_code == 401:
+                # Token was revoked early, retry once with a new token
+                with self.lock:
+                    self.access_token = None
+                headers = {'Authorization': self.get_authorization()}
+                r = self.session.get(self.api_url + path, params=params, headers=headers)
+            if r.status_code >= 400:
+                metrics.bot_metrics.increment("api_errors_total", [("api", "spotify")])
+            return r.json()
+
+    def get_track(self, track_id):
+        return self.get('/v1/tracks/' + track_id)
+
+    def get_album(self, album_id):
+        return self.get('/v1/albums/' + album_id)
+
+    def get_artist(self, artist_id):
+        return self.get('/v1/artists/' + artist_id)
+
+    def search(self, query, search_type):
+        return self.get('/v1/search', params={'q': query, 'type': search_type})
+
+
+spotify_client = None
+spotify_client_lock = threading.Lock()
+
+
+def get_spotify_client():
+    # Returns shared SpotifyClient, created on first use
+    # SPOTIFY_ACCOUNTS_URL and SPOTIFY_API_URL environment variables can point to a stub server
+    global spotify_client
+    with spotify_client_lock:
+        if spotify_client is None:
+            spotify_client = SpotifyClient(os.environ['SPOTIFY_ID'], os.environ['SPOTIFY_SECRET'],
+                                           accounts_url=os.environ.get('SPOTIFY_ACCOUNTS_URL', SPOTIFY_ACCOUNTS_URL),
+                                           api_url=os.environ.get('SPOTIFY_API_URL', SPOTIFY_API_URL))
+    return spotify_client
@@ -0,0 +1,68 @@
+import time
+import queue
+import logging
+import threading
+import zlib
+import settings
+
+
+log = logging.getLogger("bot")
+
+# Put back on the queue to stop a worker
+STOP = object()
+
+
+class SubmissionPipeline:
+    # Stream feeds submissions into bounded queues consumed by a pool of worker threads
+    # Each submission id always goes to the same worker so mod actions for a submission stay in order
+    # submit() blocks when a worker queue is full, so the stream slows down instead of growing a backlog
+
+    def __init__(self, handler, workers=settings.PIPELINE_WORKERS, queue_size=settings.PIPELINE_QUEUE_SIZE):
+        self.handler = handler
+        self.queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self.threads = []
+
+    def start(self):
+        for number, work_queue in enumerate(self.queues):
+            thread = threading.Thread(target=self.work, args=(work_queue,), name="pipeline-{}".format(number), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        log.info("Started submission pipeline with {} workers".format(len(self.threads)))
+
+    def stop(self, wait=True):
+        # Workers finish queued submissions before stopping
+        for work_queue in self.queues:
+            work_queue.put(STOP)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        self.threads = []
+
+    def get_queue(self, submission):
+        # Same id always maps to same worker
+        return self.queues[zlib.crc32(submission.id.encode()) % len(self.queues)]
+
+    def pending(self):
+        return sum(work_queue.qsize() for work_queue in self.queues)
+
+    def submit(self, submission):
+        work_queue = self.get_queue(submission)
+        try:
+            work_queue.put_nowait(submission)
+        except queue.Full:
+            log.warning("Pipeline queue full with {} pending, waiting for workers".format(self.pending()))
+            start = time.time()
+            work_queue.put(submission)
+            log.info("Pipeline backpressure held stream for {:.2f}s".format(time.time() - start))
+
+    def work(self, work_queue):
+        while True:
+            submission = work_queue.get()
+            try:
+                if submission is STOP:
+                    return
+                self.handler(submission)
+            except Exception as e:
+                log.error("Exception in pipeline processing submission {}: {}".format(submission, e), exc_info=True)
+            finally:
+                work_queue.task_done()
@@ -0,0 +1,96 @@
+import re
+import logging
+import collections
+import settings
+import checkpoint
+import post_record
+import post_store
+import repost_index
+
+
+log = logging.getLogger("bot")
+
+
+def get_subreddit_names(value=None):
+    # Returns subreddit names from a comma or plus separated string, REDDIT_SUBREDDITS if value is empty
+    if not value:
+        return list(settings.REDDIT_SUBREDDITS)
+    return [name.strip() for name in re.split(r'[,+]', value) if name.strip()]
+
+
+def get_store_location(name):
+    # REDDIT_SUBREDDIT keeps the original post store so single subreddit setups keep their data
+    if name.lower() == settings.REDDIT_SUBREDDIT.lower():
+        return settings.POST_STORE_LOCATION
+    return settings.SHARD_STORE_LOCATION.format(name.lower())
+
+
+class SubredditShard:
+    # State kept per moderated subreddit: post store, repost index and stream checkpoint
+    # Reddit session, metadata caches and worker pools are module level and shared by all shards
+
+    def __init__(self, name, location=None):
+        self.name = name
+        self.store = post_store.PostStore(location if location is not None else get_store_location(name))
+        self.posts_index = repost_index.RepostIndex()
+        self.stream_checkpoint = checkpoint.StreamCheckpoint(self.store)
+
+    def __str__(self):
+        return self.name
+
+    def load(self, reddit):
+        # Sync post store with the subreddit and fill the repost index from it
+        log.info("Gathering posts from subreddit %s", self.name)
+        post_store.sync_post_store(reddit, self.store, subreddit=self.name)
+        self.posts_index.load(self.store.get_posts(), covered_since=self.store.get_covered_since())
+
+    def get_missed_submissions(self, reddit):
+        return checkpoint.get_missed_submissions(reddit, self.stream_checkpoint, self.name)
+
+    def save(self):
+        self.stream_checkpoint.save()
+
+    def close(self):
+        self.save()
+        self.store.close()
+
+
+class ShardSet:
+    # Shards of all moderated subreddits by lowercase name
+    # One multireddit stream ("a+b+c") reads submissions of every shard
+
+    def __init__(self, names):
+        self.shards = collections.OrderedDict((name.lower(), SubredditShard(name)) for name in names)
+
+    def __iter__(self):
+        return iter(self.shards.values())
+
+    def __len__(self):
+        return len(self.shards)
+
+    def get(self, submission):
+        # Returns shard of the subreddit submission was posted to, None if subreddit is not moderated
+        return self.shards.get(post_record.get_subreddit_name(submission).lower())
+
+    def get_stream_name(self):
+        return "+".join(shard.name for shard in self)
+
+    def load(self, reddit):
+        for shard in self:
+            shard.load(reddit)
+
+    def get_missed_submissions(self, reddit):
+        # Missed submissions of all shards ordered oldest -> newest
+        missed = []
+        for shard in self:
+            missed.extend(shard.get_missed_submissions(reddit))
+        missed.sort(key=lambda submission: submission.created_utc)
+        return missed
+
+    def save(self):
+        for shard in self:
+            shard.save()
+
+    def close(self):
+        for shard in self:
+            shard.close()
@@ -0,0 +1,153 @@
+import time
+import asyncio
+import types
+import settings
+import async_engine
+import repost_index
+import rules
+
+
+class FakeCheckpoint:
+
+    def __init__(self):
+        self.processed = set()
+
+    def is_processed(self, submission):
+        return submission.id in self.processed
+
+    def mark_processed(self, submission):
+        self.processed.add(submission.id)
+
+
+class FakeShards:
+
+    def __init__(self):
+        self.shard = types.SimpleNamespace(name="progmetal", stream_checkpoint=FakeCheckpoint())
+
+    def __iter__(self):
+        return iter([self.shard])
+
+    def get(self, submission):
+        return self.shard
+
+    def get_stream_name(self):
+        return self.shard.name
+
+
+class FakeStream:
+
+    def __init__(self, engine, streamed):
+        self.engine = engine
+        self.streamed = streamed
+
+    async def submissions_generator(self):
+        for submission in self.streamed:
+            yield submission
+        # Let spawned tasks finish, then stop run() which only catches Exception
+        await asyncio.gather(*self.engine.tasks)
+        raise asyncio.CancelledError()
+
+    def submissions(self):
+        return self.submissions_generator()
+
+
+class FakeReddit:
+
+    def __init__(self, engine, streamed):
+        self.stream = FakeStream(engine, streamed)
+
+    async def subreddit(self, name):
+        return self
+
+
+def make_engine(missed, streamed):
+    engine = async_engine.AsyncEngine({'user_agent': "test"}, FakeShards(), concurrency=4)
+    engine.reddit = FakeReddit(engine, streamed)
+    engine.processed = []
+
+    async def get_missed_submissions(shard):
+        return list(missed)
+
+    async def process_submission(submission, shard):
+        engine.processed.append(submission.id)
+        # Slow enough that the stream yields the submission again while this one is in flight
+        await asyncio.sleep(0.05)
+
+    engine.get_missed_submissions = get_missed_submissions
+    engine.process_submission = process_submission
+    return engine
+
+
+def run_engine(engine):
+    try:
+        asyncio.run(engine.run())
+    except asyncio.CancelledError:
+        pass
+
+
+def make_submission(submission_id, created_utc):
+    return types.SimpleNamespace(id=submission_id, name="t3_" + submission_id, created_utc=created_utc)
+
+
+def test_catch_up_and_stream_process_a_submission_once():
+    submission = make_submission("a1", 100)
+    engine = make_engine([submission], [submission, make_submission("a2", 200)])
+    run_engine(engine)
+    assert engine.processed == ["a1", "a2"]
+    assert engine.in_flight == set()
+    assert engine.shards.shard.stream_checkpoint.processed == {"a1", "a2"}
+
+
+def test_processed_submission_is_skipped():
+    submission = make_submission("a1", 100)
+    engine = make_engine([], [submission])
+    engine.shards.shard.stream_checkpoint.processed.add("a1")
+    run_engine(engine)
+    assert engine.processed == []
+
+
+class FakeStore:
+
+    def __init__(self):
+        self.added = []
+
+    def add(self, record):
+        self.added.append(record.id)
+
+    def set_removed(self, submission_id):
+        pass
+
+
+def make_link_submission(submission_id, age_seconds):
+    return types.SimpleNamespace(id=submission_id, name="t3_" + submission_id, title="Haken - Nil By Mouth",
+                                 url="https://youtu.be/aaaaaaaaaaa", domain="youtu.be", author="someone",
+                                 media={"oembed": {"title": "Haken - Nil By Mouth", "author_name": "Haken"}},
+                                 created_utc=time.time() - age_seconds, is_self=False, archived=False,
+                                 approved=False, mod_reports=[], selftext="")
+
+
+def test_concurrent_submissions_of_a_song_see_each_other(monkeypatch):
+    monkeypatch.setattr(rules, "LINK_RULES", [rule for rule in rules.LINK_RULES if rule.name == "repost_index"])
+    monkeypatch.setattr(settings, "MUSICBRAINZ_CHECK", False)
+    engine = async_engine.AsyncEngine({'user_agent': "test"}, FakeShards(), concurrency=4)
+    shard = types.SimpleNamespace(name="progmetal", posts_index=repost_index.RepostIndex(), store=FakeStore())
+    reports = {}
+
+    async def perform(recorded):
+        reports[recorded.id] = [action[1] for action in recorded.actions if action[0] == "report"]
+        # Report round-trip, the other submission is checked meanwhile
+        await asyncio.sleep(0.01)
+
+    async def get_removed_names(fullnames):
+        return []
+
+    engine.perform = perform
+    engine.get_removed_names = get_removed_names
+
+    async def process():
+        await asyncio.gather(engine.process_submission(make_link_submission("first", 60), shard),
+                             engine.process_submission(make_link_submission("second", 30), shard))
+
+    asyncio.run(process())
+    assert reports == {"first": [], "second": ["Repost of https://redd.it/first"]}
+    assert sorted(shard.store.added) == ["first", "second"]
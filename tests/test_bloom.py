@@ -0,0 +1,42 @@
+import pytest
+import bloom
+
+
+def test_added_items_are_always_found():
+    bloom_filter = bloom.BloomFilter(1000, 0.01)
+    items = ["t3_{:x}".format(i) for i in range(1000)]
+    for item in items:
+        bloom_filter.add(item)
+    assert all(item in bloom_filter for item in items)
+    assert len(bloom_filter) == 1000
+
+
+def test_false_positive_rate_near_target():
+    bloom_filter = bloom.BloomFilter(5000, 0.01)
+    for i in range(5000):
+        bloom_filter.add("added_{}".format(i))
+    false_positives = sum("other_{}".format(i) in bloom_filter for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_is_full():
+    bloom_filter = bloom.BloomFilter(3, 0.01)
+    for item in ("a", "b"):
+        bloom_filter.add(item)
+    assert not bloom_filter.is_full()
+    bloom_filter.add("c")
+    assert bloom_filter.is_full()
+
+
+def test_saved_bits_round_trip():
+    bloom_filter = bloom.BloomFilter(100, 0.01)
+    bloom_filter.add("abc")
+    loaded = bloom.BloomFilter(100, 0.01, bytearray(bloom_filter.bits), bloom_filter.count)
+    assert "abc" in loaded
+    assert len(loaded) == 1
+
+
+def test_bits_of_other_size_raise():
+    bits = bloom.BloomFilter(100, 0.01).bits
+    with pytest.raises(ValueError):
+        bloom.BloomFilter(1000, 0.01, bytearray(bits))
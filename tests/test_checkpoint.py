@@ -0,0 +1,103 @@
+import collections
+import checkpoint
+
+
+Submission = collections.namedtuple("Submission", "id name created_utc")
+
+
+def get_submission(number):
+    return Submission("s{}".format(number), "t3_s{}".format(number), 1000.0 + number)
+
+
+class FakeSubreddit:
+    # Listing of submissions ordered newest -> oldest like subreddit.new()
+
+    def __init__(self, submissions, before_works=True):
+        self.submissions = sorted(submissions, key=lambda submission: -submission.created_utc)
+        self.before_works = before_works
+        self.requests = []
+
+    def new(self, limit=None, params=None):
+        self.requests.append((limit, dict(params or {})))
+        if params and "before" in params:
+            if not self.before_works:
+                return []
+            names = [submission.name for submission in self.submissions]
+            if params["before"] not in names:
+                return []
+            newer = self.submissions[:names.index(params["before"])]
+            return newer[-limit:]
+        return iter(self.submissions[:limit])
+
+
+class FakeReddit:
+
+    def __init__(self, subreddit):
+        self.fake_subreddit = subreddit
+        self.names = []
+
+    def subreddit(self, name):
+        self.names.append(name)
+        return self.fake_subreddit
+
+
+class FakeCheckpoint:
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def get_cursor(self):
+        return self.cursor
+
+
+def get_cursor(submission):
+    return (submission.name, submission.created_utc)
+
+
+def test_no_checkpoint_returns_nothing():
+    subreddit = FakeSubreddit([get_submission(number) for number in range(5)])
+    assert checkpoint.get_missed_submissions(FakeReddit(subreddit), FakeCheckpoint(None), "test") == []
+    assert subreddit.requests == []
+
+
+def test_before_cursor_pages_oldest_to_newest():
+    submissions = [get_submission(number) for number in range(250)]
+    subreddit = FakeSubreddit(submissions)
+    reddit = FakeReddit(subreddit)
+    missed = checkpoint.get_missed_submissions(reddit, FakeCheckpoint(get_cursor(submissions[9])), "test")
+    assert missed == submissions[10:]
+    assert reddit.names == ["test"]
+    # Each page continues before the newest submission of the previous page
+    assert [params["before"] for limit, params in subreddit.requests] == ["t3_s9", "t3_s109", "t3_s209"]
+    assert all(limit == checkpoint.PAGE_SIZE for limit, params in subreddit.requests)
+
+
+def test_full_last_page_asks_for_more():
+    submissions = [get_submission(number) for number in range(101)]
+    subreddit = FakeSubreddit(submissions)
+    missed = checkpoint.get_missed_submissions(FakeReddit(subreddit), FakeCheckpoint(get_cursor(submissions[0])), "test")
+    assert missed == submissions[1:]
+    assert len(subreddit.requests) == 2
+
+
+def test_nothing_missed():
+    submissions = [get_submission(number) for number in range(5)]
+    subreddit = FakeSubreddit(submissions)
+    assert checkpoint.get_missed_submissions(FakeReddit(subreddit), FakeCheckpoint(get_cursor(submissions[4])), "test") == []
+
+
+def test_deleted_checkpoint_falls_back_to_created_utc():
+    submissions = [get_submission(number) for number in range(20)]
+    # Checkpoint submission was deleted so the before listing is empty
+    deleted = Submission("gone", "t3_gone", 1012.5)
+    subreddit = FakeSubreddit(submissions)
+    missed = checkpoint.get_missed_submissions(FakeReddit(subreddit), FakeCheckpoint(get_cursor(deleted)), "test")
+    assert missed == submissions[13:]
+    assert subreddit.requests[-1] == (None, {})
+
+
+def test_fallback_when_before_listing_is_empty():
+    submissions = [get_submission(number) for number in range(20)]
+    subreddit = FakeSubreddit(submissions, before_works=False)
+    missed = checkpoint.get_missed_submissions(FakeReddit(subreddit), FakeCheckpoint(get_cursor(submissions[15])), "test")
+    assert missed == submissions[16:]
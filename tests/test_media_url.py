@@ -0,0 +1,80 @@
+import pytest
+import media_url
+
+
+VIDEO = media_url.MediaKey("youtube", "video", "dQw4w9WgXcQ")
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "http://youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&list=RDAMVM",
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=abcdef&t=10",
+    "youtu.be/dQw4w9WgXcQ",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ?autoplay=1",
+    "https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ",
+    "https://www.youtube.com/live/dQw4w9WgXcQ",
+    "  https://WWW.YouTube.com/watch?v=dQw4w9WgXcQ  ",
+])
+def test_youtube_video_forms(url):
+    assert media_url.get_media_key(url) == VIDEO
+
+
+def test_youtube_playlist():
+    assert media_url.get_media_key("https://www.youtube.com/playlist?list=PL12345&si=x") == \
+        media_url.MediaKey("youtube", "playlist", "PL12345")
+
+
+@pytest.mark.parametrize("url", [
+    "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC",
+    "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC?si=1a2b3c4d",
+    "https://open.spotify.com/intl-de/track/4uLU6hMCjMI75M1A2tKUQC",
+    "https://open.spotify.com/intl-pt-BR/track/4uLU6hMCjMI75M1A2tKUQC?si=x&context=y",
+    "https://play.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC",
+    "spotify:track:4uLU6hMCjMI75M1A2tKUQC",
+])
+def test_spotify_track_forms(url):
+    assert media_url.get_media_key(url) == media_url.MediaKey("spotify", "track", "4uLU6hMCjMI75M1A2tKUQC")
+
+
+def test_spotify_album_is_not_a_track():
+    assert media_url.get_media_key("spotify:album:4uLU6hMCjMI75M1A2tKUQC") == \
+        media_url.MediaKey("spotify", "album", "4uLU6hMCjMI75M1A2tKUQC")
+
+
+@pytest.mark.parametrize("url, key", [
+    ("https://haken.bandcamp.com/track/nil-by-mouth", ("bandcamp", "track", "haken/nil-by-mouth")),
+    ("http://Haken.bandcamp.com/track/Nil-By-Mouth?from=embed", ("bandcamp", "track", "haken/nil-by-mouth")),
+    ("https://haken.bandcamp.com/album/virus/", ("bandcamp", "album", "haken/virus")),
+])
+def test_bandcamp(url, key):
+    assert media_url.get_media_key(url) == media_url.MediaKey(*key)
+
+
+@pytest.mark.parametrize("url, key", [
+    ("https://soundcloud.com/artist/song", ("soundcloud", "track", "artist/song")),
+    ("https://m.soundcloud.com/Artist/Song?in=x&utm_source=clipboard", ("soundcloud", "track", "artist/song")),
+    ("https://soundcloud.com/artist/sets/album", ("soundcloud", "set", "artist/album")),
+    ("https://on.soundcloud.com/AbCd", ("soundcloud", "short", "AbCd")),
+])
+def test_soundcloud(url, key):
+    assert media_url.get_media_key(url) == media_url.MediaKey(*key)
+
+
+def test_soundcloud_profile_pages_are_not_tracks():
+    assert media_url.get_media_key("https://soundcloud.com/artist/tracks").platform == "other"
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/page?b=2&a=1&utm_source=reddit&fbclid=123",
+    "http://www.example.com/page/?a=1&b=2&ref=share",
+])
+def test_tracking_parameters_are_stripped(url):
+    assert media_url.get_media_key(url) == media_url.MediaKey("other", "url", "example.com/page?a=1&b=2")
+
+
+def test_media_id():
+    assert media_url.get_media_id("https://youtu.be/dQw4w9WgXcQ") == "youtube:video:dQw4w9WgXcQ"
@@ -0,0 +1,29 @@
+import cache
+import metrics
+
+
+def test_cache_stats_are_rendered():
+    bot_metrics = metrics.Metrics()
+    ttl_cache = cache.TTLCache(maxsize=10, ttl=60)
+    bot_metrics.register_cache("lastfm", ttl_cache)
+    ttl_cache.put(("haken", "nil by mouth"), ["Haken - Nil By Mouth"])
+    ttl_cache.get(("haken", "nil by mouth"))
+    ttl_cache.get(("tool", "schism"))
+    ttl_cache.get(("tool", "parabol"))
+    lines = bot_metrics.render().splitlines()
+    assert "# TYPE progmetalbot_cache_hits_total counter" in lines
+    assert 'progmetalbot_cache_hits_total{cache="lastfm"} 1' in lines
+    assert 'progmetalbot_cache_misses_total{cache="lastfm"} 2' in lines
+    assert "# TYPE progmetalbot_cache_entries gauge" in lines
+    assert 'progmetalbot_cache_entries{cache="lastfm"} 1' in lines
+
+
+def test_no_caches_rendered_without_registration():
+    assert "cache_" not in metrics.Metrics().render()
+
+
+def test_shared_caches_are_registered():
+    import interface
+    import lastfm
+    assert metrics.bot_metrics.caches["lastfm"] is lastfm.track_search_cache
+    assert metrics.bot_metrics.caches["crosspost_parent"] is interface.crosspost_parent_cache
@@ -0,0 +1,92 @@
+import random
+import pytest
+import minhash
+
+
+def test_shingles_collapse_punctuation():
+    assert minhash.get_shingles("A-B", 3) == {"a b"}
+    assert minhash.get_shingles("Hello, World!", 3) == minhash.get_shingles("hello world", 3)
+
+
+def test_padded_shingles():
+    assert minhash.get_shingles("abcd", 3) == {"abc", "bcd"}
+    assert minhash.get_shingles("abcd", 3, padded=True) == {" ab", "abc", "bcd", "cd "}
+    # Padding counts a changed last letter in as many shingles as the others
+    assert minhash.get_similarity("Parabol", "Parabola", padded=True) < minhash.get_similarity("Parabol", "Parabola")
+
+
+def test_exact_jaccard():
+    assert minhash.get_jaccard({"abc", "bcd"}, {"bcd", "cde"}) == pytest.approx(1 / 3)
+    assert minhash.get_jaccard(set(), {"abc"}) == 0.0
+    assert minhash.get_similarity("Tool - Schism", "tool  schism") == 1.0
+    assert minhash.get_similarity("abcdef", "uvwxyz") == 0.0
+
+
+def test_query_returns_similarity_above_threshold():
+    lsh = minhash.MinHashLSH(threshold=0.5)
+    lsh.add("a", "haken the cockroach king")
+    lsh.add("b", "opeth ghost of perdition")
+    matches = lsh.query("haken the cockroach king!")
+    assert matches == [[1.0, "a"]]
+    assert lsh.query("haken the cockroach king", threshold=1.1) == []
+
+
+def test_remove():
+    lsh = minhash.MinHashLSH()
+    lsh.add("a", "haken the cockroach king")
+    lsh.remove("a")
+    lsh.remove("missing")
+    assert len(lsh) == 0
+    assert lsh.query("haken the cockroach king") == []
+    assert all(not table for table in lsh.tables)
+
+
+def get_variant(generator, text):
+    # Replace one letter of text
+    position = generator.randrange(len(text))
+    return text[:position] + generator.choice("abcdefghijklmnopqrstuvwxyz") + text[position + 1:]
+
+
+def test_lsh_recall_of_similar_strings():
+    generator = random.Random(7)
+    words = ["".join(generator.choice("abcdefghijklmnopqrstuvwxyz") for i in range(generator.randint(3, 8)))
+             for j in range(2000)]
+    lsh = minhash.MinHashLSH()
+    texts = {}
+    for key in range(300):
+        texts[key] = " ".join(generator.sample(words, 6))
+        lsh.add(key, texts[key])
+    found = 0
+    pairs = 0
+    for key, text in texts.items():
+        variant = get_variant(generator, text)
+        if minhash.get_similarity(text, variant) < lsh.threshold:
+            continue
+        pairs += 1
+        found += key in [match[1] for match in lsh.query(variant)]
+    assert pairs > 250
+    assert found / pairs > 0.95
+
+
+def test_query_only_compares_candidates():
+    generator = random.Random(3)
+    lsh = minhash.MinHashLSH()
+    for key in range(200):
+        lsh.add(key, "".join(generator.choice("abcdefghijklmnopqrstuvwxyz ") for i in range(30)))
+    shingles, bands = lsh.get_entry("completely different title here")
+    candidates = set()
+    for table, band in zip(lsh.tables, bands):
+        candidates.update(table.get(band, ()))
+    assert len(candidates) < 20
+
+
+def test_entry_cache_is_bounded():
+    lsh = minhash.MinHashLSH(cache_size=2)
+    for text in ("a b c", "d e f", "g h i"):
+        lsh.get_entry(text)
+    assert list(lsh.entry_cache) == ["d e f", "g h i"]
+
+
+def test_permutations_must_divide_into_bands():
+    with pytest.raises(ValueError):
+        minhash.MinHashLSH(permutations=10, bands=3)
@@ -0,0 +1,198 @@
+import time
+import types
+import pytest
+import interface
+import post_record
+import repost_index
+import rules
+
+
+# Pairs of older and newer titles of different songs by the same artist
+DIFFERENT_SONGS = [
+    ("Tool - Parabol", "Tool - Parabola"),
+    ("Dream Theater - Metropolis Pt. 1", "Dream Theater - Metropolis Pt. 2"),
+    ("Dream Theater - Metropolis Pt.1: The Miracle and the Sleeper", "Dream Theater - Metropolis Pt.2: The Miracle and the Sleeper"),
+    ("Porcupine Tree - Anesthetize", "Porcupine Tree - Anesthetize Part 2"),
+    ("Leprous - Alkaline", "Leprous - Alkaline (Live)"),
+    ("Haken - Cockroach King", "Haken - Cockroach King (Acoustic)"),
+    ("Tool - Schism", "Tool - Schism [Demo]"),
+    ("Dream Theater - Metropolis Part I", "Dream Theater - Metropolis Part II"),
+]
+
+
+def make_submission(submission_id, title, age_days, url=None):
+    return types.SimpleNamespace(id=submission_id, name="t3_" + submission_id, title=title,
+                                 created_utc=time.time() - 86400 * age_days,
+                                 url=url or "https://www.youtube.com/watch?v=" + submission_id.ljust(11, "x"))
+
+
+def make_index(*submissions):
+    posts_index = repost_index.RepostIndex()
+    for submission in submissions:
+        posts_index.add(submission)
+    return posts_index
+
+
+def evaluate_repost_index(submission, posts_index, removed=()):
+    # Runs repost_index answering its removed request with removed fullnames
+    evaluation = rules.evaluate(submission, posts_index, rule_names=["repost_index"])
+    request = next(evaluation)
+    assert request[0] == "removed"
+    with pytest.raises(StopIteration) as stop:
+        evaluation.send(list(removed))
+    return stop.value.value
+
+
+@pytest.mark.parametrize("older_title, newer_title", DIFFERENT_SONGS)
+def test_different_songs_are_not_reposts(older_title, newer_title):
+    older = make_submission("old", older_title, 10)
+    newer = make_submission("new", newer_title, 1)
+    assert make_index(older).find(newer) is None
+
+
+@pytest.mark.parametrize("older_title, newer_title", DIFFERENT_SONGS)
+def test_different_songs_are_not_title_search_matches(older_title, newer_title):
+    older = post_record.get_post_record(make_submission("old", older_title, 10))
+    newer = post_record.get_post_record(make_submission("new", newer_title, 1))
+    post_title = interface.get_title_query([newer.artist, newer.song])[0]
+    assert interface.check_title_result(newer, post_title, older) is None
+
+
+def test_same_title_is_a_repost():
+    older = make_submission("old", "Leprous - Alkaline", 10)
+    newer = make_submission("new", "Leprous - Alkaline [Official Video]", 1)
+    match = make_index(older).find(newer)
+    assert match[0] == "title" and match[1].id == "old"
+    context = evaluate_repost_index(newer, make_index(older))
+    assert context.stopped
+    assert [violation.reason for violation in context.rules_violated] == ["Repost of https://redd.it/old"]
+
+
+def test_similar_title_is_a_possible_repost():
+    older = make_submission("old", "Between the Buried and Me - Selkies: The Endless Obsession", 10)
+    newer = make_submission("new", "Between the Buried and Me - Selkies: The Endless Obsesion", 1)
+    match = make_index(older).find(newer)
+    assert match[0] == "similar" and match[1].id == "old"
+    context = evaluate_repost_index(newer, make_index(older))
+    assert not context.stopped
+    assert [violation.reason for violation in context.rules_violated] == ["Possible Repost of https://redd.it/old"]
+
+
+def test_similar_title_needs_same_artist():
+    older = make_submission("old", "Between the Buried and Me - Selkies: The Endless Obsession", 10)
+    newer = make_submission("new", "Between the Buried and You - Selkies: The Endless Obsesion", 1)
+    assert make_index(older).find(newer) is None
+
+
+def test_distinguishing_words():
+    assert interface.get_distinguishing_words("Dream Theater - Metropolis Pt.2 (Live) [1999]") == ["2", "live", "pt"]
+    assert interface.get_distinguishing_words("Symphony X - Church of the Machine (Official Video) 2015") == []
+    assert interface.get_distinguishing_words("Tool - Schism (I think this is their best song)") == []
+    assert interface.get_distinguishing_words("Tool - Schism (saw them live 2 times, this is the one)") == []
+    assert interface.get_distinguishing_words("Dream Theater - Metropolis Pt. 2 (Live at Budokan 2004)") == ["2", "live", "pt"]
+
+
+def test_comment_in_title_is_a_repost():
+    older = make_submission("old", "Tool - Schism", 10, url="https://youtu.be/aaaaaaaaaaa")
+    newer = make_submission("new", "Tool - Schism (I think this is their best song)", 1, url="https://youtu.be/bbbbbbbbbbb")
+    match = make_index(older).find(newer)
+    assert match[0] == "title" and match[1].id == "old"
+    older_record = post_record.get_post_record(older)
+    newer_record = post_record.get_post_record(newer)
+    post_title = interface.get_title_query([newer_record.artist, newer_record.song])[0]
+    assert interface.check_title_result(newer_record, post_title, older_record) == "title"
+
+
+def test_repost_matches_oldest_post():
+    oldest = make_submission("a", "Haken - Nil By Mouth", 30, url="https://youtu.be/aaaaaaaaaaa")
+    repost = make_submission("b", "Haken - Nil By Mouth", 20, url="https://youtu.be/aaaaaaaaaaa")
+    newest = make_submission("c", "Haken - Nil By Mouth", 1, url="https://youtu.be/aaaaaaaaaaa")
+    posts_index = make_index(oldest, repost, newest)
+    assert posts_index.find(newest)[1].id == "a"
+    assert posts_index.find(repost)[1].id == "a"
+    assert posts_index.find(oldest) is None
+
+
+def test_removed_post_is_not_matched():
+    oldest = make_submission("a", "Haken - Nil By Mouth", 30, url="https://youtu.be/aaaaaaaaaaa")
+    oldest.removed = True
+    repost = make_submission("b", "Haken - Nil By Mouth", 20, url="https://youtu.be/aaaaaaaaaaa")
+    newest = make_submission("c", "Haken - Nil By Mouth", 1, url="https://youtu.be/aaaaaaaaaaa")
+    assert make_index(oldest, repost).find(newest)[1].id == "b"
+    assert make_index(oldest).find(newest) is None
+
+
+def test_purge_keeps_newer_posts_of_a_key():
+    oldest = make_submission("a", "Haken - Nil By Mouth", 400, url="https://youtu.be/aaaaaaaaaaa")
+    repost = make_submission("b", "Haken - Nil By Mouth", 20, url="https://youtu.be/aaaaaaaaaaa")
+    newest = make_submission("c", "Haken - Nil By Mouth", 1, url="https://youtu.be/aaaaaaaaaaa")
+    posts_index = make_index(oldest, repost)
+    posts_index.purge()
+    assert "a" not in posts_index
+    assert posts_index.find(newest)[1].id == "b"
+
+
+def test_repost_index_refreshes_removed_state():
+    oldest = make_submission("a", "Haken - Nil By Mouth", 30, url="https://youtu.be/aaaaaaaaaaa")
+    repost = make_submission("b", "Haken - Nil By Mouth", 20, url="https://youtu.be/aaaaaaaaaaa")
+    newest = make_submission("c", "Haken - Nil By Mouth", 1, url="https://youtu.be/aaaaaaaaaaa")
+    posts_index = make_index(oldest, repost)
+    evaluation = rules.evaluate(newest, posts_index, rule_names=["repost_index"])
+    assert next(evaluation) == ("removed", ["t3_a", "t3_b"])
+    with pytest.raises(StopIteration) as stop:
+        evaluation.send(["t3_a"])
+    context = stop.value.value
+    assert context.removed_ids == ["a"]
+    assert [violation.reason for violation in context.rules_violated] == ["Repost of https://redd.it/b"]
+    # Removed state is kept, the next post does not ask again, c was indexed by its own check
+    evaluation = rules.evaluate(make_submission("d", "Haken - Nil By Mouth", 0, url="https://youtu.be/aaaaaaaaaaa"),
+                                posts_index, rule_names=["repost_index"])
+    assert next(evaluation) == ("removed", ["t3_b", "t3_c"])
+
+
+def test_removed_search_result_is_not_matched():
+    newest = post_record.get_post_record(make_submission("c", "Haken - Nil By Mouth", 1))
+    result = interface.SearchResult("a", "t3_a", newest.created_utc - 86400, newest.url, "Haken - Nil By Mouth",
+                                    "https://redd.it/a", False, True)
+    assert not interface.check_url_result(newest, newest.url, result)
+    assert interface.check_title_result(newest, "Haken -- Nil By Mouth", result) is None
+    assert interface.check_title_result(newest, "Haken -- Nil By Mouth", result._replace(removed=False)) == "title"
+
+
+def test_find_or_add_indexes_submission():
+    older = make_submission("old", "Haken - Nil By Mouth", 2, url="https://youtu.be/aaaaaaaaaaa")
+    newer = make_submission("new", "Haken - Nil By Mouth", 1, url="https://youtu.be/aaaaaaaaaaa")
+    posts_index = make_index()
+    assert posts_index.find_or_add(older) is None
+    assert "old" in posts_index
+    match = posts_index.find_or_add(newer)
+    assert match[0] == "url" and match[1].id == "old"
+
+
+def test_submissions_checked_at_the_same_time_see_each_other():
+    # Release day: the original was removed and two reposts of the new single are checked at the same time
+    original = make_submission("orig", "Haken - Nil By Mouth", 5, url="https://youtu.be/aaaaaaaaaaa")
+    first = make_submission("first", "Haken - Nil By Mouth", 0.02, url="https://youtu.be/aaaaaaaaaaa")
+    second = make_submission("second", "Haken - Nil By Mouth", 0.01, url="https://youtu.be/aaaaaaaaaaa")
+    posts_index = make_index(original)
+    evaluations = [rules.evaluate(submission, posts_index, rule_names=["repost_index"]) for submission in (first, second)]
+    # Both ask about the original before either finishes
+    assert [next(evaluation)[0] for evaluation in evaluations] == ["removed", "removed"]
+    contexts = []
+    for evaluation in evaluations:
+        with pytest.raises(StopIteration) as stop:
+            evaluation.send(["t3_orig"])
+        contexts.append(stop.value.value)
+    assert contexts[0].rules_violated == []
+    assert [violation.reason for violation in contexts[1].rules_violated] == ["Repost of https://redd.it/first"]
+
+
+def test_record_keys():
+    record = post_record.get_post_record(make_submission("a", "Tool - Fear Inoculum (Live)", 1))
+    assert [record.artist_key, record.song_key, record.title_key] == ["tool", "fear inoculum", "tool fear inoculum"]
+    stored = record.get_stored()
+    assert [stored.artist_key, stored.song_key] == ["tool", "fear inoculum"]
+    assert interface.check_similar_title(["tool", "fear innoculum"], "Tool - Fear Innoculum (Live)",
+                                         [stored.artist_key, stored.song_key], stored.title)
+    assert not interface.check_similar_title(["tool", "fear innoculum"], "Tool - Fear Innoculum",
+                                             [stored.artist_key, stored.song_key], stored.title)
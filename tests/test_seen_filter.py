@@ -0,0 +1,118 @@
+import collections
+import checkpoint
+import post_store
+
+
+Submission = collections.namedtuple("Submission", "id name created_utc")
+
+
+def get_submission(number):
+    return Submission("s{}".format(number), "t3_s{}".format(number), 1000.0 + number)
+
+
+class CountingStore(post_store.PostStore):
+    # Post store counting processed table lookups made to confirm filter hits
+
+    def __init__(self, location):
+        super().__init__(location)
+        self.lookups = 0
+
+    def is_processed(self, submission_id):
+        self.lookups += 1
+        return super().is_processed(submission_id)
+
+
+def get_filter(store, **kwargs):
+    kwargs.setdefault("capacity", 10)
+    kwargs.setdefault("error_rate", 0.01)
+    kwargs.setdefault("ring_size", 3)
+    kwargs.setdefault("save_interval", 1000)
+    return checkpoint.SeenFilter(store, **kwargs)
+
+
+def add(store, seen, number):
+    submission = get_submission(number)
+    store.add_processed(submission)
+    seen.add(submission.id)
+
+
+def test_ring_answers_recent_ids_without_lookups(tmp_path):
+    store = CountingStore(str(tmp_path / "posts.db"))
+    seen = get_filter(store)
+    for number in range(5):
+        add(store, seen, number)
+    assert list(seen.ring) == ["s2", "s3", "s4"]
+    assert "s4" in seen
+    assert store.lookups == 0
+    # Ids pushed out of the ring are confirmed in the processed table
+    assert "s0" in seen
+    assert store.lookups == 1
+    store.close()
+
+
+def test_generation_rotation(tmp_path):
+    store = post_store.PostStore(str(tmp_path / "posts.db"))
+    seen = get_filter(store, capacity=4)
+    for number in range(4):
+        add(store, seen, number)
+    assert seen.previous is None
+    add(store, seen, 4)
+    assert len(seen.previous) == 4
+    assert len(seen.current) == 1
+    for number in range(5, 9):
+        add(store, seen, number)
+    # Third generation drops the first, its ids are only found in the ring and processed table from now on
+    assert len(seen.previous) == 4
+    assert "s1" not in seen.previous and "s1" not in seen.current
+    assert "s1" not in seen
+    assert all(get_submission(number).id in seen for number in range(4, 9))
+    store.close()
+
+
+def test_false_positive_is_confirmed_in_store(tmp_path):
+    store = CountingStore(str(tmp_path / "posts.db"))
+    seen = get_filter(store, ring_size=1)
+    add(store, seen, 0)
+    add(store, seen, 1)
+    # Bloom filter claims an id the store never processed
+    seen.current.add("never")
+    assert "never" not in seen
+    assert store.lookups == 1
+    store.close()
+
+
+def test_filters_reload_from_store(tmp_path):
+    location = str(tmp_path / "posts.db")
+    store = post_store.PostStore(location)
+    seen = get_filter(store, capacity=4)
+    for number in range(6):
+        add(store, seen, number)
+    seen.save()
+    # Processed after the save, added again on load
+    store.add_processed(get_submission(6))
+    store.close()
+
+    store = post_store.PostStore(location)
+    seen = get_filter(store, capacity=4)
+    assert len(seen) == 7
+    assert list(seen.ring) == ["s4", "s5", "s6"]
+    assert all(get_submission(number).id in seen for number in range(7))
+    assert "s7" not in seen
+    store.close()
+
+
+def test_changed_capacity_discards_saved_filters(tmp_path):
+    location = str(tmp_path / "posts.db")
+    store = post_store.PostStore(location)
+    seen = get_filter(store, capacity=4)
+    for number in range(3):
+        add(store, seen, number)
+    seen.save()
+    store.close()
+
+    store = post_store.PostStore(location)
+    seen = get_filter(store, capacity=100)
+    # Filters are rebuilt from the processed table
+    assert len(seen) == 3
+    assert "s0" in seen
+    store.close()
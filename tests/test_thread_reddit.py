@@ -0,0 +1,37 @@
+import threading
+import types
+import thread_reddit
+
+
+def get_from_thread(reddit):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(thread_reddit.get_reddit(reddit)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_threads_get_their_own_instance():
+    main_reddit = object()
+    thread_reddit.set_factory(object)
+    try:
+        assert thread_reddit.get_reddit(main_reddit) is main_reddit
+        first = get_from_thread(main_reddit)
+        second = get_from_thread(main_reddit)
+        assert first is not main_reddit and second is not main_reddit and first is not second
+    finally:
+        thread_reddit.set_factory(None)
+
+
+def test_without_factory_instance_is_shared():
+    main_reddit = object()
+    assert get_from_thread(main_reddit) is main_reddit
+
+
+def test_submission_is_rebound_to_thread_instance():
+    main_reddit = object()
+    worker_reddit = types.SimpleNamespace(submission=lambda id: types.SimpleNamespace(id=id, _reddit=worker_reddit))
+    submission = types.SimpleNamespace(id="a1", _reddit=main_reddit)
+    assert thread_reddit.get_submission(main_reddit, submission) is submission
+    rebound = thread_reddit.get_submission(worker_reddit, submission)
+    assert rebound.id == "a1" and rebound._reddit is worker_reddit
@@ -0,0 +1,100 @@
+import time
+import pytest
+import title_parser
+
+
+# Titles both the patterns and split_title parse the same way
+NORMAL_TITLES = [
+    "Leprous - From The Flame",
+    "Haken - Cockroach King (Official Video)",
+    "Periphery - Reptile [2019]",
+    "Tesseract — Juno",
+    "Tesseract – Juno",
+    "Tool - Forty-Six & 2",
+    "Dream Theater - Pull Me Under (Live)",
+    "Caligula's Horse \"Graves\"",
+    "Caligula's Horse - “Graves”",
+    "Between the Buried and Me -- Fix the Error",
+]
+# Post titles with a leading tag, which only POST_TITLE_PATTERN leaves out of artist
+TAGGED_TITLES = [
+    "[Prog Metal] Leprous - From The Flame",
+    "[OC] My band Nuclear Ghost - Dreamsea (FFO Haken, Leprous)",
+    "(Self-promo) Starcrawler - Spheres",
+    "Opeth - Ghost of Perdition | Full Album",
+    "The Ocean - Holocene // new album out now",
+]
+# Long post titles with a leading tag and comments, the regex is fast on them and split_title splits them differently
+LONG_TAGGED_TITLES = [
+    ("(Instrumental) Plini-Handmade Cities [Full Album Stream] - from the record of the same name, released in 2016 on his own label",
+     ("Plini", "Handmade Cities")),
+    ("[OC] My band Skyharbor-Evolution (playthrough) \u2014 new single from our upcoming record, out this Friday on all platforms",
+     ("My band Skyharbor", "Evolution")),
+    ("[Self-Promo] Nuclear Ghost - Dreamsea (FFO: Haken, Leprous, Caligula's Horse) - we're a 4-piece from Toronto and this is "
+     "our debut single, would love feedback! Bandcamp/Spotify links in comments", ("Nuclear Ghost", "Dreamsea")),
+    ("[Technical Death Metal] Obscura - Diluvium (Official Video) | from the new album \"Diluvium\" out July 13th via Relapse "
+     "Records [2018] - FFO Beyond Creation, Archspire, Necrophagist", ("Obscura", "Diluvium")),
+    ("[Progressive Metal] Haken - Messiah Complex I: Ivory Tower (Official Audio) from the album \"Vector\", out October 26th on "
+     "InsideOut Music. Pre-order now, for fans of Leprous, Caligula's Horse and Between the Buried and Me. Seeing them in "
+     "London next month, who else is going?", ("Haken", "Messiah Complex I")),
+]
+ADVERSARIAL_TITLES = ["|" * 300, "| " * 150, "|" * 1000, "{}" * 500, "[" + " -" * 500, "a -" * 334, "| , " * 75,
+                      "[a]" + "| , " * 75, "[abc def] " + "| |, " * 60]
+
+
+def parse_regex(pattern, title):
+    match = pattern.search(title)
+    if match is None:
+        return (title, None)
+    return (title_parser.get_unicode_normalized(match.group(1)), title_parser.get_unicode_normalized(match.group(2)))
+
+
+def timed_parse(title):
+    start = time.perf_counter()
+    title_parser.parse_title(title_parser.POST_TITLE_PATTERN, title, strip_tag=True)
+    title_parser.parse_title(title_parser.LINK_TITLE_PATTERN, title)
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize("title", NORMAL_TITLES)
+def test_split_title_agrees_with_link_pattern(title):
+    assert title_parser.split_title(title)[:2] == parse_regex(title_parser.LINK_TITLE_PATTERN, title)
+
+
+@pytest.mark.parametrize("title", NORMAL_TITLES + TAGGED_TITLES)
+def test_split_title_agrees_with_post_pattern(title):
+    assert title_parser.split_title(title, strip_tag=True)[:2] == parse_regex(title_parser.POST_TITLE_PATTERN, title)
+
+
+@pytest.mark.parametrize("title", NORMAL_TITLES + TAGGED_TITLES + [title for title, parsed in LONG_TAGGED_TITLES])
+def test_normal_titles_are_under_budget(title):
+    assert title_parser.get_regex_cost(title) <= title_parser.REGEX_BUDGET
+    assert title_parser.get_regex_cost(title, strip_tag=True) <= title_parser.REGEX_BUDGET
+
+
+@pytest.mark.parametrize("title, parsed", LONG_TAGGED_TITLES)
+def test_long_tagged_titles_are_parsed_by_regex(title, parsed):
+    assert parse_regex(title_parser.POST_TITLE_PATTERN, title) == parsed
+    assert title_parser.parse_post_title(title)[:2] == parsed
+
+
+@pytest.mark.parametrize("title", ADVERSARIAL_TITLES)
+def test_adversarial_titles_are_over_budget(title):
+    title = title[:title_parser.MAX_TITLE_LENGTH]
+    assert title_parser.get_regex_cost(title) > title_parser.REGEX_BUDGET
+    assert title_parser.get_regex_cost(title, strip_tag=True) > title_parser.REGEX_BUDGET
+
+
+@pytest.mark.parametrize("title", ADVERSARIAL_TITLES)
+def test_adversarial_titles_parse_fast(title):
+    seconds = min(timed_parse(title) for _ in range(3))
+    # About 1 ms is expected, the limit leaves room for slow test machines
+    assert seconds < 0.02
+
+
+def test_split_title_without_separator():
+    assert title_parser.split_title("Just some words") == ("Just some words", None, None)
+
+
+def test_split_title_extras():
+    assert title_parser.split_title("Haken - Nil By Mouth [Official Video]") == ("Haken", "Nil By Mouth", "[Official Video]")
@@ -0,0 +1,103 @@
+import json
+import time
+import threading
+import http.server
+import urllib.parse
+import pytest
+import settings
+import youtube
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    # videos.list stub, videos with ids starting with "missing" are not found
+
+    def do_GET(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        video_ids = params['id'][0].split(",")
+        self.server.requests.append(video_ids)
+        items = [{"id": video_id, "snippet": {"title": "Video " + video_id, "channelTitle": "Channel",
+                                              "description": "Provided to YouTube by Label\n\nSong {} · Artist\n".format(video_id)}}
+                 for video_id in video_ids if not video_id.startswith("missing")]
+        body = json.dumps({"items": items}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_resolver(stub_server, monkeypatch):
+    monkeypatch.setattr(settings, "YOUTUBE_CACHE_LOCATION", None)
+    resolvers = []
+
+    def make(batch_wait=0.2):
+        resolver = youtube.YouTubeResolver("key", api_url="http://127.0.0.1:{}".format(stub_server.server_address[1]),
+                                           batch_wait=batch_wait)
+        resolvers.append(resolver)
+        return resolver
+    yield make
+    for resolver in resolvers:
+        resolver.close()
+
+
+def test_lone_lookup_is_sent_at_once(make_resolver, stub_server):
+    resolver = make_resolver(batch_wait=5)
+    start = time.perf_counter()
+    metadata = resolver.get_video("v1")
+    assert time.perf_counter() - start < 2
+    assert metadata == {"title": "Video v1", "channel": "Channel", "artist": "Artist", "song": "Song v1"}
+    assert stub_server.requests == [["v1"]]
+
+
+def test_concurrent_lookups_share_a_request(make_resolver, stub_server):
+    resolver = make_resolver()
+    video_ids = ["v{}".format(number) for number in range(20)]
+    barrier = threading.Barrier(len(video_ids))
+    results = {}
+
+    def lookup(video_id):
+        barrier.wait()
+        results[video_id] = resolver.get_video(video_id)
+    threads = [threading.Thread(target=lookup, args=(video_id,)) for video_id in video_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {video_id: metadata["song"] for video_id, metadata in results.items()} == {video_id: "Song " + video_id for video_id in video_ids}
+    # The first lookup may go alone before the others arrive, the rest wait for one batch
+    assert len(stub_server.requests) <= 3
+    assert sorted(video_id for request in stub_server.requests for video_id in request) == sorted(video_ids)
+
+
+def test_lookups_are_cached(make_resolver, stub_server):
+    resolver = make_resolver()
+    first = resolver.get_video("v1")
+    assert resolver.get_video("v1") == first
+    assert resolver.get_video("missing1") == {}
+    assert resolver.get_video("missing1") == {}
+    assert stub_server.requests == [["v1"], ["missing1"]]
+
+
+def test_get_videos_splits_50_ids_per_request(make_resolver, stub_server):
+    resolver = make_resolver()
+    video_ids = ["v{}".format(number) for number in range(120)]
+    results = resolver.get_videos(video_ids + video_ids[:10])
+    assert [len(request) for request in stub_server.requests] == [50, 50, 20]
+    assert len(results) == 120
+    resolver.get_videos(video_ids)
+    assert len(stub_server.requests) == 3
@@ -0,0 +1,33 @@
+import threading
+
+
+# PRAW instances are not thread safe, so every thread that talks to reddit besides the main thread
+# gets its own praw.Reddit built by the factory main.py sets
+# Without a factory (replay stubs, single-threaded tools) the passed instance is used as is
+
+reddit_factory = None
+thread_local = threading.local()
+
+
+def set_factory(factory):
+    # factory returns a new praw.Reddit logged in as the bot
+    global reddit_factory
+    reddit_factory = factory
+
+
+def get_reddit(reddit):
+    # Returns the praw.Reddit this thread should use in place of reddit
+    if reddit_factory is None or threading.current_thread() is threading.main_thread():
+        return reddit
+    thread_reddit = getattr(thread_local, "reddit", None)
+    if thread_reddit is None:
+        thread_reddit = thread_local.reddit = reddit_factory()
+    return thread_reddit
+
+
+def get_submission(reddit, submission):
+    # Returns submission bound to reddit, a lazy copy if it came from another thread's instance
+    # Reports and unhides only need the fullname, so the copy is never fetched
+    if getattr(submission, "_reddit", reddit) is reddit:
+        return submission
+    return reddit.submission(id=submission.id)
@@ -0,0 +1,52 @@
+import time
+import contextlib
+import collections
+
+
+class StageTimer:
+    # Collects wall time samples for named stages
+    # with timer.time("stage"): ... records one sample
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self.counts = collections.Counter()
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - start)
+
+    def count(self, name, label):
+        self.counts[(name, label)] += 1
+
+    def percentile(self, stage, percent):
+        # Nearest-rank percentile of stage samples in seconds
+        samples = sorted(self.samples[stage])
+        if not samples:
+            return 0.0
+        rank = max(0, min(len(samples) - 1, int(round(percent / 100.0 * len(samples) + 0.5)) - 1))
+        return samples[rank]
+
+    def summary(self):
+        # Returns list of [stage, count, p50, p95, p99] with times in milliseconds
+        rows = []
+        for stage in sorted(self.samples):
+            rows.append([stage, len(self.samples[stage])] + [1000 * self.percentile(stage, percent) for percent in (50, 95, 99)])
+        return rows
+
+
+class NullTimer:
+    # Timer that records nothing
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        yield
+
+    def count(self, name, label):
+        pass
+
+
+null_timer = NullTimer()
@@ -0,0 +1,125 @@
+import re
+import functools
+import unicodedata
+import collections
+
+
+# Parsed 'Artist' and 'Song' of a title, extras is any leftover text like "[Official Video]"
+# song is None if the title didn't match, then artist is the whole title
+ParsedTitle = collections.namedtuple("ParsedTitle", ["artist", "song", "extras"])
+
+# REGEX OVERLOAD INCOMING
+# Use regex string in ' ' on regexr.com and check out all the titles it catches!
+# group(1) is 'Artist' and group(2) is 'Song'
+POST_TITLE_PATTERN = re.compile(r'(?iu)(?:(?:^[()[\]{}|].*?[()[\]{}|][\s|\W]*)|(?:^))([^([]*\S-\S[^([]*|[^([]*?)\s?(?:-{1,2}|\u2014|\u2013|\s(?=[“"”]))\s?(?:[“"”]|)([^“"”]*?)\s?(?:\/\/.*|\\\\.*|\|\|.*|\|.*\||[“"”].*|\s(?:[([{]).*[^)\]}]$|(?:[-([|;“"”]|:\s).*?(?:favorite|audio|video|full|tour|live|premiere?|released|cover|version|music|album|drum|guitar|bass|vox|vocal|voice|playthrough|ffo|for fans of|official|new|metal|prog|recommend|[0-9]{4}).*|$|\n)')
+# YouTube video title uploaded by label or user
+LINK_TITLE_PATTERN = re.compile(r'(?iu)^(.*\S-\S.*|.+?)\s?(?:-{1,2}|\u2014|\u2013|\s(?=["“”]))\s?(?:["“”]|)(\(?[^“"”]*?)\s?(?:["“”].*|\s(?:\(|\[|{).*[^)]$|[-(["“”].*?(?:full|audio|video|instrumental|review|album|official|premiere?|lyric|playthrough|single|cover|version|live|music|[0-9]{4}).*|$|\n)')
+# Auto-generated YouTube channel "Artist - Topic"
+TOPIC_PATTERN = re.compile('(.*) - Topic')
+SPOTIFY_DESCRIPTION_PATTERN = re.compile('(.*), a song by (.*) on Spotify')
+BANDCAMP_TITLE_PATTERN = re.compile('(.*), by (.*)')
+# Description of auto-generated YouTube Music upload: "Provided to YouTube by Label\n\nSong · Artist · Artist\n"
+YOUTUBE_DESCRIPTION_PATTERN = re.compile(r'Provided to YouTube by [^\n]*\n+([^\n]+?) \u00b7 ([^\n]+?)(?: \u00b7 [^\n]*)?\n')
+# last.fm track search result "Artist - Song"
+LASTFM_RESULT_PATTERN = re.compile(r'(?iu)^(.*?)\s-\s(.*$)')
+
+# Size of parse caches, the same title is parsed several times per submission
+PARSE_CACHE_SIZE = 1024
+
+# Backtracking of POST_TITLE_PATTERN and LINK_TITLE_PATTERN grows with title length times the square of the
+# characters a separator, bracket or song ending can start at, each a possible split to retry
+# A leading bracket of a post title also retries every later bracket as the end of the tag, but only if the
+# text after the first tag has no separator before a "(" or "[", otherwise the first tag end matches
+# Titles costing more than REGEX_BUDGET (under 2 ms worst case measured) are split by split_title, which is linear
+BACKTRACK_PATTERN = re.compile(r'[-\u2014\u2013“"”()[\]{}|/\\;:]')
+BRACKETS = '()[]{}|'
+BRACKET_PATTERN = re.compile(r'[()[\]{}|]')
+TAG_REST_PATTERN = re.compile(r'[^([]*?(?:-|\u2014|\u2013|\s(?=[“"”]))')
+REGEX_BUDGET = 40000
+# Reddit titles are at most 300 characters and YouTube titles 100, longer text is cut before parsing
+MAX_TITLE_LENGTH = 1000
+# split_title splits on the first spaced dash, em/en dash or space before a quote
+# song ends at the first bracket, quote, bar or "//", a leading "[Tag]" of post titles is left out of artist
+# None of the patterns have nested or adjacent quantifiers that can match the same text, so a search is linear
+SPLIT_SEPARATOR_PATTERN = re.compile(r'\s(?:-{1,2})\s|\u2014|\u2013|\s(?=[“"”])')
+SPLIT_END_PATTERN = re.compile(r'[([{|“"”]|//')
+SPLIT_TAG_PATTERN = re.compile(r'^[()[\]{}|][^()[\]{}|]*[()[\]{}|][\s\W]*')
+QUOTES = '“"”'
+# Bracketed text of a title, "(Live)", "[Demo]" or a comment, an unclosed bracket runs to the end
+BRACKETED_PATTERN = re.compile(r'[([{]([^)\]}]*)[)\]}]?')
+
+
+def get_unicode_normalized(word):
+    try:
+        word.encode('utf-8', 'ignore').decode('ascii')
+    except UnicodeDecodeError:
+        normalized = unicodedata.normalize('NFD', word)
+        new_word = u"".join([c for c in normalized if not unicodedata.combining(c)])
+        return new_word
+    else:
+        return word
+
+
+def get_extras(title, match):
+    # Returns text outside of artist and song groups
+    extras = (title[:match.start(1)] + " " + title[match.end(2):]).strip()
+    if not extras:
+        return None
+    return extras
+
+
+def get_regex_cost(title, strip_tag=False):
+    splits = len(BACKTRACK_PATTERN.findall(title)) + 1
+    if strip_tag and title and title[0] in BRACKETS:
+        tag = SPLIT_TAG_PATTERN.match(title)
+        if tag is None or TAG_REST_PATTERN.match(title, tag.end()) is None:
+            return len(title) * splits * (splits + 2 * len(BRACKET_PATTERN.findall(title)))
+    return len(title) * splits * splits
+
+
+def split_title(title, strip_tag=False):
+    # Linear time parse used for titles over the regex budget, agrees with the patterns on common titles
+    # strip_tag leaves a leading "[Tag]" out of artist like POST_TITLE_PATTERN
+    start = 0
+    if strip_tag:
+        tag = SPLIT_TAG_PATTERN.match(title)
+        if tag is not None:
+            start = tag.end()
+    separator = SPLIT_SEPARATOR_PATTERN.search(title, start)
+    if separator is None:
+        return ParsedTitle(get_unicode_normalized(title), None, None)
+    artist = title[start:separator.start()].strip()
+    rest = title[separator.end():].lstrip()
+    if rest and rest[0] in QUOTES:
+        rest = rest[1:]
+    end = SPLIT_END_PATTERN.search(rest)
+    song = (rest if end is None else rest[:end.start()]).strip()
+    if not artist or not song:
+        return ParsedTitle(get_unicode_normalized(title), None, None)
+    extras = None if end is None else rest[end.start():].strip() or None
+    return ParsedTitle(get_unicode_normalized(artist), get_unicode_normalized(song), extras)
+
+
+def parse_title(pattern, title, strip_tag=False):
+    # Uncached parse of title with pattern, titles over REGEX_BUDGET are parsed by split_title
+    title = title[:MAX_TITLE_LENGTH]
+    if get_regex_cost(title, strip_tag) > REGEX_BUDGET:
+        return split_title(title, strip_tag)
+    match = pattern.search(title)
+    if match is None:
+        return ParsedTitle(get_unicode_normalized(title), None, None)
+    return ParsedTitle(get_unicode_normalized(match.group(1)),
+                       get_unicode_normalized(match.group(2)),
+                       get_extras(title, match))
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_post_title(title):
+    # Returns ParsedTitle of reddit submission title
+    return parse_title(POST_TITLE_PATTERN, title, strip_tag=True)
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_link_title(title):
+    # Returns ParsedTitle of YouTube video title
+    return parse_title(LINK_TITLE_PATTERN, title)
@@ -0,0 +1,179 @@
+import os
+import logging
+import threading
+import concurrent.futures
+import requests
+import settings
+import cache
+import metrics
+import title_parser
+
+
+log = logging.getLogger("bot")
+
+YOUTUBE_API_URL = "https://www.googleapis.com"
+# videos.list accepts at most 50 ids per request
+MAX_BATCH_SIZE = 50
+
+
+def get_video_metadata(item):
+    # Compact metadata of a videos.list item
+    # artist and song come from the description of auto-generated "Artist - Topic" uploads, None otherwise
+    snippet = item.get('snippet', {})
+    metadata = {"title": snippet.get('title'), "channel": snippet.get('channelTitle'), "artist": None, "song": None}
+    description = title_parser.YOUTUBE_DESCRIPTION_PATTERN.search(snippet.get('description', "") + "\n")
+    if description is not None:
+        metadata["song"] = description.group(1).strip()
+        metadata["artist"] = description.group(2).strip()
+    return metadata
+
+
+class YouTubeResolver:
+    # YouTube Data API video metadata by video id
+    # Results are cached with a TTL, videos not found are cached as an empty dict
+    # get_videos() fetches cache misses 50 ids per request
+    # get_video() sends a lone lookup at once, while other lookups are waiting it waits up to batch_wait seconds
+    # so lookups from other threads share one request
+    # api_url can point to a local stub server for testing
+
+    def __init__(self, api_key, api_url=YOUTUBE_API_URL, batch_wait=settings.YOUTUBE_BATCH_WAIT, session=None):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip("/")
+        self.batch_wait = batch_wait
+        self.session = session if session is not None else requests.Session()
+        self.session.headers.update({'Accept': 'application/json'})
+        self.videos = cache.TTLCache(maxsize=settings.YOUTUBE_CACHE_SIZE, ttl=settings.YOUTUBE_CACHE_TTL,
+                                     location=settings.YOUTUBE_CACHE_LOCATION)
+        self.lock = threading.Lock()
+        # video id -> future of lookups waiting for the next batch
+        self.pending = {}
+        self.flush_timer = None
+        # Threads waiting in get_video
+        self.waiting = 0
+
+    def close(self):
+        self.flush()
+        self.session.close()
+
+    def save_cache(self):
+        try:
+            self.videos.save()
+        except OSError as e:
+            log.error("Exception in saving YouTube cache: %s", e)
+
+    def request_videos(self, video_ids):
+        # One videos.list request, returns video id -> metadata with {} for videos not found
+        with metrics.bot_metrics.api_call("youtube"):
+            r = self.session.get(self.api_url + "/youtube/v3/videos",
+                                 params={'part': 'snippet', 'id': ",".join(video_ids), 'key': self.api_key,
+                                         'maxResults': MAX_BATCH_SIZE})
+            r.raise_for_status()
+            rJson = r.json()
+        results = {video_id: {} for video_id in video_ids}
+        for item in rJson.get('items', []):
+            results[item['id']] = get_video_metadata(item)
+        for video_id, metadata in results.items():
+            self.videos.put(video_id, metadata)
+        return results
+
+    def get_videos(self, video_ids):
+        # Returns video id -> metadata for all video_ids, fetching cache misses in batches of 50
+        results = {}
+        misses = []
+        for video_id in dict.fromkeys(video_ids):
+            metadata = self.videos.get(video_id)
+            if metadata is None:
+                misses.append(video_id)
+            else:
+                results[video_id] = metadata
+        for i in range(0, len(misses), MAX_BATCH_SIZE):
+            results.update(self.request_videos(misses[i:i + MAX_BATCH_SIZE]))
+        return results
+
+    def get_video(self, video_id):
+        # Returns metadata of one video, {} if not found, None if request failed
+        metadata = self.videos.get(video_id)
+        if metadata is not None:
+            return metadata
+        with self.lock:
+            self.waiting += 1
+            future = self.pending.get(video_id)
+            flush_now = False
+            if future is None:
+                future = self.pending[video_id] = concurrent.futures.Future()
+                # Nothing else waiting, no reason to hold the lookup for a batch
+                if len(self.pending) >= MAX_BATCH_SIZE or self.waiting == 1:
+                    flush_now = True
+                elif self.flush_timer is None:
+                    self.flush_timer = threading.Timer(self.batch_wait, self.flush)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+        try:
+            if flush_now:
+                self.flush()
+            return future.result()
+        except Exception as e:
+            log.error("Exception in YouTube lookup of {}: {}".format(video_id, e))
+            return None
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def flush(self):
+        # Send one request for all pending lookups
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+        if not pending:
+            return
+        try:
+            results = self.request_videos(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                future.set_exception(e)
+            return
+        for video_id, future in pending.items():
+            future.set_result(results.get(video_id, {}))
+
+
+youtube_resolver = None
+youtube_resolver_lock = threading.Lock()
+
+
+def get_youtube_resolver():
+    # Returns shared YouTubeResolver, None if YOUTUBE_API_KEY is not set
+    # YOUTUBE_API_URL environment variable can point to a stub server
+    global youtube_resolver
+    with youtube_resolver_lock:
+        if youtube_resolver is None and os.environ.get('YOUTUBE_API_KEY'):
+            youtube_resolver = YouTubeResolver(os.environ['YOUTUBE_API_KEY'],
+                                               api_url=os.environ.get('YOUTUBE_API_URL', YOUTUBE_API_URL))
+            metrics.bot_metrics.register_cache("youtube", youtube_resolver.videos)
+    return youtube_resolver
+
+
+def get_video(video_id):
+    # Returns metadata of one video, None if resolver is disabled or request failed
+    resolver = get_youtube_resolver()
+    if resolver is None:
+        return None
+    return resolver.get_video(video_id)
+
+
+def prefetch_videos(video_ids):
+    # Fill the cache for many videos in batch requests
+    resolver = get_youtube_resolver()
+    if resolver is None or not video_ids:
+        return
+    try:
+        resolver.get_videos(video_ids)
+    except Exception as e:
+        log.error("Exception in YouTube prefetch: %s", e)
+
+
+def save_cache():
+    if youtube_resolver is not None:
+        youtube_resolver.save_cache()